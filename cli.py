@@ -0,0 +1,425 @@
+import argparse
+import sys
+from database.db_connection import DatabaseConnection
+from create_database import upgrade_database
+
+def cmd_export_delta(args):
+    from database.delta_export import DeltaExporter
+    
+    exporter = DeltaExporter(args.consumer)
+    if args.reset is not None:
+        exporter.set_checkpoint(args.reset)
+        print(f"Контрольная точка '{args.consumer}' установлена на {args.reset}")
+        return 0
+    
+    result = exporter.export(args.format, args.dir)
+    if result is None:
+        print('Новых изменений нет')
+        return 0
+    
+    files, count, last_seq = result
+    for path in files:
+        print(path)
+    print(f'Выгружено строк: {count}, контрольная точка: {last_seq}')
+    return 0
+
+def cmd_archive(args):
+    from database.archive import get_archive_manager
+    
+    archive = get_archive_manager()
+    if args.year:
+        moved = archive.archive_year(args.year)
+        print(f'Перенесено записей: {moved} -> {archive.archive_path(args.year)}')
+        return 0
+    
+    print('Архивные годы:', ', '.join(map(str, archive.archived_years())) or 'нет')
+    for row in archive.live_years():
+        print(f"{row['year']}: {row['rows']} записей в рабочей базе")
+    return 0
+
+def cmd_backup(args):
+    from database.backup import BackupService, SAFETY_PREFIX
+    
+    service = BackupService(backup_dir=args.dir, keep=args.keep)
+    if args.list:
+        for path in service.list_backups() + service.list_backups(SAFETY_PREFIX):
+            print(f'{path}  {path.stat().st_size / 1024:.0f} КБ')
+        return 0
+    
+    path = service.backup(compress=not args.no_compress)
+    print(f'Резервная копия создана: {path}')
+    return 0
+
+def cmd_restore(args):
+    from database.backup import BackupService
+    
+    DatabaseConnection().close()
+    safety_copy = BackupService().restore(args.path)
+    print(f'База восстановлена из {args.path}')
+    if safety_copy:
+        print(f'Прежнее состояние сохранено в {safety_copy}')
+    return 0
+
+def cmd_maintenance(args):
+    from database.maintenance import DatabaseMaintenance
+    
+    maintenance = DatabaseMaintenance()
+    if args.incremental:
+        if maintenance.enable_incremental_vacuum():
+            print('База переведена в режим auto_vacuum=INCREMENTAL')
+    if args.journal:
+        print(f'Режим журнала базы: {maintenance.set_journal_mode(args.journal)}')
+    if args.analyze:
+        maintenance.analyze()
+        print('ANALYZE выполнен')
+    if args.vacuum:
+        print(f'Освобождено страниц: {maintenance.incremental_vacuum(args.vacuum)}')
+    if not (args.incremental or args.journal or args.analyze or args.vacuum):
+        done = maintenance.run_due()
+        print('Выполнено:', ', '.join(done) or 'ничего не требовалось')
+    
+    stats = maintenance.database_stats()
+    print(f"Размер: {stats['size_bytes'] / 1024:.0f} КБ, свободно: {stats['free_bytes'] / 1024:.0f} КБ "
+          f"({stats['fragmentation']:.1f}%), auto_vacuum={stats['auto_vacuum']}, "
+          f"journal_mode={stats['journal_mode']}")
+    for row in maintenance.table_stats():
+        size = f"{row['size_bytes'] / 1024:.0f} КБ" if row['size_bytes'] is not None else '-'
+        fill = f"{row['fill']:.0f}%" if row['fill'] is not None else '-'
+        print(f"  {row['name']:<40} {size:>10}  заполнение {fill}")
+    maintenance.optimize()
+    return 0
+
+def cmd_bench_profile(args):
+    from config import Config
+    from database.benchmark import benchmark_profile
+    
+    profiles = args.profile or list(Config.DB_PROFILES)
+    print(f'Текущий профиль: {Config.DB_PROFILE}')
+    print(f"{'Профиль':<16} {'Вставок/с':>12} {'Отчетов/с':>12}")
+    for profile in profiles:
+        result = benchmark_profile(profile, args.rows, args.runs)
+        print(f"{profile:<16} {result['inserts_per_second']:>12.0f} {result['reports_per_second']:>12.1f}")
+    return 0
+
+def cmd_analytics(args):
+    from database.analytics import get_analytics
+    
+    engine = get_analytics()
+    if not engine.available():
+        print('Аналитическое зеркало недоступно: установите пакет duckdb (pip install duckdb)')
+        return 1
+    try:
+        if args.rebuild:
+            print(f'Зеркало построено заново, журнал изменений до №{engine.rebuild()}')
+        status = engine.status()
+    finally:
+        engine.close()
+    
+    if status['applied'] is not None:
+        print(f"Применено изменений: {status['applied']}")
+    print(f"Файл: {status['path']}, журнал изменений до №{status['last_seq']}")
+    print(f"Сводка по месяцам: {status['rollup_rows']} строк за {status['rollup_seconds'] * 1000:.0f} мс")
+    return 0
+
+def cmd_cube(args):
+    from database.cube import ProductionCube
+    
+    cube = ProductionCube()
+    if args.rebuild:
+        cube.rebuild()
+        print('Куб добычи пересчитан')
+    for row in cube.query(args.date_from, args.date_to, period=args.period):
+        print(f"{row['period']:<12} {row['volume']:>14,.1f} т {row['rock_volume']:>12,.1f} т "
+              f"{row['revenue']:>16,.0f} руб  смен {row['shifts']}")
+    return 0
+
+def cmd_tariffs(args):
+    from database.tariffs import TariffService, RESOURCES
+    
+    service = TariffService()
+    if args.set:
+        resource, valid_from, price = args.set
+        service.set_tariff(resource, valid_from, float(price))
+        print(f'Тариф {resource} с {valid_from}: {float(price):.2f} руб')
+    
+    if args.reprice:
+        date_from, date_to = args.reprice
+        rows = service.reprice(date_from, date_to, args.group)
+        key = 'section_name' if args.group == 'section' else 'period'
+        for row in rows:
+            print(f"{row[key]:<20} {row['electricity_cost']:>14,.0f} {row['fuel_cost']:>14,.0f} "
+                  f"{row['total_cost']:>16,.0f} руб")
+        print(f"{'Итого':<20} {sum(row['total_cost'] for row in rows):>46,.0f} руб")
+        return 0
+    
+    for row in service.list():
+        name, unit = RESOURCES[row['resource']]
+        print(f"{name:<16} с {row['valid_from']}  {row['price']:>10.2f} руб/{unit}")
+    return 0
+
+def cmd_payroll(args):
+    from database.payroll import PayrollService
+    
+    payroll = PayrollService()
+    if args.export:
+        print(f'Расчет выгружен: {payroll.export_run(args.export)}')
+        return 0
+    if not args.date_from:
+        for run in payroll.runs():
+            print(f"№{run['run_id']:<5} {run['month_from']} - {run['month_to']}  {run['created_at']}  "
+                  f"работников {run['workers']}, {run['amount']:,.2f} руб")
+        return 0
+    
+    month_to = args.date_to or args.date_from
+    if args.save:
+        run_id = payroll.save_run(args.date_from, month_to)
+        print(f'Расчет №{run_id} сохранен: {payroll.export_run(run_id)}')
+        return 0
+    rows = payroll.calculate(args.date_from, month_to)
+    print(f"Работников: {len({row['tab_number'] for row in rows})}, "
+          f"часов: {sum(row['hours'] for row in rows):,.1f}, "
+          f"начислено: {sum(row['amount'] for row in rows):,.2f} руб")
+    return 0
+
+def cmd_kpi(args):
+    from database.kpi import KpiEngine
+    
+    engine = KpiEngine()
+    if args.rebuild:
+        engine.rebuild()
+        print('Срез показателей построен заново')
+    
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else '-'
+    
+    rows = engine.query(args.date_from, args.date_to, args.period, args.by_section)
+    print(f"{'Период':<12} {'Участок':<16} {'Добыча, т':>12} {'т/чел.-ч':>9} {'кВт·ч/т':>9} "
+          f"{'л/т':>8} {'Вскрыша':>8} {'руб/т':>9}")
+    for row in rows:
+        print(f"{row.get('period') or '':<12} {row.get('section_name') or '':<16} {row['volume']:>12,.1f} "
+              f"{fmt(row['tons_per_man_hour'], '{:.2f}'):>9} {fmt(row['kwh_per_ton'], '{:.2f}'):>9} "
+              f"{fmt(row['fuel_per_ton'], '{:.3f}'):>8} {fmt(row['stripping_ratio'], '{:.3f}'):>8} "
+              f"{fmt(row['cost_per_ton'], '{:,.2f}'):>9}")
+    return 0
+
+def cmd_forecast(args):
+    from datetime import date
+    from database.forecast import get_forecast_engine, MEASURE_NAMES
+    
+    year, month = map(int, args.month.split('-')) if args.month else (date.today().year, date.today().month)
+    as_of = date.fromisoformat(args.as_of) if args.as_of else None
+    
+    def fmt(value):
+        return f'{value:,.0f}' if value is not None else '-'
+    
+    for section in get_forecast_engine().forecast(year, month, as_of, args.sims):
+        print(f"{section['section_name']}: внесено дней {section['covered_days']}, "
+              f"осталось смен {section['remaining_shifts']}")
+        for name, values in section['measures'].items():
+            over = f"{values['over_plan'] * 100:.0f}%" if values['over_plan'] is not None else '-'
+            print(f"  {MEASURE_NAMES[name]:<22} план {fmt(values['plan']):>10} факт {fmt(values['actual']):>10} "
+                  f"по темпу {fmt(values['run_rate']):>10} прогноз {fmt(values['median']):>10} "
+                  f"[{fmt(values['low'])} - {fmt(values['high'])}] выше плана {over}")
+    return 0
+
+def cmd_anomalies(args):
+    from database.anomaly import AnomalyDetector
+    
+    detector = AnomalyDetector()
+    if args.rebuild:
+        detector.rebuild()
+        print('Статистика смен пересчитана')
+    
+    rows = detector.audit(args.date_from, args.date_to)
+    for row in rows:
+        print(f"#{row['mining_id']:<8} {row['mining_date']} смена {row['shift']} {row['section_name']:<14} "
+              f"{row['coal_mark']:<12} добыча {row['volume'] or 0:>10,.1f} (обычно {row['volume_mean']:,.1f}, "
+              f"{row['volume_deviation']:+.1f} σ) порода {row['rock_volume'] or 0:>8,.1f} "
+              f"(обычно {row['rock_volume_mean']:,.1f}, {row['rock_volume_deviation']:+.1f} σ)")
+    print(f'Необычных записей: {len(rows)}')
+    return 0
+
+def cmd_timesheet_audit(args):
+    from datetime import date
+    from config import Config
+    from database.timesheet_check import TimesheetValidator, problem_text
+    
+    month = args.month or date.today().isoformat()[:7]
+    rows = TimesheetValidator().audit(month)
+    for row in rows:
+        found = []
+        if row['shifts'] > 1 and not Config.TIMESHEET_ALLOW_DOUBLE_SHIFT:
+            found.append(problem_text('double_shift'))
+        if row['week_hours'] > Config.TIMESHEET_WEEK_HOURS:
+            found.append(problem_text('week_hours', row['week_hours']))
+        if row['foreign_shifts']:
+            found.append(problem_text('foreign_section'))
+        print(f"{row['date']} {row['tab_number']:>6} {row['full_name']:<30} {'; '.join(found)}")
+    print(f'Записей с нарушениями за {month}: {len(rows)}')
+    return 0
+
+def cmd_advise(args):
+    from database.query_advisor import QueryAdvisor
+    
+    query = args.sql if args.sql != '-' else sys.stdin.read()
+    advisor = QueryAdvisor()
+    advice = advisor.advise(query)
+    print('План запроса:')
+    for line in advice['plan']:
+        print(f'  {line}')
+    for scan in advice['scans']:
+        print(f"Полный просмотр таблицы {scan['table']}: {scan['detail']}")
+    if advice['scans'] and not advice['suggestions']:
+        print('Условий, по которым помог бы индекс, в запросе нет')
+    for suggestion in advice['suggestions']:
+        if suggestion['exists']:
+            print(f"Индекс по ({', '.join(suggestion['columns'])}) уже есть - выполните ANALYZE")
+            continue
+        state = 'проверен на копии схемы' if suggestion['verified'] else 'планировщик его не выбрал'
+        print(f"Предлагается ({state}): {suggestion['sql']}")
+        if args.what_if:
+            try:
+                result = advisor.what_if(query, suggestion['sql'])
+            except ValueError as e:
+                print(f'  {e}')
+                continue
+            print(f"  На копии базы: {result['before_ms']:.1f} мс -> {result['after_ms']:.1f} мс, "
+                  f"создание индекса {result['index_ms']:.0f} мс, строк {result['rows']}")
+    return 0
+
+def cmd_serve(args):
+    from config import Config
+    from server import ApiServer, serve
+    
+    host = args.host or Config.API_HOST
+    port = args.port or Config.API_PORT
+    try:
+        server = ApiServer(host, port)
+    except ValueError as e:
+        print(f'Сервер не запущен: {e}')
+        return 1
+    print(f'HTTP API: http://{host}:{port}/api (Ctrl+C - остановка)')
+    serve(server=server)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Служебные команды базы данных шахты')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = commands.add_parser('export-delta', help='инкрементальная выгрузка изменений')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    export_parser.add_argument('--consumer', default='accounting', help='имя получателя выгрузки')
+    export_parser.add_argument('--dir', help='каталог для файлов (по умолчанию reports)')
+    export_parser.add_argument('--reset', type=int, metavar='SEQ',
+                               help='только установить контрольную точку')
+    export_parser.set_defaults(func=cmd_export_delta)
+    
+    archive_parser = commands.add_parser('archive', help='перенос закрытого года в архив')
+    archive_parser.add_argument('--year', type=int, help='год для архивирования (без него - список)')
+    archive_parser.set_defaults(func=cmd_archive)
+    
+    backup_parser = commands.add_parser('backup', help='горячая резервная копия базы')
+    backup_parser.add_argument('--dir', help='каталог копий (по умолчанию backups)')
+    backup_parser.add_argument('--keep', type=int, help='сколько последних копий хранить')
+    backup_parser.add_argument('--no-compress', action='store_true', help='без сжатия gzip')
+    backup_parser.add_argument('--list', action='store_true', help='список имеющихся копий')
+    backup_parser.set_defaults(func=cmd_backup)
+    
+    restore_parser = commands.add_parser('restore', help='восстановление базы из копии')
+    restore_parser.add_argument('path', help='файл копии (.db или .db.gz)')
+    restore_parser.set_defaults(func=cmd_restore)
+    
+    from database.maintenance import JOURNAL_MODES
+    maintenance_parser = commands.add_parser('maintenance', help='обслуживание базы и отчет о размере')
+    maintenance_parser.add_argument('--analyze', action='store_true', help='пересобрать статистику')
+    maintenance_parser.add_argument('--vacuum', type=int, metavar='PAGES',
+                                    help='освободить до PAGES свободных страниц')
+    maintenance_parser.add_argument('--incremental', action='store_true',
+                                    help='перевести базу в auto_vacuum=INCREMENTAL')
+    maintenance_parser.add_argument('--journal', type=str.upper, choices=JOURNAL_MODES,
+                                    help='режим журнала файла базы (WAL - только если все '
+                                         'рабочие места на одном компьютере)')
+    maintenance_parser.set_defaults(func=cmd_maintenance)
+    
+    from config import Config
+    bench_parser = commands.add_parser('bench-profile', help='замер профилей производительности SQLite')
+    bench_parser.add_argument('--profile', action='append', choices=list(Config.DB_PROFILES),
+                              help='профиль для замера (можно несколько, по умолчанию все)')
+    bench_parser.add_argument('--rows', type=int, default=2000, help='число вставок по одной записи')
+    bench_parser.add_argument('--runs', type=int, default=20, help='число прогонов набора отчетов')
+    bench_parser.set_defaults(func=cmd_bench_profile)
+    
+    analytics_parser = commands.add_parser('analytics', help='обновление аналитического зеркала DuckDB')
+    analytics_parser.add_argument('--rebuild', action='store_true', help='построить зеркало заново')
+    analytics_parser.set_defaults(func=cmd_analytics)
+    
+    cube_parser = commands.add_parser('cube', help='итоги добычи из куба')
+    cube_parser.add_argument('--period', choices=['year', 'month', 'day'], default='year')
+    cube_parser.add_argument('--from', dest='date_from', help='начало периода YYYY-MM-DD')
+    cube_parser.add_argument('--to', dest='date_to', help='конец периода YYYY-MM-DD')
+    cube_parser.add_argument('--rebuild', action='store_true', help='пересчитать куб по исходным данным')
+    cube_parser.set_defaults(func=cmd_cube)
+    
+    tariffs_parser = commands.add_parser('tariffs', help='история тарифов и стоимость затрат')
+    tariffs_parser.add_argument('--set', nargs=3, metavar=('RESOURCE', 'DATE', 'PRICE'),
+                                help='тариф electricity или fuel с даты YYYY-MM-DD')
+    tariffs_parser.add_argument('--reprice', nargs=2, metavar=('FROM', 'TO'),
+                                help='стоимость затрат за период по действовавшим тарифам')
+    tariffs_parser.add_argument('--group', choices=['month', 'year', 'section'], default='month')
+    tariffs_parser.set_defaults(func=cmd_tariffs)
+    
+    payroll_parser = commands.add_parser('payroll', help='расчет заработной платы за месяцы')
+    payroll_parser.add_argument('--from', dest='date_from', help='первый месяц YYYY-MM (без него - список расчетов)')
+    payroll_parser.add_argument('--to', dest='date_to', help='последний месяц YYYY-MM')
+    payroll_parser.add_argument('--save', action='store_true', help='сохранить расчет и выгрузить в CSV')
+    payroll_parser.add_argument('--export', type=int, metavar='RUN', help='выгрузить сохраненный расчет')
+    payroll_parser.set_defaults(func=cmd_payroll)
+    
+    kpi_parser = commands.add_parser('kpi', help='показатели производительности')
+    kpi_parser.add_argument('--from', dest='date_from', default='0000-01-01', help='начало периода YYYY-MM-DD')
+    kpi_parser.add_argument('--to', dest='date_to', default='9999-12-31', help='конец периода YYYY-MM-DD')
+    kpi_parser.add_argument('--period', choices=['year', 'month', 'day'], default='month')
+    kpi_parser.add_argument('--by-section', action='store_true', help='с разбивкой по участкам')
+    kpi_parser.add_argument('--rebuild', action='store_true', help='построить срез заново')
+    kpi_parser.set_defaults(func=cmd_kpi)
+    
+    forecast_parser = commands.add_parser('forecast', help='прогноз выполнения лимитов на конец месяца')
+    forecast_parser.add_argument('--month', help='месяц YYYY-MM (по умолчанию текущий)')
+    forecast_parser.add_argument('--as-of', dest='as_of', help='дата расчета YYYY-MM-DD (по умолчанию сегодня)')
+    forecast_parser.add_argument('--sims', type=int, help='число прогонов Монте-Карло')
+    forecast_parser.set_defaults(func=cmd_forecast)
+    
+    anomalies_parser = commands.add_parser('anomalies', help='проверка записей добычи на необычные значения')
+    anomalies_parser.add_argument('--from', dest='date_from', default='0000-01-01', help='начало периода YYYY-MM-DD')
+    anomalies_parser.add_argument('--to', dest='date_to', default='9999-12-31', help='конец периода YYYY-MM-DD')
+    anomalies_parser.add_argument('--rebuild', action='store_true', help='пересчитать статистику смен')
+    anomalies_parser.set_defaults(func=cmd_anomalies)
+    
+    audit_parser = commands.add_parser('timesheet-audit', help='проверка табеля за месяц')
+    audit_parser.add_argument('--month', help='месяц YYYY-MM (по умолчанию текущий)')
+    audit_parser.set_defaults(func=cmd_timesheet_audit)
+    
+    advise_parser = commands.add_parser('advise', help='план запроса и советы по индексам')
+    advise_parser.add_argument('sql', help='текст запроса (- читать из stdin)')
+    advise_parser.add_argument('--what-if', action='store_true',
+                               help='сравнить время запроса до и после индекса на копии базы')
+    advise_parser.set_defaults(func=cmd_advise)
+    
+    serve_parser = commands.add_parser('serve', help='HTTP API для работы нескольких рабочих мест')
+    serve_parser.add_argument('--host', help=f'адрес (по умолчанию {Config.API_HOST})')
+    serve_parser.add_argument('--port', type=int, help=f'порт (по умолчанию {Config.API_PORT})')
+    serve_parser.set_defaults(func=cmd_serve)
+    
+    args = parser.parse_args(argv)
+    
+    # Служебные команды работают с файлом базы напрямую, даже если задан MINE_API_URL
+    Config.API_URL = ''
+    db = DatabaseConnection()
+    upgrade_database(db)
+    try:
+        return args.func(args)
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,6 +9,132 @@ class Config:
     BASE_DIR = Path(__file__).parent
     REPORTS_DIR = BASE_DIR / 'reports'
     HELP_FILE = BASE_DIR / 'help' / 'help.html'
+    # годовые архивы добычи, затрат и табеля
+    ARCHIVE_DIR = BASE_DIR / 'archive'
+    # резервные копии: сколько хранить и как часто отдавать базу другим пользователям
+    BACKUP_DIR = BASE_DIR / 'backups'
+    BACKUP_KEEP = 14
+    BACKUP_PAGES_PER_STEP = 256
+    BACKUP_STEP_SLEEP = 0.01
+    # обслуживание базы: период проверки, частота ANALYZE и порция очистки страниц
+    MAINTENANCE_INTERVAL_MS = 10 * 60 * 1000
+    MAINTENANCE_ANALYZE_DAYS = 7
+    MAINTENANCE_VACUUM_PAGES = 200
+    MAINTENANCE_FREE_PAGES_THRESHOLD = 100
+    # профили производительности SQLite: настройки соединения для каждой роли
+    # writer - рабочее место ввода данных, reader - отчеты и выгрузки.
+    # Режим журнала - свойство самого файла базы, общего для всех рабочих мест,
+    # поэтому в профили он не входит и меняется только явно (maintenance --journal)
+    DB_PROFILE = os.environ.get('MINE_DB_PROFILE', 'workstation')
+    DB_PROFILES = {
+        'workstation': {
+            'writer': {'synchronous': 'FULL', 'cache_size': -16000,
+                       'mmap_size': 0, 'temp_store': 'DEFAULT'},
+            'reader': {'synchronous': 'NORMAL', 'cache_size': -16000,
+                       'mmap_size': 64 * 1024 * 1024, 'temp_store': 'MEMORY'},
+        },
+        'report_server': {
+            'writer': {'synchronous': 'NORMAL', 'cache_size': -64000,
+                       'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY'},
+            'reader': {'synchronous': 'NORMAL', 'cache_size': -128000,
+                       'mmap_size': 1024 * 1024 * 1024, 'temp_store': 'MEMORY'},
+        },
+        'low_memory': {
+            'writer': {'synchronous': 'FULL', 'cache_size': -1000,
+                       'mmap_size': 0, 'temp_store': 'FILE'},
+            'reader': {'synchronous': 'FULL', 'cache_size': -1000,
+                       'mmap_size': 0, 'temp_store': 'FILE'},
+        },
+    }
+    # HTTP API: адрес сервера для клиентов (пусто - работа напрямую с файлом базы),
+    # параметры запуска сервера и общий токен доступа
+    API_URL = os.environ.get('MINE_API_URL', '')
+    API_TOKEN = os.environ.get('MINE_API_TOKEN', '')
+    API_HOST = '127.0.0.1'
+    API_PORT = 8765
+    API_READERS = 4
+    API_TIMEOUT = 30
+    # очередь записи: запросы, пришедшие в течение окна (сек), фиксируются одной
+    # транзакцией; при блокировке базы группа повторяется с нарастающей паузой.
+    # Сервер API всегда пишет через свою очередь; программа с одним пользователем
+    # пишет в своем соединении, MINE_WRITE_QUEUE=1 переводит ее запись в очередь
+    WRITE_QUEUE = os.environ.get('MINE_WRITE_QUEUE', '0') == '1'
+    WRITE_GROUP_WINDOW = 0.005
+    WRITE_GROUP_MAX = 200
+    WRITE_BUSY_TIMEOUT = 1.0
+    WRITE_BUSY_RETRIES = 8
+    WRITE_BUSY_BACKOFF = 0.02
+    # колоночное зеркало для тяжелых отчетов (нужен пакет duckdb, без него - SQLite)
+    ANALYTICS_ENABLED = os.environ.get('MINE_ANALYTICS', '1') != '0'
+    ANALYTICS_PATH = BASE_DIR / 'analytics' / 'mine.duckdb'
+    # расчет зарплаты: ставка для должностей без заведенной ставки (руб/час),
+    # надбавка за смену (вторая смена - ночная), нормальная длина смены в часах
+    # и коэффициент оплаты часов сверх нее
+    PAYROLL_DEFAULT_RATE = 1500
+    PAYROLL_SHIFT_COEFFICIENTS = {1: 1.0, 2: 1.2}
+    PAYROLL_SHIFT_HOURS = 8
+    PAYROLL_OVERTIME_COEFFICIENT = 1.5
+    # прогноз выполнения лимитов: число прогонов Монте-Карло, окно истории смен (дней),
+    # границы доверительного интервала и медиана (процентили), период проверки изменений
+    FORECAST_SIMULATIONS = 5000
+    FORECAST_HISTORY_DAYS = 90
+    FORECAST_QUANTILES = (10, 50, 90)
+    FORECAST_REFRESH_MS = 5000
+    # проверка ввода добычи: порог отклонения от среднего группы (участок, марка, смена)
+    # в стандартных отклонениях, минимум смен в группе и нижняя граница разброса
+    # как доля среднего
+    ANOMALY_THRESHOLD = 4.0
+    ANOMALY_MIN_COUNT = 10
+    ANOMALY_MIN_RELATIVE_STD = 0.05
+    # предупреждения по лимитам, проценты (предупреждение, нарушение): добыча - ниже
+    # плана на текущую дату, порода и расход ресурсов - выше лимита месяца;
+    # период опроса новых предупреждений и проверки смены даты для переоценки
+    ALERT_PRODUCTION_LEVELS = (90, 80)
+    ALERT_LIMIT_LEVELS = (100, 120)
+    ALERT_POLL_MS = 3000
+    ALERT_DATE_CHECK_MS = 60 * 1000
+    # проверка табеля: предел часов за любые 7 дней подряд и допускается ли
+    # работа в обе смены одних суток
+    TIMESHEET_WEEK_HOURS = 60
+    TIMESHEET_ALLOW_DOUBLE_SHIFT = False
+    # профилирование: замер действий окна и запросов (MINE_PROFILE=1 - с запуска),
+    # профиль функций cProfile и замер памяти tracemalloc для каждого действия,
+    # сколько действий хранить в сеансе, размер сводки и папка файлов профиля
+    PROFILE_ENABLED = os.environ.get('MINE_PROFILE', '0') != '0'
+    PROFILE_CPROFILE = os.environ.get('MINE_PROFILE_CPROFILE', '0') != '0'
+    PROFILE_TRACEMALLOC = os.environ.get('MINE_PROFILE_MEMORY', '0') != '0'
+    PROFILE_TRACEMALLOC_FRAMES = 1
+    PROFILE_MAX_SPANS = 500
+    PROFILE_TOP_FUNCTIONS = 25
+    PROFILE_DIR = BASE_DIR / 'profiles'
+    # контроль зависаний окна (MINE_LATENCY=1 - с запуска): период такта цикла
+    # событий, порог зависания и период снимков стека (мс), глубина цепочки
+    # вызовов в отчете, сколько запаздываний и зависаний хранить
+    LATENCY_MONITOR = os.environ.get('MINE_LATENCY', '0') != '0'
+    LATENCY_HEARTBEAT_MS = 50
+    LATENCY_THRESHOLD_MS = 250
+    LATENCY_SAMPLE_MS = 50
+    LATENCY_STACK_DEPTH = 12
+    LATENCY_KEEP_LAGS = 5000
+    LATENCY_KEEP_STALLS = 100
+    # консоль SQL: строк в порции вывода, предел строк до запроса продолжения,
+    # ограничение времени запроса (сек, 0 - без ограничения), шаг проверки отмены
+    # (инструкций SQLite) и можно ли включать изменение данных
+    QUERY_PAGE_SIZE = 500
+    QUERY_ROW_CAP = 5000
+    QUERY_TIMEOUT = 60
+    QUERY_PROGRESS_STEPS = 10000
+    QUERY_CONSOLE_WRITABLE = os.environ.get('MINE_QUERY_WRITABLE', '1') != '0'
+    # журнал медленных запросов: порог (мс) и сколько разных запросов хранить;
+    # советы по индексам: таблицы, полный просмотр которых считается проблемой,
+    # сколько запросов журнала разбирать и сколько раз выполнять запрос при
+    # сравнении на копии базы и предел времени такого сравнения (с)
+    SLOW_QUERY_MS = 100
+    SLOW_QUERY_KEEP = 200
+    ADVISOR_TABLES = ('mining', 'costs', 'time_sheet')
+    ADVISOR_REVIEW_LIMIT = 20
+    ADVISOR_WHATIF_RUNS = 3
+    ADVISOR_WHATIF_TIMEOUT = 120
     # создание директории при необходимости
     REPORTS_DIR.mkdir(exist_ok=True)
     APP_NAME = "Управление угольной шахтой"
@@ -12,6 +12,12 @@ def create_tables():
     
     db = DatabaseConnection()
     
+    # Режим очистки задается до создания первой таблицы; если файл
+    # уже размечен, режим применяет VACUUM
+    conn = db.get_connection()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    
     # 1. Таблица Должности
     db.execute_query("""
     CREATE TABLE positions (
@@ -123,6 +129,9 @@ def create_tables():
     
     print("Все таблицы успешно созданы!")
     
+    # Служебные таблицы и триггеры
+    upgrade_database(db)
+    
     # Добавляем тестовые данные
     add_test_data(db)
     
@@ -131,6 +140,35 @@ def create_tables():
     print(f"   Файл: {db_path.absolute()}")
     print("\nТеперь вы можете запустить приложение: python main.py")
 
+def upgrade_database(db):
+    """Создание недостающих служебных таблиц и триггеров в существующей базе"""
+    from database import change_log, delta_export, archive, maintenance, cube, tariffs, coal_prices, payroll, kpi, anomaly, alerts, timesheet_check
+    
+    # Журнал изменений (аудит и выборка изменений по номеру)
+    change_log.ensure_schema(db)
+    # Контрольные точки инкрементальной выгрузки
+    delta_export.ensure_schema(db)
+    # Реестр годовых архивов
+    archive.ensure_schema(db)
+    # Журнал обслуживания базы
+    maintenance.ensure_schema(db)
+    # История цен угля (до куба: его триггеры ссылаются на нее)
+    coal_prices.ensure_schema(db)
+    # Куб добычи по дням, месяцам и годам
+    cube.ensure_schema(db)
+    # История тарифов на электроэнергию и топливо
+    tariffs.ensure_schema(db)
+    # Ставки должностей и сохраненные расчеты зарплаты
+    payroll.ensure_schema(db)
+    # Суточный срез показателей производительности
+    kpi.ensure_schema(db)
+    # Статистика смен для проверки ввода добычи
+    anomaly.ensure_schema(db)
+    # Факты лимитов и предупреждения о выполнении (после среза: пересчет читает его индексы)
+    alerts.ensure_schema(db)
+    # Индекс табеля по работникам для проверки записей
+    timesheet_check.ensure_schema(db)
+
 def add_test_data(db):
     
     # 1. Должности
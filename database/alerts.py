@@ -0,0 +1,302 @@
+import logging
+from config import Config
+from database.db_connection import DatabaseConnection
+from database.change_log import CAPTURE_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Факты лимита по таблицам: таблица -> (столбец даты, {столбец факта в limits: столбец таблицы})
+FACT_SOURCES = {
+    'mining': ('mining_date', {'actual_production': 'volume', 'actual_rock': 'rock_volume'}),
+    'costs': ('cost_date', {'actual_electricity': 'electricity', 'actual_fuel': 'fuel'}),
+}
+
+# Контролируемые показатели: (столбец плана, столбец факта, направление)
+# below - недовыполнение плана на текущую дату, above - перерасход лимита месяца
+ALERT_RULES = {
+    'production': ('plan_production', 'actual_production', 'below'),
+    'rock': ('plan_rock', 'actual_rock', 'above'),
+    'electricity': ('plan_electricity', 'actual_electricity', 'above'),
+    'fuel': ('plan_fuel', 'actual_fuel', 'above'),
+}
+
+MEASURE_NAMES = {
+    'production': 'добыча',
+    'rock': 'порода',
+    'electricity': 'электроэнергия',
+    'fuel': 'топливо',
+}
+
+LEVEL_NAMES = {'ok': 'в норме', 'warning': 'предупреждение', 'critical': 'нарушение'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_state (
+    section_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    measure TEXT NOT NULL,
+    level TEXT NOT NULL CHECK (level IN ('ok', 'warning', 'critical')),
+    percent REAL,
+    changed_at TEXT NOT NULL,
+    PRIMARY KEY (section_id, year, month, measure)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS alert_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    section_id INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    measure TEXT NOT NULL,
+    level TEXT NOT NULL,
+    previous_level TEXT,
+    percent REAL,
+    raised_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+"""
+
+def _month_range_sql(prefix):
+    return (f"printf('%04d-%02d-01', {prefix}.year, {prefix}.month)",
+            f"printf('%04d-%02d-31', {prefix}.year, {prefix}.month)")
+
+def _limit_key_sql(prefix, date_column):
+    """Условие на строку лимита участка и месяца записи - поиск по UNIQUE-ключу"""
+    return (f"section_id = {prefix}.section_id "
+            f"AND month = CAST(substr({prefix}.{date_column}, 6, 2) AS INTEGER) "
+            f"AND year = CAST(substr({prefix}.{date_column}, 1, 4) AS INTEGER)")
+
+def _apply_sql(table, prefix, sign):
+    date_column, facts = FACT_SOURCES[table]
+    changes = ', '.join(f"{actual} = IFNULL({actual}, 0) {sign} IFNULL({prefix}.{column}, 0)"
+                        for actual, column in facts.items())
+    return f"""
+        UPDATE limits SET {changes}
+        WHERE {_limit_key_sql(prefix, date_column)};"""
+
+def recalculate_sql(condition):
+    """Пересчет фактов лимитов по рабочим таблицам для строк limits по условию
+
+    Каждая сумма читает один диапазон дат покрывающего индекса среза показателей.
+    """
+    start, end = _month_range_sql('limits')
+    parts = []
+    for table, (date_column, facts) in FACT_SOURCES.items():
+        for actual, column in facts.items():
+            parts.append(
+                f"{actual} = (SELECT TOTAL(f.{column}) FROM {table} f "
+                f"WHERE f.{date_column} BETWEEN {start} AND {end} AND f.section_id = limits.section_id)"
+            )
+    return f"""
+    UPDATE limits SET {', '.join(parts)}
+    WHERE ({condition}) AND year NOT IN (SELECT year FROM archive_years)"""
+
+def _percent_sql(measure):
+    """Процент выполнения: добыча - от плана, пропорционального прошедшим дням месяца"""
+    plan, actual, direction = ALERT_RULES[measure]
+    if direction == 'above':
+        return f"CASE WHEN l.{plan} > 0 THEN IFNULL(l.{actual}, 0) * 100.0 / l.{plan} END"
+
+    month = "printf('%04d-%02d', l.year, l.month)"
+    today = "date('now', 'localtime')"
+    elapsed = (f"CASE WHEN {month} < substr({today}, 1, 7) THEN 1.0 "
+               f"WHEN {month} > substr({today}, 1, 7) THEN 0 "
+               f"ELSE CAST(strftime('%d', {today}) AS REAL) / "
+               f"CAST(strftime('%d', {month} || '-01', '+1 month', '-1 day') AS INTEGER) END")
+    return (f"CASE WHEN l.{plan} > 0 AND {elapsed} > 0 "
+            f"THEN IFNULL(l.{actual}, 0) * 100.0 / (l.{plan} * {elapsed}) END")
+
+def _level_sql(measure):
+    direction = ALERT_RULES[measure][2]
+    if direction == 'above':
+        warning, critical = Config.ALERT_LIMIT_LEVELS
+        return (f"CASE WHEN percent > {critical} THEN 'critical' "
+                f"WHEN percent > {warning} THEN 'warning' ELSE 'ok' END")
+    warning, critical = Config.ALERT_PRODUCTION_LEVELS
+    return (f"CASE WHEN percent < {critical} THEN 'critical' "
+            f"WHEN percent < {warning} THEN 'warning' ELSE 'ok' END")
+
+def evaluate_sql(condition):
+    """Запросы оценки порогов для строк limits по условию с записью состояния
+
+    Время изменения состояния обновляется, только когда меняется уровень.
+    """
+    return [f"""
+        INSERT INTO alert_state (section_id, year, month, measure, level, percent, changed_at)
+        SELECT section_id, year, month, '{measure}', {_level_sql(measure)}, percent,
+               datetime('now', 'localtime')
+        FROM (SELECT l.section_id, l.year, l.month, {_percent_sql(measure)} AS percent
+              FROM limits l WHERE {condition})
+        WHERE true
+        ON CONFLICT (section_id, year, month, measure) DO UPDATE SET
+            percent = excluded.percent,
+            changed_at = CASE WHEN level IS excluded.level THEN changed_at ELSE excluded.changed_at END,
+            level = excluded.level""" for measure in ALERT_RULES]
+
+def trigger_sql():
+    """DDL триггеров, ведущих факты лимитов и состояние предупреждений
+
+    Запись добычи или затрат меняет факт одной строки limits по ее
+    уникальному ключу; изменение фактов или плана переоценивает пороги
+    этой строки, смена уровня записывается в журнал предупреждений.
+    Как и журнал изменений, триггеры фактов отключаются при архивировании:
+    факты закрытых лет остаются зафиксированными.
+    """
+    ddl = []
+    for table, (date_column, facts) in FACT_SOURCES.items():
+        columns = ', '.join((date_column, 'section_id', *facts.values()))
+        ddl.append(f"""
+    DROP TRIGGER IF EXISTS trg_{table}_limits_insert;
+    CREATE TRIGGER trg_{table}_limits_insert AFTER INSERT ON {table}
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_apply_sql(table, 'NEW', '+')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_{table}_limits_update;
+    CREATE TRIGGER trg_{table}_limits_update AFTER UPDATE OF {columns} ON {table}
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_apply_sql(table, 'OLD', '-')}{_apply_sql(table, 'NEW', '+')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_{table}_limits_delete;
+    CREATE TRIGGER trg_{table}_limits_delete AFTER DELETE ON {table}
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_apply_sql(table, 'OLD', '-')}
+    END;
+    """)
+
+    plans = ', '.join(plan for plan, _, _ in ALERT_RULES.values())
+    actuals = ', '.join(actual for _, actual, _ in ALERT_RULES.values())
+    ddl.append(f"""
+    -- Новый лимит или перенос лимита на другой участок или месяц получает факты сразу
+    DROP TRIGGER IF EXISTS trg_limits_facts_insert;
+    CREATE TRIGGER trg_limits_facts_insert AFTER INSERT ON limits
+    BEGIN{recalculate_sql('limit_id = NEW.limit_id')};
+    END;
+
+    DROP TRIGGER IF EXISTS trg_limits_facts_rekey;
+    CREATE TRIGGER trg_limits_facts_rekey AFTER UPDATE OF section_id, month, year ON limits
+    WHEN OLD.section_id IS NOT NEW.section_id OR OLD.month IS NOT NEW.month OR OLD.year IS NOT NEW.year
+    BEGIN
+        DELETE FROM alert_state WHERE section_id = OLD.section_id AND year = OLD.year AND month = OLD.month;{recalculate_sql('limit_id = NEW.limit_id')};
+    END;
+
+    DROP TRIGGER IF EXISTS trg_limits_alerts_evaluate;
+    CREATE TRIGGER trg_limits_alerts_evaluate AFTER UPDATE OF {plans}, {actuals} ON limits
+    BEGIN{''.join(f'{statement};' for statement in evaluate_sql('l.limit_id = NEW.limit_id'))}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_limits_alerts_delete;
+    CREATE TRIGGER trg_limits_alerts_delete AFTER DELETE ON limits
+    BEGIN
+        DELETE FROM alert_state WHERE section_id = OLD.section_id AND year = OLD.year AND month = OLD.month;
+    END;
+
+    DROP TRIGGER IF EXISTS trg_alert_state_insert;
+    CREATE TRIGGER trg_alert_state_insert AFTER INSERT ON alert_state
+    WHEN NEW.level != 'ok'
+    BEGIN
+        INSERT INTO alert_events (section_id, year, month, measure, level, percent)
+        VALUES (NEW.section_id, NEW.year, NEW.month, NEW.measure, NEW.level, NEW.percent);
+    END;
+
+    DROP TRIGGER IF EXISTS trg_alert_state_level;
+    CREATE TRIGGER trg_alert_state_level AFTER UPDATE OF level ON alert_state
+    WHEN OLD.level IS NOT NEW.level
+    BEGIN
+        INSERT INTO alert_events (section_id, year, month, measure, level, previous_level, percent)
+        VALUES (NEW.section_id, NEW.year, NEW.month, NEW.measure, NEW.level, OLD.level, NEW.percent);
+    END;
+    """)
+    return ''.join(ddl)
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    created = not db.table_exists('alert_state')
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.executescript(trigger_sql())
+    conn.commit()
+    # Факты лимитов сверяются с рабочими таблицами один раз, дальше их ведут триггеры
+    if created:
+        AlertMonitor(db).recalculate()
+
+def message(event):
+    """Текст уведомления о смене уровня"""
+    name = MEASURE_NAMES.get(event['measure'], event['measure'])
+    percent = f", {event['percent']:.1f}%" if event['percent'] is not None else ''
+    period = f"{event['month']:02d}.{event['year']}"
+    if event['level'] == 'ok':
+        return f"{event['section_name']}, {period}: {name} снова в норме{percent}"
+    return f"{event['section_name']}, {period}: {name} - {LEVEL_NAMES[event['level']]}{percent}"
+
+def log_listener(event):
+    if event['level'] == 'ok':
+        logger.info(message(event))
+    else:
+        logger.warning(message(event))
+
+class AlertMonitor:
+    """Предупреждения о выполнении лимитов
+
+    Состояние по участкам и месяцам ведут триггеры базы, монитор только
+    читает новые записи журнала предупреждений и передает их подписчикам:
+    строке состояния главного окна, журналу программы.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+        self.listeners = []
+        self.last_seq = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def poll(self):
+        """Новые смены уровней с прошлого опроса; первый опрос только запоминает позицию"""
+        if self.last_seq is None:
+            row = self.db.fetch_one("SELECT IFNULL(MAX(seq), 0) AS seq FROM alert_events")
+            self.last_seq = row['seq'] if row else 0
+            return []
+
+        events = self.db.fetch_all("""
+        SELECT e.*, s.section_name
+        FROM alert_events e
+        JOIN sections s ON e.section_id = s.section_id
+        WHERE e.seq > ?
+        ORDER BY e.seq
+        """, (self.last_seq,))
+        if events:
+            self.last_seq = events[-1]['seq']
+        for event in events:
+            for listener in self.listeners:
+                listener(event)
+        return events
+
+    def active(self):
+        """Действующие предупреждения по открытым месяцам"""
+        return self.db.fetch_all("""
+        SELECT a.*, s.section_name
+        FROM alert_state a
+        JOIN sections s ON a.section_id = s.section_id
+        WHERE a.level != 'ok'
+          AND a.year NOT IN (SELECT year FROM archive_years)
+        ORDER BY a.level = 'critical' DESC, a.year DESC, a.month DESC, s.section_name
+        """)
+
+    def evaluate(self, connection=None):
+        """Переоценка всех лимитов: план добычи на дату растет и без новых записей
+
+        connection - отдельное соединение фонового потока вместо соединения db.
+        """
+        if connection is not None:
+            with connection:
+                for statement in evaluate_sql('1'):
+                    connection.execute(statement)
+            return
+        with self.db.transaction() as conn:
+            for statement in evaluate_sql('1'):
+                conn.execute(statement)
+
+    def recalculate(self):
+        """Полный пересчет фактов лимитов открытых лет с переоценкой порогов"""
+        with self.db.transaction() as conn:
+            conn.execute(recalculate_sql('1'))
@@ -0,0 +1,255 @@
+import time
+from pathlib import Path
+from database.db_connection import DatabaseConnection
+from database.change_log import ChangeLog, TRACKED_TABLES
+from database.delta_export import collapse_changes, PAGE_SIZE
+from database.archive import ARCHIVED_TABLES, get_archive_manager
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Справочники без журнала изменений: перегружаются целиком при каждом обновлении
+DIMENSION_TABLES = ('sections', 'coal', 'positions', 'tariffs', 'coal_prices')
+
+# Типы столбцов SQLite -> DuckDB
+COLUMN_TYPES = {'INTEGER': 'BIGINT', 'REAL': 'DOUBLE', 'TEXT': 'VARCHAR'}
+
+class AnalyticsEngine:
+    """Колоночное зеркало таблиц фактов в DuckDB для тяжелых отчетов
+
+    Зеркало догоняет рабочую базу по журналу изменений перед каждым
+    отчетом. Строки закрытых лет остаются в зеркале и после архивирования,
+    поэтому многолетние сводки не требуют подключения архивов. Без duckdb
+    или при ошибке зеркала запросы выполняются в SQLite.
+    """
+
+    def __init__(self, path=None, db=None):
+        from config import Config
+        self.path = Path(path or Config.ANALYTICS_PATH)
+        self.enabled = Config.ANALYTICS_ENABLED
+        self.db = db or DatabaseConnection()
+        self.change_log = ChangeLog(self.db)
+        self.connection = None
+
+    def available(self):
+        return self.enabled and duckdb is not None and pd is not None and not self.db.remote
+
+    def _connect(self):
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = duckdb.connect(str(self.path))
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _last_seq(self):
+        con = self._connect()
+        exists = con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'mirror_state'"
+        ).fetchone()[0]
+        if not exists:
+            return None
+        row = con.execute("SELECT last_seq FROM mirror_state").fetchone()
+        return row[0] if row else None
+
+    def _set_last_seq(self, seq):
+        con = self._connect()
+        con.execute("CREATE TABLE IF NOT EXISTS mirror_state (last_seq BIGINT, refreshed_at TIMESTAMP)")
+        con.execute("DELETE FROM mirror_state")
+        con.execute("INSERT INTO mirror_state VALUES (?, now())", [seq])
+
+    def _columns(self, table):
+        return self.db.fetch_all(f"PRAGMA table_info({table})")
+
+    def _insert(self, table, columns, rows):
+        if not rows:
+            return
+        frame = pd.DataFrame([[row.get(column) for column in columns] for row in rows], columns=columns)
+        con = self._connect()
+        con.register('mirror_batch', frame)
+        try:
+            con.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT * FROM mirror_batch")
+        finally:
+            con.unregister('mirror_batch')
+
+    def _load_table(self, table):
+        """Полная перезагрузка таблицы; для таблиц с датой - вместе с архивными годами"""
+        info = self._columns(table)
+        columns = [column['name'] for column in info]
+        definition = ', '.join(
+            f"{column['name']} {COLUMN_TYPES.get(column['type'].upper(), 'VARCHAR')}" for column in info
+        )
+        con = self._connect()
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.execute(f"CREATE TABLE {table} ({definition})")
+
+        source = table
+        if table in ARCHIVED_TABLES:
+            source = get_archive_manager().source(table, '0000-01-01', '9999-12-31')
+        self._insert(table, columns, self.db.fetch_all(f"SELECT {', '.join(columns)} FROM {source}"))
+
+    def rebuild(self):
+        """Построение зеркала заново, возвращает номер последнего изменения"""
+        seq = self.change_log.current_seq()
+        con = self._connect()
+        con.execute("BEGIN TRANSACTION")
+        try:
+            for table in (*TRACKED_TABLES, *DIMENSION_TABLES):
+                self._load_table(table)
+            self._set_last_seq(seq)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return seq
+
+    def invalidate(self):
+        """Сброс состояния зеркала: следующий отчет построит его заново"""
+        if self.available() and self.path.exists():
+            self._set_last_seq(None)
+
+    def _needs_rebuild(self, last_seq):
+        if last_seq is None:
+            return True
+        # База восстановлена из копии или журнал очищен дальше зеркала
+        if self.change_log.current_seq() < last_seq:
+            return True
+        oldest = self.db.fetch_one("SELECT MIN(seq) AS seq FROM change_log")
+        return oldest and oldest['seq'] is not None and oldest['seq'] > last_seq + 1
+
+    def refresh(self):
+        """Перенос изменений из журнала, возвращает число примененных строк"""
+        last_seq = self._last_seq()
+        if self._needs_rebuild(last_seq):
+            self.rebuild()
+            return None
+
+        changes = []
+        seq = last_seq
+        while True:
+            page = self.change_log.changes_since(seq, list(TRACKED_TABLES), PAGE_SIZE)
+            if not page:
+                break
+            changes.extend(page)
+            seq = page[-1]['seq']
+
+        con = self._connect()
+        con.execute("BEGIN TRANSACTION")
+        try:
+            rows = collapse_changes(changes)
+            for table, key in TRACKED_TABLES.items():
+                table_rows = [row for row in rows if row['table_name'] == table]
+                if not table_rows:
+                    continue
+                # Измененные и удаленные строки удаляются, затем вставляется новое состояние
+                keys = pd.DataFrame([row['row_key'] for row in table_rows], columns=list(key))
+                con.register('mirror_keys', keys)
+                try:
+                    condition = ' AND '.join(f'{table}.{column} = mirror_keys.{column}' for column in key)
+                    con.execute(f"DELETE FROM {table} USING mirror_keys WHERE {condition}")
+                finally:
+                    con.unregister('mirror_keys')
+                columns = [column['name'] for column in self._columns(table)]
+                self._insert(table, columns, [row['data'] for row in table_rows if row['operation'] != 'D'])
+
+            for table in DIMENSION_TABLES:
+                self._load_table(table)
+            self._set_last_seq(seq)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def query(self, query, params=None):
+        """Запрос к зеркалу, строки в виде словарей"""
+        cursor = self._connect().execute(query, params or [])
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _mirror_ready(self):
+        """Зеркало доступно и догнало рабочую базу"""
+        if not self.available():
+            return False
+        try:
+            self.refresh()
+            return True
+        except Exception as e:
+            print(f"Аналитическое зеркало недоступно, запрос выполняется в SQLite: {e}")
+            self.close()
+            return False
+
+    def fetch_all(self, query, params=None):
+        """Отчетный запрос: в зеркале, если оно доступно, иначе в SQLite"""
+        if self._mirror_ready():
+            try:
+                return self.query(query, params)
+            except duckdb.Error as e:
+                # Запрос использует возможности, которых нет в DuckDB
+                print(f"Запрос выполняется в SQLite: {str(e).splitlines()[0]}")
+        return self.db.fetch_all(query, params)
+
+    def fetch_report(self, name, mirror=True):
+        """Отчет из database.reports: заголовок и строки
+
+        Зеркало хранит архивные годы в своих таблицах, в SQLite таблицы
+        фактов заменяются источниками с подключенными архивами. При работе
+        через сервер архивы подключает сервер.
+        """
+        from database.reports import report_query
+        if self.db.remote:
+            return self.db.fetch_report(name)
+        if mirror and self._mirror_ready():
+            title, query = report_query(name)
+            try:
+                return title, self.query(query)
+            except duckdb.Error as e:
+                print(f"Запрос выполняется в SQLite: {str(e).splitlines()[0]}")
+        title, query = report_query(name, get_archive_manager().source)
+        return title, self.db.fetch_all(query)
+
+    def status(self):
+        """Состояние зеркала и время типовой многолетней сводки"""
+        from database.reports import report_query
+        if not self.available():
+            return {'available': False}
+        applied = self.refresh()
+        started = time.perf_counter()
+        rows = self.query(report_query('production_rollup')[1])
+        return {
+            'available': True,
+            'path': self.path,
+            'last_seq': self._last_seq(),
+            'applied': applied,
+            'rollup_rows': len(rows),
+            'rollup_seconds': time.perf_counter() - started,
+        }
+
+_analytics = None
+
+def get_analytics():
+    """Общий экземпляр зеркала для соединения DatabaseConnection"""
+    global _analytics
+    if _analytics is None:
+        _analytics = AnalyticsEngine()
+    return _analytics
+
+def reset_analytics():
+    """Закрытие зеркала после замены файла базы; зеркало строится заново"""
+    global _analytics
+    engine = _analytics or AnalyticsEngine()
+    _analytics = None
+    try:
+        engine.invalidate()
+    finally:
+        engine.close()
@@ -0,0 +1,221 @@
+import math
+from config import Config
+from database.db_connection import DatabaseConnection
+from database.change_log import CAPTURE_ENABLED
+
+# Проверяемые показатели смены: столбец добычи -> название
+STAT_MEASURES = {
+    'volume': 'объем добычи',
+    'rock_volume': 'объем породы',
+}
+
+# Группа, внутри которой сравниваются смены
+STAT_KEY = ('section_id', 'coal_mark', 'shift')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS mining_stats (
+    section_id INTEGER NOT NULL,
+    coal_mark TEXT NOT NULL,
+    shift INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    {''.join(f'{name}_mean REAL NOT NULL, {name}_m2 REAL NOT NULL, ' for name in STAT_MEASURES)}
+    PRIMARY KEY (section_id, coal_mark, shift)
+) WITHOUT ROWID;
+"""
+
+def _add_sql(prefix):
+    """Добавление значения по Уилфорду: среднее и сумма квадратов отклонений
+
+    В UPDATE все правые части видят старые значения строки, поэтому
+    m2 увеличивается на (x - mean)^2 * n / (n + 1) - то же, что
+    (x - mean) * (x - new_mean) в классической записи.
+    """
+    values = {name: f'IFNULL({prefix}.{name}, 0)' for name in STAT_MEASURES}
+    return f"""
+        INSERT INTO mining_stats (section_id, coal_mark, shift, n, {', '.join(f'{name}_mean, {name}_m2' for name in STAT_MEASURES)})
+        VALUES ({prefix}.section_id, {prefix}.coal_mark, IFNULL({prefix}.shift, 0), 1,
+                {', '.join(f'{value}, 0' for value in values.values())})
+        ON CONFLICT (section_id, coal_mark, shift) DO UPDATE SET
+            n = n + 1,
+            {', '.join(
+                f'{name}_mean = {name}_mean + (excluded.{name}_mean - {name}_mean) / (n + 1), '
+                f'{name}_m2 = {name}_m2 + (excluded.{name}_mean - {name}_mean) * (excluded.{name}_mean - {name}_mean) * n / (n + 1)'
+                for name in STAT_MEASURES)};"""
+
+def _subtract_sql(prefix):
+    """Исключение значения: обратный шаг Уилфорда, группа без смен удаляется"""
+    values = {name: f'IFNULL({prefix}.{name}, 0)' for name in STAT_MEASURES}
+    condition = (f"section_id = {prefix}.section_id AND coal_mark = {prefix}.coal_mark "
+                 f"AND shift = IFNULL({prefix}.shift, 0)")
+    return f"""
+        DELETE FROM mining_stats WHERE {condition} AND n <= 1;
+        UPDATE mining_stats SET
+            n = n - 1,
+            {', '.join(
+                f'{name}_mean = (n * {name}_mean - {value}) / (n - 1), '
+                f'{name}_m2 = MAX({name}_m2 - ({value} - {name}_mean) * ({value} - {name}_mean) * n / (n - 1), 0)'
+                for name, value in values.items())}
+        WHERE {condition};"""
+
+def trigger_sql():
+    """DDL триггеров, ведущих статистику смен при изменении добычи
+
+    Как и куб, статистика не меняется при переносе года в архив.
+    """
+    return f"""
+    DROP TRIGGER IF EXISTS trg_mining_stats_insert;
+    CREATE TRIGGER trg_mining_stats_insert AFTER INSERT ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_add_sql('NEW')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_mining_stats_update;
+    CREATE TRIGGER trg_mining_stats_update
+    AFTER UPDATE OF shift, volume, coal_mark, section_id, rock_volume ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_subtract_sql('OLD')}{_add_sql('NEW')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_mining_stats_delete;
+    CREATE TRIGGER trg_mining_stats_delete AFTER DELETE ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{_subtract_sql('OLD')}
+    END;
+    """
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    created = not db.table_exists('mining_stats')
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.executescript(trigger_sql())
+    conn.commit()
+    # Накопленная добыча учитывается один раз, дальше статистику ведут триггеры
+    if created:
+        AnomalyDetector(db).rebuild()
+
+def _deviation(value, mean, m2, n):
+    """Отклонение в стандартных отклонениях группы
+
+    Разброс не считается меньше доли от среднего: иначе у группы
+    одинаковых смен любое новое значение выглядело бы выбросом.
+    """
+    variance = m2 / (n - 1)
+    spread = max(math.sqrt(variance), abs(mean) * Config.ANOMALY_MIN_RELATIVE_STD)
+    if spread == 0:
+        return 0.0
+    return (value - mean) / spread
+
+class AnomalyDetector:
+    """Поиск ошибочных значений добычи по статистике смен
+
+    Для каждого участка, марки и смены хранится число смен, среднее и
+    сумма квадратов отклонений. Триггеры обновляют их при каждой записи,
+    поэтому проверка нового значения - одно чтение по первичному ключу.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def rebuild(self):
+        """Пересчет статистики по рабочей базе и архивам"""
+        from database.archive import get_archive_manager
+
+        source = get_archive_manager().source('mining', '0000-01-01', '9999-12-31')
+        key = ', '.join(STAT_KEY)
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM mining_stats")
+            conn.execute(f"""
+            WITH rows AS (
+                SELECT section_id, coal_mark, IFNULL(shift, 0) AS shift,
+                       {', '.join(f'IFNULL({name}, 0) AS {name}' for name in STAT_MEASURES)}
+                FROM {source}
+            ),
+            groups AS (
+                SELECT {key}, COUNT(*) AS n, {', '.join(f'AVG({name}) AS {name}_mean' for name in STAT_MEASURES)}
+                FROM rows GROUP BY {key}
+            )
+            INSERT INTO mining_stats (section_id, coal_mark, shift, n, {', '.join(f'{name}_mean, {name}_m2' for name in STAT_MEASURES)})
+            SELECT g.section_id, g.coal_mark, g.shift, g.n,
+                   {', '.join(f'g.{name}_mean, TOTAL((r.{name} - g.{name}_mean) * (r.{name} - g.{name}_mean))' for name in STAT_MEASURES)}
+            FROM groups g
+            JOIN rows r USING ({key})
+            GROUP BY g.section_id, g.coal_mark, g.shift
+            """)
+
+    def stats(self, section_id, coal_mark, shift):
+        return self.db.fetch_one(
+            "SELECT * FROM mining_stats WHERE section_id = ? AND coal_mark = ? AND shift = ?",
+            (section_id, coal_mark, shift or 0))
+
+    def check(self, section_id, coal_mark, shift, values, previous=None):
+        """Необычные значения новой или исправленной смены
+
+        values - {показатель: значение}; previous - прежние значения
+        исправляемой смены той же группы, они исключаются из статистики.
+        Возвращает список (показатель, значение, среднее, отклонение).
+        """
+        stats = self.stats(section_id, coal_mark, shift)
+        if not stats:
+            return []
+
+        found = []
+        for name, value in values.items():
+            n, mean, m2 = stats['n'], stats[f'{name}_mean'], stats[f'{name}_m2']
+            if previous is not None:
+                old = previous.get(name) or 0
+                if n <= 1:
+                    continue
+                # Обратный шаг Уилфорда без записи в базу
+                m2 = max(m2 - (old - mean) ** 2 * n / (n - 1), 0)
+                mean = (n * mean - old) / (n - 1)
+                n -= 1
+            if n < Config.ANOMALY_MIN_COUNT:
+                continue
+            deviation = _deviation(value or 0, mean, m2, n)
+            if abs(deviation) > Config.ANOMALY_THRESHOLD:
+                found.append((name, value, mean, deviation))
+        return found
+
+    def audit(self, date_from, date_to):
+        """Смены за период, выделяющиеся на фоне остальных смен своей группы
+
+        Каждая смена сравнивается со статистикой группы без нее самой,
+        чтобы крупная ошибка не маскировала себя, раздувая разброс.
+        Сравниваются квадраты, без извлечения корня в SQL.
+        """
+        from database.archive import get_archive_manager
+
+        source = get_archive_manager().source('mining', date_from, date_to)
+        threshold = Config.ANOMALY_THRESHOLD ** 2
+        relative = Config.ANOMALY_MIN_RELATIVE_STD ** 2
+        checks, columns = [], []
+        for name in STAT_MEASURES:
+            x = f'IFNULL(m.{name}, 0)'
+            mean = f'((st.n * st.{name}_mean - {x}) / (st.n - 1))'
+            m2 = f'MAX(st.{name}_m2 - ({x} - st.{name}_mean) * ({x} - st.{name}_mean) * st.n / (st.n - 1), 0)'
+            spread2 = f'MAX({m2} / (st.n - 2), {mean} * {mean} * {relative})'
+            columns.append(f'{mean} AS {name}_mean, ({x} - {mean}) * ({x} - {mean}) / {spread2} AS {name}_z2')
+            checks.append(f'({x} - {mean}) * ({x} - {mean}) > {threshold} * {spread2}')
+
+        rows = self.db.fetch_all(f"""
+        SELECT m.mining_id, m.mining_date, m.shift, m.coal_mark, s.section_name,
+               {', '.join(f'm.{name}' for name in STAT_MEASURES)},
+               {', '.join(columns)}
+        FROM {source} m
+        JOIN sections s ON m.section_id = s.section_id
+        JOIN mining_stats st ON st.section_id = m.section_id AND st.coal_mark = m.coal_mark
+             AND st.shift = IFNULL(m.shift, 0)
+        WHERE m.mining_date BETWEEN ? AND ?
+          AND st.n > {max(Config.ANOMALY_MIN_COUNT, 2)}
+          AND ({' OR '.join(checks)})
+        ORDER BY m.mining_date, s.section_name, m.shift
+        """, (date_from, date_to))
+
+        for row in rows:
+            # Отклонение со знаком для отображения
+            for name in STAT_MEASURES:
+                z2 = row.pop(f'{name}_z2')
+                sign = 1 if (row[name] or 0) >= row[f'{name}_mean'] else -1
+                row[f'{name}_deviation'] = sign * math.sqrt(z2) if z2 else 0.0
+        return rows
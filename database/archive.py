@@ -0,0 +1,287 @@
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from database.db_connection import DatabaseConnection
+
+# Архивируемые таблицы и их столбец даты
+ARCHIVED_TABLES = {
+    'mining': 'mining_date',
+    'costs': 'cost_date',
+    'time_sheet': 'date',
+}
+
+# Ключевые столбцы для индексов в архивных файлах
+ARCHIVE_KEYS = {
+    'mining': ('mining_id',),
+    'costs': ('cost_id',),
+    'time_sheet': ('date', 'shift', 'tab_number'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_years (
+    year INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Сообщение об отказе записи в архивный год (оно же текст ошибки триггеров)
+ARCHIVED_DATE_MESSAGE = 'Дата относится к архивному году, записи этого года не изменяются'
+
+# Строки закрытого года лежат в архивном файле: новая строка с датой этого
+# года или перенос даты в него разошлись бы с архивом и его итогами
+ARCHIVED_DATE_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS trg_{table}_archived_insert
+BEFORE INSERT ON {table}
+WHEN EXISTS (SELECT 1 FROM archive_years WHERE year = CAST(substr(NEW.{column}, 1, 4) AS INTEGER))
+BEGIN
+    SELECT RAISE(ABORT, '{message}');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_archived_update
+BEFORE UPDATE OF {column} ON {table}
+WHEN NEW.{column} IS NOT OLD.{column}
+ AND EXISTS (SELECT 1 FROM archive_years WHERE year = CAST(substr(NEW.{column}, 1, 4) AS INTEGER))
+BEGIN
+    SELECT RAISE(ABORT, '{message}');
+END;
+"""
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    for table, column in ARCHIVED_TABLES.items():
+        conn.executescript(ARCHIVED_DATE_TRIGGERS.format(
+            table=table, column=column, message=ARCHIVED_DATE_MESSAGE))
+    conn.commit()
+
+# Ссылка на таблицу архивного файла в тексте запроса: arch_2021.mining
+ARCHIVE_REFERENCE = re.compile(r'\barch_(\d{4})\.')
+
+def union_sql(table, years):
+    """Строки рабочей таблицы вместе с подключенными архивами лет years"""
+    parts = [f'SELECT * FROM main.{table}']
+    parts += [f'SELECT * FROM arch_{year}.{table}' for year in years]
+    return ' UNION ALL '.join(parts)
+
+class ArchiveManager:
+    """Перенос закрытых лет в отдельные файлы и подключение их по требованию
+
+    Рабочая база хранит только открытые годы. Если период запроса
+    захватывает архивные годы, нужные файлы подключаются через ATTACH,
+    а вместо таблицы подставляется временное представление UNION ALL.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+        # Подключенные архивы и представления текущего соединения
+        self.attached = set()
+        self.views = {}
+        self.connection = None
+
+    def _sync_connection(self):
+        # После переподключения к базе прежние ATTACH и TEMP VIEW потеряны
+        conn = self.db.get_connection()
+        if conn is not self.connection:
+            self.connection = conn
+            self.attached.clear()
+            self.views.clear()
+        return conn
+
+    @property
+    def remote(self):
+        return self.db.remote
+
+    def archive_dir(self):
+        from config import Config
+        return Path(Config.ARCHIVE_DIR)
+
+    def archive_path(self, year):
+        return self.archive_dir() / f'mine_{year}.db'
+
+    def archived_years(self):
+        rows = self.db.fetch_all("SELECT year FROM archive_years ORDER BY year")
+        return [row['year'] for row in rows]
+
+    def is_archived_date(self, date):
+        """Относится ли дата (YYYY-MM-DD) к архивному году"""
+        return int(date[:4]) in self.archived_years()
+
+    def live_years(self):
+        """Годы, данные которых еще лежат в рабочей базе, с числом строк"""
+        parts = ' UNION ALL '.join(
+            f"SELECT CAST(substr({column}, 1, 4) AS INTEGER) AS year FROM {table}"
+            for table, column in ARCHIVED_TABLES.items()
+        )
+        query = f"SELECT year, COUNT(*) AS rows FROM ({parts}) GROUP BY year ORDER BY year"
+        return self.db.fetch_all(query)
+
+    def archive_year(self, year):
+        """Перенос строк закрытого года в архивный файл, возвращает число строк"""
+        year = int(year)
+        if year >= datetime.now().year:
+            raise ValueError(f'Год {year} еще не закрыт и не может быть архивирован')
+
+        # Срез показателей догоняет журнал, пока строки года еще в рабочих таблицах
+        if self.db.table_exists('kpi_daily'):
+            from database.kpi import KpiEngine
+            KpiEngine(self.db).refresh()
+
+        self.detach_all()
+        self.archive_dir().mkdir(parents=True, exist_ok=True)
+        path = self.archive_path(year)
+        conn = self._sync_connection()
+
+        conn.execute("ATTACH DATABASE ? AS arch_target", (str(path),))
+        try:
+            total = 0
+            # Удаление из рабочей базы не считается изменением данных:
+            # строки не должны попасть в выгрузку изменений как удаленные
+            with self.db.capture_suppressed():
+                for table, column in ARCHIVED_TABLES.items():
+                    conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS arch_target.{table} "
+                        f"AS SELECT * FROM main.{table} WHERE 0"
+                    )
+                    keys = ', '.join(ARCHIVE_KEYS[table])
+                    conn.execute(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS arch_target.idx_{table}_key "
+                        f"ON {table} ({keys})"
+                    )
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS arch_target.idx_{table}_date "
+                        f"ON {table} ({column})"
+                    )
+
+                    period = (f'{year}-01-01', f'{year}-12-31')
+                    cursor = conn.execute(
+                        f"INSERT OR REPLACE INTO arch_target.{table} "
+                        f"SELECT * FROM main.{table} WHERE {column} BETWEEN ? AND ?",
+                        period
+                    )
+                    total += cursor.rowcount
+                    conn.execute(
+                        f"DELETE FROM main.{table} WHERE {column} BETWEEN ? AND ?",
+                        period
+                    )
+
+                conn.execute("""
+                INSERT INTO archive_years (year, file_name, archived_at, row_count)
+                VALUES (?, ?, datetime('now'), ?)
+                ON CONFLICT(year) DO UPDATE SET
+                    archived_at = excluded.archived_at,
+                    row_count = row_count + excluded.row_count
+                """, (year, path.name, total))
+        finally:
+            conn.execute("DETACH DATABASE arch_target")
+
+        return total
+
+    def source(self, table, date_from, date_to):
+        """Имя таблицы или представления для запроса за период
+
+        Для периода внутри открытых лет возвращается сама таблица,
+        иначе подключаются нужные архивы и возвращается представление.
+        """
+        first_year, last_year = int(date_from[:4]), int(date_to[:4])
+        years = [year for year in self.archived_years() if first_year <= year <= last_year]
+        if not years:
+            return table
+        if self.remote:
+            # Архивы подключает сервер к соединению, в котором выполняется запрос
+            return f'({union_sql(table, sorted(years))})'
+
+        self.attach(years)
+        return self.union_view(table, years)
+
+    def attach(self, years):
+        conn = self._sync_connection()
+        limit = 10
+        if hasattr(conn, 'getlimit'):
+            limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(years) > limit:
+            raise ValueError(
+                f'Период захватывает {len(years)} архивных лет, '
+                f'одновременно можно подключить не более {limit}'
+            )
+
+        # Освобождаем место под нужные архивы
+        if len(self.attached | set(years)) > limit:
+            self.detach_all()
+
+        for year in years:
+            if year in self.attached:
+                continue
+            path = self.archive_path(year)
+            if not path.exists():
+                raise FileNotFoundError(f'Не найден архивный файл {path}')
+            conn.execute(f"ATTACH DATABASE ? AS arch_{year}", (str(path),))
+            self.attached.add(year)
+
+    def union_view(self, table, years):
+        years = tuple(sorted(years))
+        view = f'{table}_archive_{years[0]}_{years[-1]}_{len(years)}'
+        if self.views.get(view) != years:
+            conn = self._sync_connection()
+            conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+            conn.execute(f"CREATE TEMP VIEW {view} AS {union_sql(table, years)}")
+            self.views[view] = years
+        return view
+
+    def detach_all(self):
+        conn = self._sync_connection()
+        for view in self.views:
+            conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+        self.views.clear()
+        for year in self.attached:
+            conn.execute(f"DETACH DATABASE arch_{year}")
+        self.attached.clear()
+
+class ConnectionArchive(ArchiveManager):
+    """Подключение архивов к отдельному соединению сервера
+
+    В соединении только для чтения нельзя создать временное представление,
+    поэтому source() возвращает подзапрос UNION ALL. Запросы клиентов
+    приходят с такими подзапросами, нужные им архивы подключает
+    attach_referenced().
+    """
+
+    remote = False
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.attached = set()
+        self.views = {}
+
+    def _sync_connection(self):
+        return self.connection
+
+    def archived_years(self):
+        rows = self.connection.execute("SELECT year FROM archive_years ORDER BY year").fetchall()
+        return [row[0] for row in rows]
+
+    def union_view(self, table, years):
+        return f'({union_sql(table, sorted(years))})'
+
+    def attach_referenced(self, queries):
+        """Подключение архивных лет, на которые ссылаются запросы (вне транзакции)"""
+        years = {int(year) for query in queries for year in ARCHIVE_REFERENCE.findall(query)}
+        if years:
+            self.attach(sorted(years & set(self.archived_years())))
+
+_archive_manager = None
+
+def get_archive_manager():
+    """Общий экземпляр для соединения DatabaseConnection"""
+    global _archive_manager
+    if _archive_manager is None:
+        _archive_manager = ArchiveManager()
+    return _archive_manager
+
+def reset_archive_manager():
+    """Сброс после замены файла базы: подключения архивов относятся к прежней базе"""
+    global _archive_manager
+    _archive_manager = None
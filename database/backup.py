@@ -0,0 +1,128 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+BACKUP_PREFIX = 'mine_'
+# Копии состояния перед восстановлением: в срок хранения не входят
+SAFETY_PREFIX = 'before_restore_'
+
+class BackupService:
+    """Горячее резервное копирование через sqlite3 backup API
+
+    База копируется порциями страниц с паузами между ними, поэтому
+    другие пользователи продолжают вносить данные во время копирования.
+    """
+
+    def __init__(self, db_path=None, backup_dir=None, keep=None):
+        from config import Config
+        self.db_path = Path(db_path or Config.DB_PATH)
+        self.backup_dir = Path(backup_dir or Config.BACKUP_DIR)
+        self.keep = Config.BACKUP_KEEP if keep is None else keep
+        self.pages = Config.BACKUP_PAGES_PER_STEP
+        self.sleep = Config.BACKUP_STEP_SLEEP
+
+    def list_backups(self, prefix=BACKUP_PREFIX):
+        """Резервные копии, от новых к старым"""
+        if not self.backup_dir.exists():
+            return []
+        files = [
+            path for path in self.backup_dir.iterdir()
+            if path.name.startswith(prefix) and path.name.endswith(('.db', '.db.gz'))
+        ]
+        return sorted(files, key=lambda path: path.name, reverse=True)
+
+    def backup(self, compress=True, progress=None, retention=True, prefix=BACKUP_PREFIX):
+        """Создание копии, возвращает путь к файлу
+
+        progress(remaining, total) вызывается после каждой порции страниц.
+        """
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        target = self.backup_dir / f'{prefix}{timestamp}.db'
+        tmp_path = target.with_suffix('.db.tmp')
+
+        source = sqlite3.connect(self.db_path)
+        destination = sqlite3.connect(tmp_path)
+        try:
+            def on_step(status, remaining, total):
+                if progress:
+                    progress(remaining, total)
+
+            source.backup(destination, pages=self.pages, progress=on_step, sleep=self.sleep)
+            check = destination.execute("PRAGMA quick_check").fetchone()[0]
+            if check != 'ok':
+                raise sqlite3.DatabaseError(f'Копия не прошла проверку: {check}')
+        finally:
+            destination.close()
+            source.close()
+
+        try:
+            if compress:
+                target = target.with_suffix('.db.gz')
+                with open(tmp_path, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, target)
+        except Exception:
+            if tmp_path.exists():
+                os.remove(tmp_path)
+            raise
+
+        if retention:
+            self.apply_retention()
+        return target
+
+    def apply_retention(self):
+        """Удаление копий сверх лимита хранения, возвращает удаленные файлы"""
+        if not self.keep:
+            return []
+        removed = self.list_backups()[self.keep:]
+        for path in removed:
+            path.unlink()
+        return removed
+
+    def restore(self, backup_path, progress=None):
+        """Восстановление рабочей базы из копии
+
+        Перед восстановлением текущая база сохраняется отдельной копией,
+        соединение DatabaseConnection должно быть закрыто вызывающим кодом.
+        """
+        backup_path = Path(backup_path)
+        if not backup_path.exists():
+            raise FileNotFoundError(f'Файл копии не найден: {backup_path}')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_path = backup_path
+            if backup_path.suffix == '.gz':
+                source_path = Path(tmp_dir) / 'restore.db'
+                with gzip.open(backup_path, 'rb') as src, open(source_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            source = sqlite3.connect(source_path)
+            try:
+                check = source.execute("PRAGMA integrity_check").fetchone()[0]
+                if check != 'ok':
+                    raise sqlite3.DatabaseError(f'Копия повреждена: {check}')
+
+                safety_copy = None
+                if self.db_path.exists():
+                    safety_copy = self.backup(compress=True, retention=False, prefix=SAFETY_PREFIX)
+
+                destination = sqlite3.connect(self.db_path)
+                try:
+                    def on_step(status, remaining, total):
+                        if progress:
+                            progress(remaining, total)
+
+                    source.backup(destination, pages=self.pages, progress=on_step)
+                finally:
+                    destination.close()
+            finally:
+                source.close()
+
+        return safety_copy
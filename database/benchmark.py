@@ -0,0 +1,107 @@
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from database.db_connection import open_connection
+
+# Типовые отчеты: их выполняет роль reader
+REPORT_QUERIES = [
+    """
+    SELECT s.section_name, strftime('%Y-%m', m.mining_date) AS month,
+           SUM(m.volume) AS volume, SUM(m.rock_volume) AS rock
+    FROM mining m
+    JOIN sections s ON m.section_id = s.section_id
+    GROUP BY s.section_name, month
+    """,
+    """
+    SELECT m.coal_mark, SUM(m.volume * c.price_per_ton) AS revenue
+    FROM mining m
+    JOIN coal c ON m.coal_mark = c.coal_mark
+    GROUP BY m.coal_mark
+    """,
+    """
+    SELECT section_id, SUM(electricity) AS electricity, SUM(fuel) AS fuel
+    FROM costs
+    GROUP BY section_id
+    """,
+    """
+    SELECT w.full_name, SUM(t.hours) AS hours
+    FROM workers w
+    LEFT JOIN time_sheet t ON w.tab_number = t.tab_number
+    GROUP BY w.tab_number
+    ORDER BY hours DESC
+    """,
+]
+
+def copy_database(source_path, target_path):
+    """Копия рабочей базы, чтобы замеры не меняли реальные данные"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def _reference_keys(conn):
+    # Для вставок нужны существующие марка угля и участок
+    coal = conn.execute("SELECT coal_mark FROM coal LIMIT 1").fetchone()
+    if coal is None:
+        conn.execute("INSERT INTO coal (coal_mark, price_per_ton) VALUES ('BENCH', 1)")
+        coal = ('BENCH',)
+    section = conn.execute("SELECT section_id FROM sections LIMIT 1").fetchone()
+    if section is None:
+        section = (conn.execute(
+            "INSERT INTO sections (section_name) VALUES ('Замер') RETURNING section_id"
+        ).fetchone()[0],)
+    conn.commit()
+    return coal[0], section[0]
+
+def run_workload(path, profile, rows=2000, report_runs=20):
+    """Синтетическая нагрузка: ввод добычи по одной записи и повторные отчеты"""
+    rng = random.Random(1)
+    writer = open_connection('writer', profile, path)
+    try:
+        coal_mark, section_id = _reference_keys(writer)
+        started = time.perf_counter()
+        for i in range(rows):
+            # Каждая запись - отдельная транзакция, как при вводе с формы
+            writer.execute("""
+            INSERT INTO mining (mining_date, shift, volume, coal_mark, section_id, rock_volume)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}', i % 2 + 1,
+                  round(rng.uniform(50, 500), 1), coal_mark, section_id,
+                  round(rng.uniform(5, 50), 1)))
+            writer.commit()
+        insert_seconds = time.perf_counter() - started
+    finally:
+        writer.close()
+
+    reader = open_connection('reader', profile, path)
+    try:
+        started = time.perf_counter()
+        for _ in range(report_runs):
+            for query in REPORT_QUERIES:
+                reader.execute(query).fetchall()
+        report_seconds = time.perf_counter() - started
+    finally:
+        reader.close()
+
+    return {
+        'profile': profile,
+        'rows': rows,
+        'insert_seconds': insert_seconds,
+        'inserts_per_second': rows / insert_seconds if insert_seconds else 0,
+        'report_runs': report_runs,
+        'report_seconds': report_seconds,
+        'reports_per_second': report_runs * len(REPORT_QUERIES) / report_seconds if report_seconds else 0,
+    }
+
+def benchmark_profile(profile, rows=2000, report_runs=20, source_path=None):
+    """Замер профиля на временной копии рабочей базы"""
+    from config import Config
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'bench.db'
+        copy_database(source_path or Config.DB_PATH, path)
+        return run_workload(path, profile, rows, report_runs)
@@ -0,0 +1,157 @@
+import json
+from database.db_connection import DatabaseConnection, install_session_trigger
+
+# Отслеживаемые таблицы и их ключевые столбцы
+TRACKED_TABLES = {
+    'mining': ('mining_id',),
+    'costs': ('cost_id',),
+    'time_sheet': ('date', 'shift', 'tab_number'),
+    'limits': ('limit_id',),
+    'workers': ('tab_number',),
+}
+
+# Условие триггеров журнала и производных данных: служебная операция не ставила паузу
+CAPTURE_ENABLED = "NOT EXISTS (SELECT 1 FROM change_capture_pause)"
+
+SCHEMA = """
+-- Пауза журнала ставится и снимается внутри одной транзакции (DatabaseConnection.capture_suppressed)
+CREATE TABLE IF NOT EXISTS change_capture_pause (
+    paused INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    operation TEXT NOT NULL CHECK (operation IN ('I', 'U', 'D')),
+    row_key TEXT NOT NULL,
+    before_image TEXT,
+    after_image TEXT,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    changed_by TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_key);
+
+CREATE TRIGGER IF NOT EXISTS trg_change_log_append_only
+BEFORE UPDATE ON change_log
+BEGIN
+    SELECT RAISE(ABORT, 'Журнал изменений нельзя редактировать');
+END;
+"""
+
+def _json_object(prefix, columns):
+    return 'json_object({})'.format(
+        ', '.join(f"'{col}', {prefix}.{col}" for col in columns)
+    )
+
+def _changed_columns(columns):
+    # Образ "до" при изменении содержит только изменившиеся столбцы
+    parts = ' UNION ALL '.join(
+        f"SELECT '{col}' AS k, OLD.{col} AS v WHERE OLD.{col} IS NOT NEW.{col}"
+        for col in columns
+    )
+    return f'(SELECT json_group_object(k, v) FROM ({parts}))'
+
+def trigger_sql(table, columns):
+    """DDL триггеров журнала для одной таблицы"""
+    key_columns = TRACKED_TABLES[table]
+    new_key = 'json_array({})'.format(', '.join(f'NEW.{col}' for col in key_columns))
+    old_key = 'json_array({})'.format(', '.join(f'OLD.{col}' for col in key_columns))
+    changed = ' OR '.join(f'OLD.{col} IS NOT NEW.{col}' for col in columns)
+    key_changed = ' OR '.join(f'OLD.{col} IS NOT NEW.{col}' for col in key_columns)
+
+    return f"""
+    DROP TRIGGER IF EXISTS trg_{table}_log_insert;
+    CREATE TRIGGER trg_{table}_log_insert AFTER INSERT ON {table}
+    WHEN {CAPTURE_ENABLED}
+    BEGIN
+        INSERT INTO change_log (table_name, operation, row_key, after_image)
+        VALUES ('{table}', 'I', {new_key}, {_json_object('NEW', columns)});
+    END;
+
+    DROP TRIGGER IF EXISTS trg_{table}_log_update;
+    CREATE TRIGGER trg_{table}_log_update AFTER UPDATE ON {table}
+    WHEN {CAPTURE_ENABLED} AND NOT ({key_changed}) AND ({changed})
+    BEGIN
+        INSERT INTO change_log (table_name, operation, row_key, before_image, after_image)
+        VALUES ('{table}', 'U', {new_key}, {_changed_columns(columns)},
+                {_json_object('NEW', columns)});
+    END;
+
+    -- Изменение ключа записывается как удаление старой строки и добавление новой
+    DROP TRIGGER IF EXISTS trg_{table}_log_rekey;
+    CREATE TRIGGER trg_{table}_log_rekey AFTER UPDATE ON {table}
+    WHEN {CAPTURE_ENABLED} AND ({key_changed})
+    BEGIN
+        INSERT INTO change_log (table_name, operation, row_key, before_image)
+        VALUES ('{table}', 'D', {old_key}, {_json_object('OLD', columns)});
+        INSERT INTO change_log (table_name, operation, row_key, after_image)
+        VALUES ('{table}', 'I', {new_key}, {_json_object('NEW', columns)});
+    END;
+
+    DROP TRIGGER IF EXISTS trg_{table}_log_delete;
+    CREATE TRIGGER trg_{table}_log_delete AFTER DELETE ON {table}
+    WHEN {CAPTURE_ENABLED}
+    BEGIN
+        INSERT INTO change_log (table_name, operation, row_key, before_image)
+        VALUES ('{table}', 'D', {old_key}, {_json_object('OLD', columns)});
+    END;
+    """
+
+def ensure_schema(db=None):
+    """Создание журнала изменений и пересоздание триггеров по текущим столбцам"""
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    install_session_trigger(conn)
+
+    for table in TRACKED_TABLES:
+        columns = [row['name'] for row in db.fetch_all(f"PRAGMA table_info({table})")]
+        if columns:
+            conn.executescript(trigger_sql(table, columns))
+    conn.commit()
+
+def _decode(row):
+    row['row_key'] = json.loads(row['row_key'])
+    for column in ('before_image', 'after_image'):
+        if row[column] is not None:
+            row[column] = json.loads(row[column])
+    return row
+
+class ChangeLog:
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def current_seq(self):
+        """Номер последнего изменения"""
+        row = self.db.fetch_one("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_log")
+        return row['seq'] if row else 0
+
+    def changes_since(self, seq=0, tables=None, limit=None):
+        """Изменения с номером больше seq в порядке возрастания"""
+        query = "SELECT * FROM change_log WHERE seq > ?"
+        params = [seq]
+
+        if tables:
+            query += f" AND table_name IN ({', '.join(['?'] * len(tables))})"
+            params.extend(tables)
+
+        query += " ORDER BY seq"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return [_decode(row) for row in self.db.fetch_all(query, params)]
+
+    def row_history(self, table, *key):
+        """История изменений одной строки, ключ в порядке TRACKED_TABLES"""
+        query = """
+        SELECT * FROM change_log
+        WHERE table_name = ? AND row_key = json_array(?{})
+        ORDER BY seq
+        """.format(', ?' * (len(key) - 1))
+        return [_decode(row) for row in self.db.fetch_all(query, (table, *key))]
+
+    def purge_before(self, seq):
+        """Удаление старых записей журнала, уже переданных потребителям"""
+        self.db.execute_query("DELETE FROM change_log WHERE seq < ?", (seq,))
@@ -0,0 +1,177 @@
+from bisect import bisect_right
+from datetime import date
+from database.db_connection import DatabaseConnection
+
+# Дата, с которой действует цена, известная до ведения истории
+INITIAL_DATE = '1900-01-01'
+
+OPEN_END = '9999-12-31'
+
+def price_sql(mark_column, date_column):
+    """Подзапрос цены марки угля, действовавшей на дату
+
+    Поиск по первичному ключу (coal_mark, valid_from): одно обращение
+    к индексу на строку добычи.
+    """
+    return (f"(SELECT p.price FROM coal_prices p WHERE p.coal_mark = {mark_column} "
+            f"AND p.valid_from <= {date_column} ORDER BY p.valid_from DESC LIMIT 1)")
+
+# Цена на сегодня для сравнения в триггере справочника
+_TODAY_PRICE = price_sql('NEW.coal_mark', "date('now', 'localtime')")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS coal_prices (
+    coal_mark TEXT NOT NULL,
+    valid_from TEXT NOT NULL,
+    price REAL NOT NULL CHECK (price > 0),
+    PRIMARY KEY (coal_mark, valid_from)
+) WITHOUT ROWID;
+
+-- Добыча марки за период читается одним диапазоном индекса
+CREATE INDEX IF NOT EXISTS idx_mining_mark_date ON mining (coal_mark, mining_date);
+
+INSERT OR IGNORE INTO coal_prices (coal_mark, valid_from, price)
+SELECT coal_mark, '{INITIAL_DATE}', price_per_ton FROM coal WHERE price_per_ton IS NOT NULL;
+
+-- Новая марка: цена действует для всей ее добычи
+CREATE TRIGGER IF NOT EXISTS trg_coal_price_insert AFTER INSERT ON coal
+WHEN NEW.price_per_ton IS NOT NULL
+BEGIN
+    INSERT OR REPLACE INTO coal_prices (coal_mark, valid_from, price)
+    VALUES (NEW.coal_mark, '{INITIAL_DATE}', NEW.price_per_ton);
+END;
+
+-- Изменение цены в справочнике без даты начала действует с сегодняшнего дня
+CREATE TRIGGER IF NOT EXISTS trg_coal_price_update AFTER UPDATE OF price_per_ton ON coal
+WHEN NEW.price_per_ton IS NOT NULL AND NEW.price_per_ton IS NOT {_TODAY_PRICE}
+BEGIN
+    INSERT OR REPLACE INTO coal_prices (coal_mark, valid_from, price)
+    VALUES (NEW.coal_mark, date('now', 'localtime'), NEW.price_per_ton);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_coal_price_delete AFTER DELETE ON coal
+BEGIN
+    DELETE FROM coal_prices WHERE coal_mark = OLD.coal_mark;
+END;
+"""
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+# Интервалы действия цен [valid_from, valid_to)
+INTERVALS_SQL = f"""
+SELECT coal_mark, valid_from, price,
+       LEAD(valid_from, 1, '{OPEN_END}') OVER (PARTITION BY coal_mark ORDER BY valid_from) AS valid_to
+FROM coal_prices
+"""
+
+class CoalPriceHistory:
+    """История цен марок угля и оценка добычи по цене на дату"""
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def history(self, coal_mark):
+        return self.db.fetch_all(
+            "SELECT * FROM coal_prices WHERE coal_mark = ? ORDER BY valid_from DESC", (coal_mark,))
+
+    def set_price(self, coal_mark, valid_from, price):
+        """Цена марки с даты valid_from; справочник хранит цену на сегодня"""
+        today = date.today().isoformat()
+        with self.db.transaction() as conn:
+            conn.execute("""
+            INSERT INTO coal_prices (coal_mark, valid_from, price) VALUES (?, ?, ?)
+            ON CONFLICT (coal_mark, valid_from) DO UPDATE SET price = excluded.price
+            """, (coal_mark, valid_from, price))
+            conn.execute(
+                f"UPDATE coal SET price_per_ton = {price_sql('?', '?')} WHERE coal_mark = ?",
+                (coal_mark, today, coal_mark))
+        get_price_cache().invalidate()
+
+    def delete_price(self, coal_mark, valid_from):
+        if valid_from == INITIAL_DATE:
+            raise ValueError('Начальную цену марки удалить нельзя, ее можно только изменить')
+        today = date.today().isoformat()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM coal_prices WHERE coal_mark = ? AND valid_from = ?", (coal_mark, valid_from))
+            conn.execute(
+                f"UPDATE coal SET price_per_ton = {price_sql('?', '?')} WHERE coal_mark = ?",
+                (coal_mark, today, coal_mark))
+        get_price_cache().invalidate()
+
+    def valuation(self, date_from, date_to):
+        """Объем и стоимость добычи за период по маркам угля
+
+        Строки добычи соединяются с интервалами действия цен: для каждого
+        интервала читается один диапазон индекса (coal_mark, mining_date).
+        """
+        from database.archive import get_archive_manager
+
+        source = get_archive_manager().source('mining', date_from, date_to)
+        return self.db.fetch_all(f"""
+        WITH intervals AS ({INTERVALS_SQL})
+        SELECT m.coal_mark,
+               COUNT(*) AS records,
+               SUM(IFNULL(m.volume, 0)) AS volume,
+               SUM(IFNULL(m.volume, 0) * i.price) AS revenue
+        FROM intervals i
+        JOIN {source} m ON m.coal_mark = i.coal_mark
+             AND m.mining_date >= i.valid_from AND m.mining_date < i.valid_to
+        WHERE m.mining_date BETWEEN ? AND ?
+        GROUP BY m.coal_mark
+        ORDER BY m.coal_mark
+        """, (date_from, date_to))
+
+class PriceIntervalCache:
+    """Интервалы цен всех марок в памяти для форм
+
+    Цена на дату ищется двоичным поиском по датам начала действия.
+    Кэш перечитывается, когда меняется отпечаток таблицы цен.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+        self.signature = None
+        self.intervals = {}
+
+    def invalidate(self):
+        self.signature = None
+
+    def _signature(self):
+        row = self.db.fetch_one(
+            "SELECT COUNT(*) AS count, MAX(valid_from) AS last, TOTAL(price) AS total FROM coal_prices")
+        return tuple(row.values()) if row else None
+
+    def refresh(self):
+        signature = self._signature()
+        if signature == self.signature:
+            return
+        intervals = {}
+        for row in self.db.fetch_all("SELECT * FROM coal_prices ORDER BY coal_mark, valid_from"):
+            dates, prices = intervals.setdefault(row['coal_mark'], ([], []))
+            dates.append(row['valid_from'])
+            prices.append(row['price'])
+        self.intervals, self.signature = intervals, signature
+
+    def price(self, coal_mark, on_date):
+        """Цена на дату или None; перед серией вызовов нужен refresh()"""
+        dates, prices = self.intervals.get(coal_mark, ((), ()))
+        index = bisect_right(dates, on_date)
+        return prices[index - 1] if index else None
+
+_price_cache = None
+
+def get_price_cache():
+    """Общий кэш цен процесса"""
+    global _price_cache
+    if _price_cache is None:
+        _price_cache = PriceIntervalCache()
+    return _price_cache
+
+def reset_price_cache():
+    global _price_cache
+    _price_cache = None
@@ -0,0 +1,248 @@
+from datetime import date, timedelta
+from database.db_connection import DatabaseConnection
+from database.change_log import CAPTURE_ENABLED
+from database.coal_prices import price_sql
+
+# Уровни детализации: длина ключа периода (YYYY, YYYY-MM, YYYY-MM-DD)
+GRAINS = {'year': 4, 'month': 7, 'day': 10}
+
+# Измерения куба, кроме периода
+DIMENSIONS = ('section_id', 'coal_mark', 'shift')
+
+MEASURES = ('volume', 'rock_volume', 'revenue', 'shifts')
+
+def _table(grain):
+    return f'cube_mining_{grain}'
+
+SCHEMA = ''.join(f"""
+CREATE TABLE IF NOT EXISTS {_table(grain)} (
+    period TEXT NOT NULL,
+    section_id INTEGER NOT NULL,
+    coal_mark TEXT NOT NULL,
+    shift INTEGER NOT NULL,
+    volume REAL NOT NULL DEFAULT 0,
+    rock_volume REAL NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    shifts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, section_id, coal_mark, shift)
+) WITHOUT ROWID;
+""" for grain in GRAINS)
+
+def _revenue_sql(prefix):
+    # Стоимость по цене марки, действовавшей на дату добычи
+    price = price_sql(f'{prefix}.coal_mark', f'{prefix}.mining_date')
+    return f'IFNULL({prefix}.volume, 0) * IFNULL({price}, 0)'
+
+def _add_sql(grain, prefix):
+    period = f'substr({prefix}.mining_date, 1, {GRAINS[grain]})'
+    return f"""
+        INSERT INTO {_table(grain)} (period, section_id, coal_mark, shift, volume, rock_volume, revenue, shifts)
+        VALUES ({period}, {prefix}.section_id, {prefix}.coal_mark, IFNULL({prefix}.shift, 0),
+                IFNULL({prefix}.volume, 0), IFNULL({prefix}.rock_volume, 0),
+                {_revenue_sql(prefix)}, 1)
+        ON CONFLICT (period, section_id, coal_mark, shift) DO UPDATE SET
+            volume = volume + excluded.volume,
+            rock_volume = rock_volume + excluded.rock_volume,
+            revenue = revenue + excluded.revenue,
+            shifts = shifts + 1;"""
+
+def _subtract_sql(grain, prefix):
+    period = f'substr({prefix}.mining_date, 1, {GRAINS[grain]})'
+    condition = (f"period = {period} AND section_id = {prefix}.section_id "
+                 f"AND coal_mark = {prefix}.coal_mark AND shift = IFNULL({prefix}.shift, 0)")
+    return f"""
+        UPDATE {_table(grain)} SET
+            volume = volume - IFNULL({prefix}.volume, 0),
+            rock_volume = rock_volume - IFNULL({prefix}.rock_volume, 0),
+            revenue = revenue - {_revenue_sql(prefix)},
+            shifts = shifts - 1
+        WHERE {condition};
+        DELETE FROM {_table(grain)} WHERE {condition} AND shifts <= 0;"""
+
+def _reprice_sql(prefix):
+    """Пересчет стоимости марки в кубе начиная с даты измененной цены
+
+    Дневной уровень пересчитывается по цене на день, месяцы и годы -
+    суммированием нижнего уровня.
+    """
+    day, month, year = _table('day'), _table('month'), _table('year')
+    same_cell = "d.section_id = {0}.section_id AND d.coal_mark = {0}.coal_mark AND d.shift = {0}.shift"
+    return f"""
+        UPDATE {day} SET revenue = volume * IFNULL({price_sql(f'{day}.coal_mark', f'{day}.period')}, 0)
+        WHERE coal_mark = {prefix}.coal_mark AND period >= {prefix}.valid_from;
+        UPDATE {month} SET revenue = (
+            SELECT TOTAL(d.revenue) FROM {day} d
+            WHERE d.period BETWEEN {month}.period || '-01' AND {month}.period || '-31'
+              AND {same_cell.format(month)})
+        WHERE coal_mark = {prefix}.coal_mark AND period >= substr({prefix}.valid_from, 1, 7);
+        UPDATE {year} SET revenue = (
+            SELECT TOTAL(d.revenue) FROM {month} d
+            WHERE d.period BETWEEN {year}.period || '-01' AND {year}.period || '-12'
+              AND {same_cell.format(year)})
+        WHERE coal_mark = {prefix}.coal_mark AND period >= substr({prefix}.valid_from, 1, 4);"""
+
+def trigger_sql():
+    """DDL триггеров, поддерживающих куб при изменении добычи
+
+    Как и журнал изменений, триггеры отключаются на время архивирования:
+    строки закрытых лет остаются в кубе после переноса в архив.
+    """
+    add_new = ''.join(_add_sql(grain, 'NEW') for grain in GRAINS)
+    subtract_old = ''.join(_subtract_sql(grain, 'OLD') for grain in GRAINS)
+
+    return f"""
+    DROP TRIGGER IF EXISTS trg_mining_cube_insert;
+    CREATE TRIGGER trg_mining_cube_insert AFTER INSERT ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{add_new}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_mining_cube_update;
+    CREATE TRIGGER trg_mining_cube_update
+    AFTER UPDATE OF mining_date, shift, volume, coal_mark, section_id, rock_volume ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{subtract_old}{add_new}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_mining_cube_delete;
+    CREATE TRIGGER trg_mining_cube_delete AFTER DELETE ON mining
+    WHEN {CAPTURE_ENABLED}
+    BEGIN{subtract_old}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_coal_cube_price;
+
+    DROP TRIGGER IF EXISTS trg_coal_prices_cube_insert;
+    CREATE TRIGGER trg_coal_prices_cube_insert AFTER INSERT ON coal_prices
+    BEGIN{_reprice_sql('NEW')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_coal_prices_cube_update;
+    CREATE TRIGGER trg_coal_prices_cube_update AFTER UPDATE ON coal_prices
+    BEGIN{_reprice_sql('OLD')}{_reprice_sql('NEW')}
+    END;
+
+    DROP TRIGGER IF EXISTS trg_coal_prices_cube_delete;
+    CREATE TRIGGER trg_coal_prices_cube_delete AFTER DELETE ON coal_prices
+    BEGIN{_reprice_sql('OLD')}
+    END;
+    """
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    created = not db.table_exists(_table('day'))
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.executescript(trigger_sql())
+    conn.commit()
+    # Существующая добыча попадает в куб один раз, дальше его ведут триггеры
+    if created:
+        ProductionCube(db).rebuild()
+
+def decompose(date_from, date_to, coarsest='year'):
+    """Разбиение периода на годы, месяцы и дни: [(уровень, с, по), ...]
+
+    Используются только уровни не крупнее coarsest, крупные блоки берутся,
+    когда они целиком входят в период.
+    """
+    allowed = list(GRAINS)[list(GRAINS).index(coarsest):]
+    current, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    parts = []
+
+    while current <= end:
+        year_end = date(current.year, 12, 31)
+        next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if 'year' in allowed and (current.month, current.day) == (1, 1) and year_end <= end:
+            block, block_end = ('year', str(current.year)), year_end
+        elif 'month' in allowed and current.day == 1 and next_month - timedelta(days=1) <= end:
+            block, block_end = ('month', current.isoformat()[:7]), next_month - timedelta(days=1)
+        else:
+            block, block_end = ('day', current.isoformat()), current
+
+        grain, key = block
+        # Соседние блоки одного уровня объединяются в диапазон
+        if parts and parts[-1][0] == grain:
+            parts[-1] = (grain, parts[-1][1], key)
+        else:
+            parts.append((grain, key, key))
+        current = block_end + timedelta(days=1)
+
+    return parts
+
+class ProductionCube:
+    """Предагрегированная добыча: год/месяц/день × участок × марка × смена
+
+    Запрос обслуживается самыми крупными уровнями, которые покрывают
+    период целиком, поэтому читаются сотни строк вместо исходных записей.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def rebuild(self):
+        """Пересчет куба по рабочей базе и архивам"""
+        from database.archive import get_archive_manager
+
+        source = get_archive_manager().source('mining', '0000-01-01', '9999-12-31')
+        with self.db.transaction() as conn:
+            for grain, length in GRAINS.items():
+                conn.execute(f"DELETE FROM {_table(grain)}")
+                conn.execute(f"""
+                INSERT INTO {_table(grain)} (period, section_id, coal_mark, shift, volume, rock_volume, revenue, shifts)
+                SELECT substr(m.mining_date, 1, {length}), m.section_id, m.coal_mark, IFNULL(m.shift, 0),
+                       SUM(IFNULL(m.volume, 0)), SUM(IFNULL(m.rock_volume, 0)),
+                       SUM({_revenue_sql('m')}), COUNT(*)
+                FROM {source} m
+                GROUP BY 1, 2, 3, 4
+                """)
+
+    def query(self, date_from=None, date_to=None, group_by=(), period=None, **filters):
+        """Сумма показателей за период с группировкой
+
+        group_by - измерения из DIMENSIONS, period - 'year', 'month', 'day'
+        или None (без разбивки по времени), filters - равенство по измерениям.
+        """
+        unknown = [name for name in (*group_by, *filters) if name not in DIMENSIONS]
+        if unknown or (period and period not in GRAINS):
+            raise ValueError(f'Неизвестное измерение куба: {", ".join(unknown) or period}')
+
+        # Разбивка по месяцам не может читать годовой уровень и т.д.
+        coarsest = period or 'year'
+        if date_from or date_to:
+            parts = decompose(date_from or '1900-01-01', date_to or date.today().isoformat(), coarsest)
+        else:
+            parts = [(coarsest, None, None)]
+
+        columns = list(group_by)
+        if period:
+            columns.insert(0, 'period')
+
+        selects, params = [], []
+        for grain, start, end in parts:
+            conditions = []
+            if start is not None:
+                conditions.append('period BETWEEN ? AND ?')
+                params += [start, end]
+            for name, value in filters.items():
+                conditions.append(f'{name} = ?')
+                params.append(value)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            period_expr = f'substr(period, 1, {GRAINS[period]}) AS period, ' if period else ''
+            selects.append(
+                f"SELECT {period_expr}{''.join(f'{name}, ' for name in group_by)}"
+                f"{', '.join(MEASURES)} FROM {_table(grain)} {where}"
+            )
+
+        dimensions = ', '.join(columns)
+        query = (
+            f"SELECT {dimensions + ', ' if dimensions else ''}"
+            + ', '.join(f'COALESCE(SUM({measure}), 0) AS {measure}' for measure in MEASURES)
+            + f" FROM ({' UNION ALL '.join(selects)})"
+            + (f" GROUP BY {dimensions} ORDER BY {dimensions}" if dimensions else '')
+        )
+        return self.db.fetch_all(query, params)
+
+    def totals(self, date_from=None, date_to=None, **filters):
+        """Итоги за период: объем, порода, стоимость и число смен"""
+        rows = self.query(date_from, date_to, **filters)
+        return rows[0] if rows else dict.fromkeys(MEASURES, 0)
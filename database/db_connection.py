@@ -1,23 +1,137 @@
 import sqlite3
+import getpass
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import traceback
+from database.profiler import get_profiler, profiled_query
+
+class Session(threading.local):
+    """Пользователь, которого временный триггер соединения записывает в журнал
+    изменений. Значение свое у каждого потока: поток записи сервера подставляет
+    автора заявки, не затрагивая соединения окна."""
+    user = getpass.getuser()
+
+session = Session()
+
+# Понятные сообщения для нарушений ограничений схемы (по началу текста ошибки SQLite)
+CONSTRAINT_MESSAGES = [
+    ('UNIQUE constraint failed: time_sheet',
+     'Уже есть запись для этого работника на эту дату и смену'),
+    ('UNIQUE constraint failed: limits',
+     'Для этого участка уже установлен лимит на указанный месяц и год'),
+    ('NOT NULL constraint failed: time_sheet.section_id', 'Работник не найден'),
+    ('CHECK constraint failed: hours', 'Количество часов должно быть больше 0 и не более 12'),
+    ('CHECK constraint failed: month', 'Месяц должен быть от 1 до 12'),
+    ('CHECK constraint failed: year', 'Год должен быть от 2000 до 2100'),
+    ('FOREIGN KEY constraint failed', 'Связанная запись не найдена'),
+    ('Дата относится к архивному году', 'Дата относится к архивному году, записи этого года не изменяются'),
+]
+
+def constraint_message(error):
+    """Сообщение для пользователя по ошибке ограничения или None"""
+    if not isinstance(error, sqlite3.IntegrityError):
+        return None
+    text = str(error)
+    for prefix, message in CONSTRAINT_MESSAGES:
+        if text.startswith(prefix):
+            return message
+    return None
+
+PROFILE_PRAGMAS = ('synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+def profile_settings(role='writer', profile=None):
+    """Настройки PRAGMA профиля производительности для роли соединения"""
+    from config import Config
+    name = profile or Config.DB_PROFILE
+    if name not in Config.DB_PROFILES:
+        raise ValueError(f'Неизвестный профиль базы данных: {name}')
+    return Config.DB_PROFILES[name][role]
+
+def apply_profile(connection, role='writer', profile=None):
+    settings = profile_settings(role, profile)
+    for pragma in PROFILE_PRAGMAS:
+        if pragma in settings:
+            connection.execute(f"PRAGMA {pragma} = {settings[pragma]}").fetchall()
+    return connection
+
+def register_functions(connection):
+    """Функции программы, доступные в запросах соединения"""
+    connection.create_function('app_user', 0, lambda: session.user)
+
+# Постоянные триггеры журнала не вызывают функций программы и пишут автора NULL,
+# поэтому в базу можно писать из любого клиента SQLite. Соединения программы
+# подменяют такую запись копией с пользователем сеанса.
+SESSION_TRIGGER = """
+CREATE TEMP TRIGGER IF NOT EXISTS trg_change_log_user
+BEFORE INSERT ON main.change_log
+WHEN NEW.changed_by IS NULL
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key, before_image, after_image, changed_at, changed_by)
+    VALUES (NEW.table_name, NEW.operation, NEW.row_key, NEW.before_image, NEW.after_image,
+            NEW.changed_at, app_user());
+    SELECT RAISE(IGNORE);
+END
+"""
+
+def install_session_trigger(connection):
+    """Временный триггер автора изменений, если в базе уже есть журнал"""
+    if connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'").fetchone():
+        connection.execute(SESSION_TRIGGER)
+
+def configure_connection(connection, role='writer', profile=None):
+    """Общая настройка любого соединения приложения с базой"""
+    apply_profile(connection, role, profile)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.row_factory = sqlite3.Row
+    register_functions(connection)
+    install_session_trigger(connection)
+    return connection
+
+def open_connection(role='writer', profile=None, path=None, **kwargs):
+    """Отдельное соединение с настройками профиля (для отчетов, сервера, замеров)"""
+    from config import Config
+    return configure_connection(sqlite3.connect(path or Config.DB_PATH, **kwargs), role, profile)
+
+def open_readonly(path=None, profile=None, **kwargs):
+    """Соединение только для чтения: файл открыт в режиме ro, запись невозможна
+
+    Настройки берутся из профиля читателя.
+    """
+    from config import Config
+    uri = f"{Path(path or Config.DB_PATH).resolve().as_uri()}?mode=ro"
+    connection = sqlite3.connect(uri, uri=True, **kwargs)
+    settings = profile_settings('reader', profile)
+    for pragma in PROFILE_PRAGMAS:
+        if pragma in settings:
+            connection.execute(f"PRAGMA {pragma} = {settings[pragma]}").fetchall()
+    connection.execute("PRAGMA query_only = ON")
+    connection.row_factory = sqlite3.Row
+    # Без функций триггеров запрос на изменение не скомпилируется и не дойдет до запрета записи
+    register_functions(connection)
+    return connection
 
 class DatabaseConnection:
     _instance = None
+    # Работа через HTTP API сервера (см. database.remote)
+    remote = False
     
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.connection = None
-        return cls._instance
+        if DatabaseConnection._instance is None:
+            from config import Config
+            if Config.API_URL:
+                from database.remote import RemoteDatabaseConnection
+                cls = RemoteDatabaseConnection
+            instance = object.__new__(cls)
+            instance.connection = None
+            DatabaseConnection._instance = instance
+        return DatabaseConnection._instance
     
     def connect(self):
         """Подключение к базе данных SQLite"""
         try:
-            from config import Config
-            self.connection = sqlite3.connect(Config.DB_PATH)
-            self.connection.execute("PRAGMA foreign_keys = ON")
-            self.connection.row_factory = sqlite3.Row
+            self.connection = open_connection('writer')
             return self.connection
         except Exception as e:
             print(f"Ошибка подключения к базе данных: {e}")
@@ -29,11 +143,54 @@ class DatabaseConnection:
         return self.connection
     
     def close(self):
+        from database.writer import close_write_queue
+        close_write_queue()
         if self.connection:
             self.connection.close()
             self.connection = None
     
+    @contextmanager
+    def transaction(self):
+        """Выполнение нескольких запросов в одной транзакции"""
+        conn = self.get_connection()
+        try:
+            with get_profiler().sql_block(conn):
+                yield conn
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    @contextmanager
+    def capture_suppressed(self):
+        """Транзакция служебной массовой операции без журнала изменений
+
+        Отметка в change_capture_pause видна только внутри этой транзакции:
+        записи других соединений и потоков журналируются как обычно.
+        """
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO change_capture_pause DEFAULT VALUES")
+            yield conn
+            conn.execute("DELETE FROM change_capture_pause")
+    
+    def max_variables(self):
+        """Максимальное число параметров в одном запросе"""
+        conn = self.get_connection()
+        if hasattr(conn, 'getlimit'):
+            return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        return 999
+    
+    def _queued(self):
+        """Запись идет через общую очередь, если она включена и нет открытой транзакции"""
+        from config import Config
+        return Config.WRITE_QUEUE and not self.get_connection().in_transaction
+    
+    @profiled_query
     def execute_query(self, query, params=None):
+        if self._queued():
+            from database.writer import get_write_queue, WriteResult
+            return WriteResult(get_write_queue().execute(query, params))
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
@@ -49,6 +206,30 @@ class DatabaseConnection:
         finally:
             cursor.close()
     
+    @profiled_query
+    def execute_returning(self, query, params=None):
+        """Выполнение запроса с RETURNING: строки читаются до фиксации"""
+        if self._queued():
+            from database.writer import get_write_queue
+            return get_write_queue().execute(query, params)['rows']
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            result = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+            return result
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise e
+        finally:
+            cursor.close()
+    
+    @profiled_query
     def fetch_all(self, query, params=None):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -65,6 +246,7 @@ class DatabaseConnection:
         finally:
             cursor.close()
     
+    @profiled_query
     def fetch_one(self, query, params=None):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -81,6 +263,18 @@ class DatabaseConnection:
         finally:
             cursor.close()
     
+    @profiled_query
+    def fetch_tuples(self, query, params=None):
+        """Строки запроса кортежами без словаря на каждую строку; ошибки не перехватываются"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(query, params or ())
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
     def table_exists(self, table_name):
         query = """
         SELECT name FROM sqlite_master 
@@ -0,0 +1,175 @@
+import csv
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from database.db_connection import DatabaseConnection
+from database.change_log import ChangeLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS export_checkpoints (
+    consumer TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+"""
+
+FORMATS = ('csv', 'jsonl')
+
+# Размер страницы при чтении журнала изменений
+PAGE_SIZE = 5000
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+def collapse_changes(changes):
+    """Свертка изменений до итогового состояния каждой строки
+
+    Строка, добавленная и удаленная внутри периода, не выгружается вовсе,
+    добавленная и затем измененная выгружается как добавление,
+    удаленная и добавленная заново - как изменение.
+    """
+    result = {}
+    for change in changes:
+        key = (change['table_name'], json.dumps(change['row_key']))
+        previous = result.get(key)
+
+        operation = change['operation']
+        if previous is not None and previous['operation'] == 'I':
+            if operation == 'D':
+                del result[key]
+                continue
+            operation = 'I'
+        elif previous is not None and previous['operation'] == 'D' and operation == 'I':
+            # Строка удалена и добавлена заново: для получателя это изменение
+            operation = 'U'
+
+        result[key] = {
+            'seq': change['seq'],
+            'table_name': change['table_name'],
+            'operation': operation,
+            'changed_at': change['changed_at'],
+            'row_key': change['row_key'],
+            'data': change['before_image'] if operation == 'D' else change['after_image'],
+        }
+
+    return sorted(result.values(), key=lambda row: row['seq'])
+
+class DeltaExporter:
+    def __init__(self, consumer='accounting', db=None):
+        self.consumer = consumer
+        self.db = db or DatabaseConnection()
+        self.change_log = ChangeLog(self.db)
+
+    def checkpoint_name(self, tables=None):
+        """Имя контрольной точки: у выгрузки части таблиц своя точка
+
+        Общая точка получателя сдвигается только полной выгрузкой, иначе
+        пропущенные изменения других таблиц не попали бы в следующую.
+        """
+        if not tables:
+            return self.consumer
+        return f"{self.consumer}:{','.join(sorted(tables))}"
+
+    def checkpoint(self, tables=None):
+        """Номер последнего выгруженного изменения"""
+        row = self.db.fetch_one(
+            "SELECT last_seq FROM export_checkpoints WHERE consumer = ?",
+            (self.checkpoint_name(tables),)
+        )
+        return row['last_seq'] if row else 0
+
+    def set_checkpoint(self, seq, tables=None):
+        self.db.execute_query("""
+        INSERT INTO export_checkpoints (consumer, last_seq, updated_at)
+        VALUES (?, ?, datetime('now'))
+        ON CONFLICT(consumer) DO UPDATE SET
+            last_seq = excluded.last_seq,
+            updated_at = excluded.updated_at
+        """, (self.checkpoint_name(tables), seq))
+
+    def pending_count(self):
+        row = self.db.fetch_one(
+            "SELECT COUNT(*) AS count FROM change_log WHERE seq > ?",
+            (self.checkpoint(),)
+        )
+        return row['count'] if row else 0
+
+    def read_changes(self, tables=None):
+        """Все изменения после контрольной точки, постранично"""
+        seq = self.checkpoint(tables)
+        changes = []
+        while True:
+            page = self.change_log.changes_since(seq, tables, PAGE_SIZE)
+            if not page:
+                break
+            changes.extend(page)
+            seq = page[-1]['seq']
+        return changes
+
+    def export(self, fmt='csv', directory=None, tables=None):
+        """Выгрузка изменений после контрольной точки
+
+        Возвращает (список файлов, число строк, новая контрольная точка) или
+        None, если выгружать нечего. Контрольная точка сдвигается только после
+        успешной записи всех файлов.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
+
+        from config import Config
+        directory = Path(directory or Config.REPORTS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        changes = self.read_changes(tables)
+        if not changes:
+            return None
+
+        last_seq = changes[-1]['seq']
+        rows = collapse_changes(changes)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if fmt == 'jsonl':
+            path = directory / f"delta_{self.consumer}_{timestamp}.jsonl"
+            files = [self._write_jsonl(path, rows)]
+        else:
+            files = []
+            for table_name in sorted({row['table_name'] for row in rows}):
+                path = directory / f"delta_{self.consumer}_{table_name}_{timestamp}.csv"
+                table_rows = [row for row in rows if row['table_name'] == table_name]
+                files.append(self._write_csv(path, table_rows))
+
+        self.set_checkpoint(last_seq, tables)
+        return files, len(rows), last_seq
+
+    def _write_jsonl(self, path, rows):
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+        os.replace(tmp_path, path)
+        return path
+
+    def _write_csv(self, path, rows):
+        columns = []
+        for row in rows:
+            for column in row['data'] or {}:
+                if column not in columns:
+                    columns.append(column)
+
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['seq', 'operation', 'changed_at'] + columns)
+            for row in rows:
+                data = row['data'] or {}
+                writer.writerow(
+                    [row['seq'], row['operation'], row['changed_at']]
+                    + [data.get(column, '') for column in columns]
+                )
+        os.replace(tmp_path, path)
+        return path
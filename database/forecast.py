@@ -0,0 +1,200 @@
+import calendar
+from datetime import date, timedelta
+import numpy as np
+from config import Config
+from database.db_connection import DatabaseConnection
+from database.kpi import KpiEngine
+
+# Прогнозируемые показатели: столбец суточного среза -> столбцы плана и факта в limits
+FORECAST_MEASURES = {
+    'volume': ('plan_production', 'actual_production'),
+    'rock_volume': ('plan_rock', 'actual_rock'),
+    'electricity': ('plan_electricity', 'actual_electricity'),
+    'fuel': ('plan_fuel', 'actual_fuel'),
+}
+
+MEASURE_NAMES = {
+    'volume': 'Добыча, т',
+    'rock_volume': 'Порода, т',
+    'electricity': 'Электроэнергия, кВт·ч',
+    'fuel': 'Топливо, л',
+}
+
+def month_range(year, month):
+    last = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last)
+
+def simulate(actual, history, counts, remaining, sims, seed):
+    """Итоги месяца по участкам методом Монте-Карло
+
+    actual - факт с начала месяца (участки x показатели), history - смены
+    всех участков подряд (смены x показатели), counts - число смен участка
+    в history, remaining - число оставшихся смен участка. Для каждого
+    участка и прогона остаток месяца набирается из случайно выбранных
+    прошлых смен этого участка; все участки считаются одной выборкой
+    индексов. Возвращает массив итогов (участки x прогоны x показатели).
+    """
+    sections, measures = actual.shape
+    width = int(remaining.max()) if sections else 0
+    totals = np.repeat(actual[:, None, :], sims, axis=1)
+    if width == 0:
+        return totals
+
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rng = np.random.default_rng(seed)
+    index = (rng.random((sections, sims, width)) * counts[:, None, None]).astype(np.intp)
+    index += offsets[:, None, None]
+    # Смены сверх остатка участка указывают на нулевую строку в конце истории
+    padded = np.vstack((history, np.zeros((1, measures))))
+    beyond = np.arange(width) >= remaining[:, None]
+    index = np.where(beyond[:, None, :], len(history), index)
+
+    for m in range(measures):
+        totals[:, :, m] += padded[index, m].sum(axis=2)
+    return totals
+
+class ForecastEngine:
+    """Прогноз выполнения месячных лимитов по участкам
+
+    Факт с начала месяца и прошлые смены берутся из суточного среза
+    показателей. Прогноз по темпу продлевает среднесуточный факт на весь
+    месяц, имитация Монте-Карло дает распределение итога месяца и
+    доверительный интервал. Результат кэшируется до следующей записи
+    в журнале изменений, так что после каждой сохраненной смены прогноз
+    пересчитывается заново.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+        self.kpi = KpiEngine(self.db)
+        self._cache = {}
+
+    def _current_seq(self):
+        row = self.db.fetch_one("SELECT IFNULL(MAX(seq), 0) AS seq FROM change_log")
+        return row['seq'] if row else 0
+
+    def forecast(self, year, month, as_of=None, sims=None):
+        """Прогноз на конец месяца для каждого участка"""
+        as_of = as_of or date.today()
+        sims = sims or Config.FORECAST_SIMULATIONS
+        seq = self._current_seq()
+        key = (year, month, as_of, sims)
+        cached = self._cache.get(key)
+        if cached and cached[0] == seq:
+            return cached[1]
+
+        self.kpi.refresh()
+        result = self._calculate(year, month, as_of, sims, seq)
+        self._cache = {key: (seq, result)}
+        return result
+
+    def _calculate(self, year, month, as_of, sims, seq):
+        month_start, month_end = month_range(year, month)
+        days_in_month = month_end.day
+        through = min(as_of, month_end)
+        measures = list(FORECAST_MEASURES)
+
+        sections = self.db.fetch_all(f"""
+        SELECT s.section_id, s.section_name,
+               {', '.join(f'l.{plan}' for plan, _ in FORECAST_MEASURES.values())}
+        FROM sections s
+        LEFT JOIN limits l ON l.section_id = s.section_id AND l.year = ? AND l.month = ?
+        ORDER BY s.section_name
+        """, (year, month))
+        if not sections:
+            return []
+        positions = {row['section_id']: i for i, row in enumerate(sections)}
+
+        # Факт с начала месяца и последний день, за который он внесен
+        actual = np.zeros((len(sections), len(measures)))
+        last_day = [None] * len(sections)
+        for row in self.db.fetch_all(f"""
+        SELECT section_id, MAX(day) AS last_day,
+               {', '.join(f'TOTAL({name}) AS {name}' for name in measures)}
+        FROM kpi_daily
+        WHERE day BETWEEN ? AND ?
+        GROUP BY section_id
+        """, (month_start.isoformat(), through.isoformat())):
+            i = positions.get(row['section_id'])
+            if i is None:
+                continue
+            actual[i] = [row[name] for name in measures]
+            last_day[i] = date.fromisoformat(row['last_day'])
+
+        # Прошлые смены участков за окно истории
+        history_from = through - timedelta(days=Config.FORECAST_HISTORY_DAYS)
+        rows = self.db.fetch_all(f"""
+        SELECT section_id, day, {', '.join(measures)}
+        FROM kpi_daily
+        WHERE day > ? AND day <= ?
+        ORDER BY section_id, day
+        """, (history_from.isoformat(), through.isoformat()))
+        rows = [row for row in rows if row['section_id'] in positions]
+        rows.sort(key=lambda row: positions[row['section_id']])
+        history = np.array([[row[name] for name in measures] for row in rows],
+                           dtype=float).reshape(len(rows), len(measures))
+
+        counts = np.zeros(len(sections), dtype=np.intp)
+        first_seen = [None] * len(sections)
+        last_seen = [None] * len(sections)
+        for row in rows:
+            i = positions[row['section_id']]
+            counts[i] += 1
+            first_seen[i] = first_seen[i] or row['day']
+            last_seen[i] = row['day']
+
+        # Оставшиеся смены: дни после последнего внесенного, по среднему числу смен в сутки
+        remaining = np.zeros(len(sections), dtype=np.intp)
+        remaining_days = [0] * len(sections)
+        for i in range(len(sections)):
+            if as_of >= month_end or not counts[i]:
+                continue
+            covered = last_day[i] or month_start - timedelta(days=1)
+            remaining_days[i] = (month_end - covered).days
+            span = (date.fromisoformat(last_seen[i]) - date.fromisoformat(first_seen[i])).days + 1
+            remaining[i] = round(counts[i] / span * remaining_days[i])
+
+        totals = simulate(actual, history, counts, remaining, sims, [year, month, seq])
+        low, median, high = np.percentile(totals, Config.FORECAST_QUANTILES, axis=1)
+        mean = totals.mean(axis=1)
+
+        result = []
+        for i, section in enumerate(sections):
+            covered_days = (last_day[i] - month_start).days + 1 if last_day[i] else 0
+            item = {
+                'section_id': section['section_id'],
+                'section_name': section['section_name'],
+                'covered_days': covered_days,
+                'remaining_days': remaining_days[i],
+                'remaining_shifts': int(remaining[i]),
+                'history_shifts': int(counts[i]),
+                'measures': {},
+            }
+            for m, name in enumerate(measures):
+                plan = section[FORECAST_MEASURES[name][0]]
+                item['measures'][name] = {
+                    'plan': plan,
+                    'actual': float(actual[i, m]),
+                    'run_rate': float(actual[i, m] / covered_days * days_in_month) if covered_days else None,
+                    'mean': float(mean[i, m]),
+                    'low': float(low[i, m]),
+                    'median': float(median[i, m]),
+                    'high': float(high[i, m]),
+                    # Доля прогонов, в которых итог месяца превышает план
+                    'over_plan': float((totals[i, :, m] > plan).mean()) if plan else None,
+                }
+            result.append(item)
+        return result
+
+_forecast_engine = None
+
+def get_forecast_engine():
+    """Общий движок прогноза процесса"""
+    global _forecast_engine
+    if _forecast_engine is None:
+        _forecast_engine = ForecastEngine()
+    return _forecast_engine
+
+def reset_forecast_engine():
+    global _forecast_engine
+    _forecast_engine = None
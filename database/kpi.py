@@ -0,0 +1,209 @@
+from database.db_connection import DatabaseConnection
+from database.archive import ARCHIVED_TABLES
+from database.tariffs import tariff_sql
+
+# Показатели каждой таблицы фактов в суточном срезе: столбец среза -> выражение
+FACT_MEASURES = {
+    'mining': {'volume': 'IFNULL(volume, 0)', 'rock_volume': 'IFNULL(rock_volume, 0)'},
+    'time_sheet': {'man_hours': 'IFNULL(hours, 0)', 'man_shifts': '1'},
+    'costs': {'electricity': 'IFNULL(electricity, 0)', 'fuel': 'IFNULL(fuel, 0)'},
+}
+
+MEASURES = tuple(name for measures in FACT_MEASURES.values() for name in measures)
+
+# Длина ключа периода при группировке
+PERIODS = {'year': 4, 'month': 7, 'day': 10}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS kpi_daily (
+    day TEXT NOT NULL,
+    section_id INTEGER NOT NULL,
+    shift INTEGER NOT NULL,
+    {''.join(f'{name} REAL NOT NULL DEFAULT 0, ' for name in MEASURES)}
+    PRIMARY KEY (day, section_id, shift)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS kpi_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_seq INTEGER NOT NULL,
+    refreshed_at TEXT
+);
+
+-- Покрывающие индексы: пересчет суток читает только индекс, без строк таблиц
+CREATE INDEX IF NOT EXISTS idx_mining_kpi ON mining (mining_date, section_id, shift, volume, rock_volume);
+CREATE INDEX IF NOT EXISTS idx_time_sheet_kpi ON time_sheet (date, section_id, shift, hours);
+CREATE INDEX IF NOT EXISTS idx_costs_kpi ON costs (cost_date, section_id, shift, electricity, fuel);
+-- Индекс по дате затрат покрывается idx_costs_kpi
+DROP INDEX IF EXISTS idx_costs_date;
+"""
+
+def _facts_sql(sources, condition=None):
+    """Строки всех таблиц фактов с общим ключом (сутки, участок, смена)
+
+    Каждая таблица дает свои показатели и нули в чужих столбцах;
+    после группировки это полное внешнее соединение трех таблиц
+    по ключу без размножения строк.
+    """
+    parts = []
+    for table, measures in FACT_MEASURES.items():
+        date_column = ARCHIVED_TABLES[table]
+        values = ', '.join(f"{measures.get(name, '0')} AS {name}" for name in MEASURES)
+        where = f"WHERE ({date_column}, section_id) IN ({condition})" if condition else ''
+        parts.append(
+            f"SELECT {date_column} AS day, section_id, IFNULL(shift, 0) AS shift, {values} "
+            f"FROM {sources.get(table, table)} {where}"
+        )
+    return f"""
+    INSERT INTO kpi_daily (day, section_id, shift, {', '.join(MEASURES)})
+    SELECT day, section_id, shift, {', '.join(f'TOTAL({name})' for name in MEASURES)}
+    FROM ({' UNION ALL '.join(parts)})
+    GROUP BY day, section_id, shift
+    """
+
+def _dirty_sql():
+    """Сутки и участки, затронутые изменениями после последнего пересчета
+
+    Берется состояние строки после изменения и до него: образ "до"
+    при изменении содержит только изменившиеся столбцы. Сутки архивных
+    лет не пересчитываются: их строк нет в рабочих таблицах, а срез
+    догоняется перед переносом года в архив.
+    """
+    images = ('after_image', 'COALESCE(json_patch(after_image, before_image), before_image)')
+    parts = [
+        f"SELECT json_extract({image}, '$.{ARCHIVED_TABLES[table]}') AS day, "
+        f"json_extract({image}, '$.section_id') AS section_id "
+        f"FROM change_log WHERE table_name = '{table}' AND seq > (SELECT last_seq FROM kpi_state)"
+        for table in FACT_MEASURES for image in images
+    ]
+    return (f"SELECT day, section_id FROM ({' UNION '.join(parts)}) "
+            f"WHERE day IS NOT NULL "
+            f"AND CAST(substr(day, 1, 4) AS INTEGER) NOT IN (SELECT year FROM archive_years)")
+
+_MARK_REFRESHED = """
+INSERT OR REPLACE INTO kpi_state (id, last_seq, refreshed_at)
+VALUES (1, (SELECT IFNULL(MAX(seq), 0) FROM change_log), datetime('now', 'localtime'))
+"""
+
+# Состояние среза и журнала изменений для выбора способа обновления
+STATE_SQL = """
+SELECT (SELECT last_seq FROM kpi_state) AS last_seq,
+       (SELECT MIN(seq) FROM change_log) AS oldest,
+       (SELECT MAX(seq) FROM change_log) AS current
+"""
+
+def needs_rebuild(state):
+    """Срез нельзя догнать по журналу: он пуст, база восстановлена или журнал очищен"""
+    last_seq = state['last_seq']
+    if last_seq is None:
+        return True
+    if (state['current'] or 0) < last_seq:
+        return True
+    return state['oldest'] is not None and state['oldest'] > last_seq + 1
+
+def refresh_statements(rebuild=False):
+    """Запросы обновления среза, выполняемые в одной транзакции
+
+    Архивные годы при пересчете не трогаются: их строк нет в рабочих
+    таблицах, а срез сохраняет их с момента переноса в архив.
+    """
+    if rebuild:
+        return [
+            "DELETE FROM kpi_daily WHERE CAST(substr(day, 1, 4) AS INTEGER) NOT IN "
+            "(SELECT year FROM archive_years)",
+            _facts_sql({}),
+            _MARK_REFRESHED,
+        ]
+    dirty = _dirty_sql()
+    return [
+        f"DELETE FROM kpi_daily WHERE (day, section_id) IN ({dirty})",
+        _facts_sql({}, dirty),
+        _MARK_REFRESHED,
+    ]
+
+def query_sql(date_from, date_to, period=None, by_section=False):
+    """Суммы показателей за период; возвращает (запрос, параметры)"""
+    if period and period not in PERIODS:
+        raise ValueError(f'Неизвестный период: {period}')
+    columns = []
+    if period:
+        columns.append(f'substr(k.day, 1, {PERIODS[period]}) AS period')
+    if by_section:
+        columns.append('s.section_name')
+    groups = ', '.join(str(i + 1) for i in range(len(columns)))
+
+    # Стоимость энергии по тарифу на каждые сутки
+    energy_cost = (f"k.electricity * {tariff_sql('electricity', 'k.day')} + "
+                   f"k.fuel * {tariff_sql('fuel', 'k.day')}")
+    query = f"""
+    SELECT {''.join(f'{column}, ' for column in columns)}
+           {', '.join(f'TOTAL(k.{name}) AS {name}' for name in MEASURES)},
+           TOTAL({energy_cost}) AS energy_cost
+    FROM kpi_daily k
+    JOIN sections s ON k.section_id = s.section_id
+    WHERE k.day BETWEEN ? AND ?
+    {f'GROUP BY {groups} ORDER BY {groups}' if groups else ''}
+    """
+    return query, (date_from, date_to)
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+def add_ratios(row):
+    """Удельные показатели по суммам строки"""
+    row['tons_per_man_hour'] = _ratio(row['volume'], row['man_hours'])
+    row['kwh_per_ton'] = _ratio(row['electricity'], row['volume'])
+    row['fuel_per_ton'] = _ratio(row['fuel'], row['volume'])
+    row['stripping_ratio'] = _ratio(row['rock_volume'], row['volume'])
+    row['cost_per_ton'] = _ratio(row['energy_cost'], row['volume'])
+    return row
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    created = not db.table_exists('kpi_daily')
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+    # Первое построение захватывает и архивные годы
+    if created:
+        KpiEngine(db).rebuild()
+
+class KpiEngine:
+    """Показатели производительности: тонн на человеко-час, расход на тонну
+
+    Добыча, табель и затраты сводятся в суточный срез по участкам и
+    сменам. Срез догоняет рабочие таблицы по журналу изменений перед
+    каждым запросом, пересчитывая только затронутые сутки.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def rebuild(self):
+        """Построение среза заново по рабочей базе и архивам"""
+        from database.archive import get_archive_manager
+
+        archive = get_archive_manager()
+        sources = {table: archive.source(table, '0000-01-01', '9999-12-31') for table in FACT_MEASURES}
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM kpi_daily")
+            conn.execute(_facts_sql(sources))
+            conn.execute(_MARK_REFRESHED)
+
+    def refresh(self):
+        """Перенос изменений из журнала в срез"""
+        state = self.db.fetch_one(STATE_SQL)
+        if state and state['last_seq'] is not None and state['last_seq'] == (state['current'] or 0):
+            return
+        with self.db.transaction() as conn:
+            for statement in refresh_statements(needs_rebuild(state)):
+                conn.execute(statement)
+
+    def query(self, date_from, date_to, period=None, by_section=False):
+        """Показатели за период со сводными и удельными значениями"""
+        self.refresh()
+        query, params = query_sql(date_from, date_to, period, by_section)
+        return [add_ratios(row) for row in self.db.fetch_all(query, params)]
+
+    def totals(self, date_from, date_to):
+        rows = self.query(date_from, date_to)
+        return rows[0] if rows else None
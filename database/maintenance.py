@@ -0,0 +1,183 @@
+import sqlite3
+from database.db_connection import DatabaseConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    task TEXT PRIMARY KEY,
+    last_run TEXT NOT NULL,
+    details TEXT
+);
+"""
+
+# Значения PRAGMA auto_vacuum
+AUTO_VACUUM_MODES = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+# Допустимые режимы журнала файла базы
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'WAL')
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+class DatabaseMaintenance:
+    """Статистика планировщика, очистка свободных страниц и отчет о размере"""
+
+    def __init__(self, db=None, connection=None):
+        # connection - отдельное соединение фонового потока вместо соединения db
+        self.db = db or DatabaseConnection()
+        self.connection = connection
+
+    def _connection(self):
+        return self.connection or self.db.get_connection()
+
+    def _pragma(self, name):
+        return self._connection().execute(f"PRAGMA {name}").fetchone()[0]
+
+    def _record(self, task, details=''):
+        conn = self._connection()
+        conn.execute("""
+        INSERT INTO maintenance_runs (task, last_run, details)
+        VALUES (?, datetime('now'), ?)
+        ON CONFLICT(task) DO UPDATE SET
+            last_run = excluded.last_run,
+            details = excluded.details
+        """, (task, details))
+        conn.commit()
+
+    def days_since(self, task):
+        """Сколько дней прошло с последнего выполнения задачи или None"""
+        row = self._connection().execute(
+            "SELECT julianday('now') - julianday(last_run) AS days FROM maintenance_runs WHERE task = ?",
+            (task,)
+        ).fetchone()
+        return row['days'] if row else None
+
+    def optimize(self):
+        """PRAGMA optimize: ANALYZE только там, где статистика устарела"""
+        self._connection().execute("PRAGMA optimize")
+        self._record('optimize')
+
+    def analyze(self):
+        """Полный пересбор статистики для планировщика запросов"""
+        conn = self._connection()
+        conn.execute("ANALYZE")
+        conn.commit()
+        self._record('analyze')
+
+    def auto_vacuum_mode(self):
+        return AUTO_VACUUM_MODES.get(self._pragma('auto_vacuum'), 'NONE')
+
+    def enable_incremental_vacuum(self):
+        """Перевод базы в auto_vacuum=INCREMENTAL (требует однократного VACUUM)"""
+        if self.auto_vacuum_mode() == 'INCREMENTAL':
+            return False
+        conn = self._connection()
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        self._record('vacuum', 'auto_vacuum=INCREMENTAL')
+        return True
+
+    def journal_mode(self):
+        return self._pragma('journal_mode').upper()
+
+    def set_journal_mode(self, mode):
+        """Смена режима журнала файла базы, возвращает установленный режим
+
+        Режим хранится в файле и действует для всех соединений всех рабочих
+        мест. WAL допустим, только если все они открывают базу на одном
+        компьютере: через сетевую папку общая память WAL не работает.
+        """
+        mode = mode.upper()
+        if mode not in JOURNAL_MODES:
+            raise ValueError(f'Неизвестный режим журнала: {mode}')
+        conn = self._connection()
+        conn.commit()
+        result = conn.execute(f"PRAGMA journal_mode = {mode}").fetchone()[0].upper()
+        if result != mode:
+            raise RuntimeError(f'Режим журнала не изменен ({result}): база открыта другими соединениями')
+        self._record('journal_mode', mode)
+        return result
+
+    def incremental_vacuum(self, pages=None):
+        """Возврат порции свободных страниц, возвращает число освобожденных"""
+        from config import Config
+        pages = pages or Config.MAINTENANCE_VACUUM_PAGES
+        conn = self._connection()
+        before = self._pragma('freelist_count')
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        conn.commit()
+        freed = before - self._pragma('freelist_count')
+        if freed:
+            self._record('incremental_vacuum', f'{freed} pages')
+        return freed
+
+    def database_stats(self):
+        """Размер файла и доля свободных страниц"""
+        page_size = self._pragma('page_size')
+        page_count = self._pragma('page_count')
+        freelist = self._pragma('freelist_count')
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist,
+            'size_bytes': page_size * page_count,
+            'free_bytes': page_size * freelist,
+            'fragmentation': freelist / page_count * 100 if page_count else 0,
+            'auto_vacuum': self.auto_vacuum_mode(),
+            'journal_mode': self.journal_mode(),
+        }
+
+    def table_stats(self):
+        """Размер, число страниц и незанятое место по таблицам и индексам"""
+        try:
+            rows = self._connection().execute("""
+            SELECT name, COUNT(*) AS pages, SUM(pgsize) AS size_bytes,
+                   SUM(unused) AS unused_bytes
+            FROM dbstat
+            WHERE name NOT LIKE 'sqlite_%'
+            GROUP BY name
+            ORDER BY size_bytes DESC
+            """).fetchall()
+        except sqlite3.OperationalError:
+            # SQLite собран без dbstat: отдаем только список объектов
+            rows = self._connection().execute("""
+            SELECT name, NULL AS pages, NULL AS size_bytes, NULL AS unused_bytes
+            FROM sqlite_master
+            WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'
+            ORDER BY name
+            """).fetchall()
+
+        result = []
+        for row in rows:
+            stats = dict(row)
+            stats['fill'] = (
+                (1 - stats['unused_bytes'] / stats['size_bytes']) * 100
+                if stats['size_bytes'] else None
+            )
+            result.append(stats)
+        return result
+
+    def run_due(self):
+        """Плановое обслуживание, возвращает список выполненных задач
+
+        Перевод в auto_vacuum=INCREMENTAL перестраивает весь файл и в плановое
+        обслуживание не входит: он выполняется явно (maintenance --incremental
+        или кнопкой в окне обслуживания). До перевода incremental_vacuum
+        ничего не освобождает.
+        """
+        from config import Config
+        done = []
+
+        days = self.days_since('analyze')
+        if days is None or days > Config.MAINTENANCE_ANALYZE_DAYS:
+            self.analyze()
+            done.append('analyze')
+
+        if self._pragma('freelist_count') > Config.MAINTENANCE_FREE_PAGES_THRESHOLD:
+            if self.incremental_vacuum():
+                done.append('incremental_vacuum')
+
+        return done
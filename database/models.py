@@ -1,55 +1,122 @@
-from dataclasses import dataclass
-from datetime import date
+from dataclasses import dataclass, fields
 from typing import Optional
 
-@dataclass
+# Записи хранят значения в __slots__ без словаря атрибутов на каждый объект.
+# Порядок полей совпадает с порядком столбцов таблицы: запись строится
+# прямо из кортежа курсора, даты хранятся строками ГГГГ-ММ-ДД, как в базе.
+
+def columns(model):
+    """Имена полей записи в порядке столбцов"""
+    return tuple(field.name for field in fields(model))
+
+def percent(actual, plan):
+    """Процент выполнения плана, 0 без плана"""
+    if not plan or plan <= 0:
+        return 0
+    return round((actual or 0) * 100.0 / plan, 2)
+
+@dataclass(slots=True)
 class Coal:
-    mark: str
-    ash_content: float
-    moisture: float
-    calorific_value: int
-    price_per_ton: float
+    coal_mark: str
+    ash_content: Optional[float]
+    moisture: Optional[float]
+    calorific_value: Optional[int]
+    price_per_ton: Optional[float]
 
-@dataclass
+@dataclass(slots=True)
 class Position:
-    id: int
-    name: str
+    position_id: Optional[int]
+    position_name: str
 
-@dataclass
+@dataclass(slots=True)
 class Section:
-    id: int
-    name: str
-    area: float
-    height: float
-    manager_id: Optional[int] = None
+    section_id: Optional[int]
+    section_name: str
+    area: Optional[float]
+    height: Optional[float]
+    manager_tab_number: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
+class SectionView(Section):
+    """Участок с ФИО руководителя для списка"""
+    manager_name: Optional[str] = None
+
+@dataclass(slots=True)
 class Worker:
     tab_number: int
     full_name: str
     section_id: int
     position_id: int
     iin: str
-    address: str
-    phone: str
-    gender: str
-    birth_date: date
+    address: Optional[str]
+    phone: Optional[str]
+    gender: Optional[str]
+    birth_date: Optional[str]
+
+@dataclass(slots=True)
+class WorkerView(Worker):
+    """Работник с названиями участка и должности для списка"""
+    section_name: Optional[str] = None
+    position_name: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class Mining:
-    date: date
+    mining_id: Optional[int]
+    mining_date: str
     shift: int
-    volume: float
+    volume: Optional[float]
     coal_mark: str
     section_id: int
-    rock_volume: float
+    rock_volume: Optional[float]
 
-@dataclass
+@dataclass(slots=True)
+class MiningView(Mining):
+    """Добыча с названием участка для списка"""
+    section_name: Optional[str] = None
+
+@dataclass(slots=True)
+class Cost:
+    cost_id: Optional[int]
+    cost_date: str
+    section_id: int
+    shift: int
+    electricity: Optional[float]
+    fuel: Optional[float]
+
+@dataclass(slots=True)
+class CostView(Cost):
+    """Затраты с названием участка и стоимостью по тарифам для списка"""
+    section_name: Optional[str] = None
+    total_cost: Optional[float] = None
+
+@dataclass(slots=True)
 class Limits:
+    limit_id: Optional[int]
     section_id: int
     month: int
     year: int
-    plan_production: float
-    plan_rock: float
-    plan_electricity: float
-    plan_fuel: float
\ No newline at end of file
+    plan_production: Optional[float]
+    actual_production: Optional[float] = 0
+    plan_rock: Optional[float] = None
+    actual_rock: Optional[float] = 0
+    plan_electricity: Optional[float] = None
+    actual_electricity: Optional[float] = 0
+    plan_fuel: Optional[float] = None
+    actual_fuel: Optional[float] = 0
+
+    @property
+    def production_percent(self):
+        return percent(self.actual_production, self.plan_production)
+
+    @property
+    def rock_percent(self):
+        return percent(self.actual_rock, self.plan_rock)
+
+    @property
+    def electricity_percent(self):
+        return percent(self.actual_electricity, self.plan_electricity)
+
+@dataclass(slots=True)
+class LimitsView(Limits):
+    """Лимит с названием участка для списка"""
+    section_name: Optional[str] = None
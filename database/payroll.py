@@ -0,0 +1,223 @@
+import csv
+import os
+from pathlib import Path
+from config import Config
+from database.db_connection import DatabaseConnection, session
+
+# Дата, с которой действует ставка, заведенная до ведения истории
+INITIAL_DATE = '1900-01-01'
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS position_rates (
+    position_id INTEGER NOT NULL REFERENCES positions (position_id) ON DELETE CASCADE,
+    valid_from TEXT NOT NULL,
+    hourly_rate REAL NOT NULL CHECK (hourly_rate > 0),
+    PRIMARY KEY (position_id, valid_from)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS payroll_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    month_from TEXT NOT NULL,
+    month_to TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+    created_by TEXT,
+    workers INTEGER NOT NULL DEFAULT 0,
+    hours REAL NOT NULL DEFAULT 0,
+    amount REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS payroll_lines (
+    run_id INTEGER NOT NULL REFERENCES payroll_runs (run_id) ON DELETE CASCADE,
+    month TEXT NOT NULL,
+    tab_number INTEGER NOT NULL,
+    full_name TEXT,
+    position_name TEXT,
+    section_name TEXT,
+    hours REAL NOT NULL,
+    overtime_hours REAL NOT NULL,
+    base_amount REAL NOT NULL,
+    shift_bonus REAL NOT NULL,
+    overtime_bonus REAL NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (run_id, month, tab_number)
+) WITHOUT ROWID;
+
+-- Должности получают прежнюю единую ставку, действующую с начала истории
+INSERT OR IGNORE INTO position_rates (position_id, valid_from, hourly_rate)
+SELECT position_id, '{INITIAL_DATE}', {Config.PAYROLL_DEFAULT_RATE} FROM positions;
+"""
+
+# Столбцы строки расчета в порядке таблицы payroll_lines
+LINE_COLUMNS = ('month', 'tab_number', 'full_name', 'position_name', 'section_name', 'hours',
+                'overtime_hours', 'base_amount', 'shift_bonus', 'overtime_bonus', 'amount')
+
+# Заголовки выгрузки
+LINE_TITLES = ('Месяц', 'Таб. №', 'ФИО', 'Должность', 'Участок', 'Часы', 'Сверхурочные часы',
+               'По ставке', 'Надбавка за смену', 'Доплата за сверхурочные', 'Начислено')
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+def _shift_coefficient_sql(column):
+    cases = ' '.join(f'WHEN {shift} THEN {coefficient}'
+                     for shift, coefficient in Config.PAYROLL_SHIFT_COEFFICIENTS.items())
+    return f'CASE {column} {cases} ELSE 1.0 END'
+
+def calculation_sql(date_from, date_to, source='time_sheet'):
+    """Начисления по месяцам и работникам одним запросом
+
+    date_from и date_to - SQL-выражения границ периода. Каждая строка табеля
+    соединяется с интервалом действия ставки должности на ее дату, часы
+    сверх нормальной длины смены оплачиваются с повышающим коэффициентом.
+    """
+    overtime = Config.PAYROLL_OVERTIME_COEFFICIENT
+    return f"""
+    WITH rates AS (
+        SELECT position_id, valid_from, hourly_rate,
+               LEAD(valid_from, 1, '9999-12-31') OVER (PARTITION BY position_id ORDER BY valid_from) AS valid_to
+        FROM position_rates
+    ),
+    shifts AS (
+        SELECT substr(t.date, 1, 7) AS month, t.tab_number, t.hours,
+               MAX(t.hours - {Config.PAYROLL_SHIFT_HOURS}, 0) AS overtime,
+               {_shift_coefficient_sql('t.shift')} AS coefficient,
+               IFNULL(r.hourly_rate, {Config.PAYROLL_DEFAULT_RATE}) AS rate
+        FROM {source} t
+        JOIN workers w ON w.tab_number = t.tab_number
+        LEFT JOIN rates r ON r.position_id = w.position_id
+             AND t.date >= r.valid_from AND t.date < r.valid_to
+        WHERE t.date BETWEEN {date_from} AND {date_to}
+    )
+    SELECT month, tab_number,
+           SUM(hours) AS hours,
+           SUM(overtime) AS overtime_hours,
+           SUM(hours * rate) AS base_amount,
+           SUM(hours * rate * (coefficient - 1)) AS shift_bonus,
+           SUM(overtime * rate * coefficient * ({overtime} - 1)) AS overtime_bonus,
+           SUM(rate * coefficient * (hours + overtime * ({overtime} - 1))) AS amount
+    FROM shifts
+    GROUP BY month, tab_number
+    """
+
+def lines_sql(date_from, date_to, source='time_sheet'):
+    """Строки расчета с данными работника, округленные до копеек"""
+    return f"""
+    SELECT a.month, w.tab_number, w.full_name, p.position_name, s.section_name,
+           a.hours, a.overtime_hours,
+           ROUND(a.base_amount, 2) AS base_amount,
+           ROUND(a.shift_bonus, 2) AS shift_bonus,
+           ROUND(a.overtime_bonus, 2) AS overtime_bonus,
+           ROUND(a.amount, 2) AS amount
+    FROM ({calculation_sql(date_from, date_to, source)}) a
+    JOIN workers w ON w.tab_number = a.tab_number
+    JOIN positions p ON w.position_id = p.position_id
+    JOIN sections s ON w.section_id = s.section_id
+    ORDER BY a.month, s.section_name, w.full_name
+    """
+
+def month_bounds(month_from, month_to):
+    """Даты начала и конца периода из месяцев YYYY-MM"""
+    return f'{month_from}-01', f'{month_to}-31'
+
+class PayrollService:
+    """Ставки должностей, расчет зарплаты за период и сохраненные расчеты"""
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def rates(self, position_id=None):
+        query = """
+        SELECT r.*, p.position_name
+        FROM position_rates r
+        JOIN positions p ON r.position_id = p.position_id
+        """
+        if position_id:
+            return self.db.fetch_all(query + " WHERE r.position_id = ? ORDER BY r.valid_from DESC",
+                                     (position_id,))
+        return self.db.fetch_all(query + " ORDER BY p.position_name, r.valid_from DESC")
+
+    def set_rate(self, position_id, valid_from, hourly_rate):
+        self.db.execute_query("""
+        INSERT INTO position_rates (position_id, valid_from, hourly_rate) VALUES (?, ?, ?)
+        ON CONFLICT (position_id, valid_from) DO UPDATE SET hourly_rate = excluded.hourly_rate
+        """, (position_id, valid_from, hourly_rate))
+
+    def delete_rate(self, position_id, valid_from):
+        if valid_from == INITIAL_DATE:
+            raise ValueError('Начальную ставку должности удалить нельзя, ее можно только изменить')
+        self.db.execute_query(
+            "DELETE FROM position_rates WHERE position_id = ? AND valid_from = ?", (position_id, valid_from))
+
+    def _source(self, date_from, date_to):
+        from database.archive import get_archive_manager
+        return get_archive_manager().source('time_sheet', date_from, date_to)
+
+    def calculate(self, month_from, month_to):
+        """Расчет без сохранения: строки по месяцам и работникам"""
+        date_from, date_to = month_bounds(month_from, month_to)
+        source = self._source(date_from, date_to)
+        return self.db.fetch_all(lines_sql('?', '?', source), (date_from, date_to))
+
+    def save_run(self, month_from, month_to):
+        """Расчет и сохранение его результатов, возвращает номер расчета
+
+        Заголовок расчета и его строки пишутся одной транзакцией; строки
+        записываются одним INSERT ... SELECT, без передачи данных в программу.
+        """
+        date_from, date_to = month_bounds(month_from, month_to)
+        source = self._source(date_from, date_to)
+        # Источник с архивами - временное представление этого соединения,
+        # поэтому транзакция идет в нем, а не в очереди записи
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO payroll_runs (month_from, month_to, created_by) VALUES (?, ?, ?)",
+                (month_from, month_to, session.user)
+            )
+            # Вставка в таблицу WITHOUT ROWID не меняет last_insert_rowid()
+            conn.execute(f"""
+            INSERT INTO payroll_lines (run_id, {', '.join(LINE_COLUMNS)})
+            SELECT last_insert_rowid(), {', '.join(LINE_COLUMNS)} FROM ({lines_sql('?', '?', source)})
+            """, (date_from, date_to))
+            conn.execute("""
+            UPDATE payroll_runs SET
+                workers = (SELECT COUNT(DISTINCT tab_number) FROM payroll_lines WHERE run_id = payroll_runs.run_id),
+                hours = (SELECT TOTAL(hours) FROM payroll_lines WHERE run_id = payroll_runs.run_id),
+                amount = (SELECT TOTAL(amount) FROM payroll_lines WHERE run_id = payroll_runs.run_id)
+            WHERE run_id = last_insert_rowid()
+            """)
+        return cursor.lastrowid
+
+    def runs(self):
+        return self.db.fetch_all("SELECT * FROM payroll_runs ORDER BY run_id DESC")
+
+    def run_lines(self, run_id):
+        return self.db.fetch_all(f"""
+        SELECT {', '.join(LINE_COLUMNS)} FROM payroll_lines
+        WHERE run_id = ?
+        ORDER BY month, section_name, full_name
+        """, (run_id,))
+
+    def delete_run(self, run_id):
+        self.db.execute_query("DELETE FROM payroll_runs WHERE run_id = ?", (run_id,))
+
+    def export_run(self, run_id, directory=None):
+        """Выгрузка сохраненного расчета в CSV для бухгалтерии, возвращает путь"""
+        run = self.db.fetch_one("SELECT * FROM payroll_runs WHERE run_id = ?", (run_id,))
+        if not run:
+            raise ValueError(f'Расчет №{run_id} не найден')
+
+        directory = Path(directory or Config.REPORTS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"payroll_{run_id}_{run['month_from']}_{run['month_to']}.csv"
+
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(LINE_TITLES)
+            for row in self.run_lines(run_id):
+                writer.writerow([row[column] for column in LINE_COLUMNS])
+        os.replace(tmp_path, path)
+        return path
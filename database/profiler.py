@@ -0,0 +1,388 @@
+import cProfile
+import functools
+import inspect
+import json
+import platform
+import pstats
+import sqlite3
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from config import Config
+
+def query_text(query):
+    """Текст запроса одной строкой для сводки"""
+    text = ' '.join(str(query).split())
+    return text if len(text) <= 200 else text[:197] + '...'
+
+def result_rows(result):
+    """Число прочитанных или измененных строк по результату запроса"""
+    if result is None:
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    return max(getattr(result, 'rowcount', 0) or 0, 0)
+
+class Span:
+    """Замер одного действия: время без ожидания пользователя, запросы, строки"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.idle = 0.0
+        self.idle_since = None
+        self.sql_time = 0.0
+        self.sql_count = 0
+        self.rows = 0
+        self.in_sql = False
+        self.queries = {}
+        self.children = []
+        self.error = None
+        self.functions = None
+        self.memory = None
+
+    def add_query(self, query, elapsed, rows):
+        self.sql_time += elapsed
+        self.sql_count += 1
+        self.rows += rows
+        text = query_text(query)
+        stat = self.queries.get(text)
+        if stat is None:
+            self.queries[text] = [1, elapsed, rows]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += rows
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start - self.idle
+
+    def as_dict(self):
+        queries = sorted(self.queries.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.duration * 1000, 3),
+            'idle_ms': round(self.idle * 1000, 3),
+            'sql_ms': round(self.sql_time * 1000, 3),
+            'sql_count': self.sql_count,
+            'rows': self.rows,
+            'error': self.error,
+            'children': [{'name': child.name, 'duration_ms': round(child.duration * 1000, 3)}
+                         for child in self.children],
+            'queries': [{'sql': text, 'count': count, 'ms': round(elapsed * 1000, 3), 'rows': rows}
+                        for text, (count, elapsed, rows) in queries[:10]],
+            'functions': self.functions,
+            'memory': self.memory,
+        }
+
+class Profiler:
+    """Замеры действий окна в режиме профилирования
+
+    Действие - вызов метода, помеченного profiled. Запросы к базе,
+    выполненные внутри действия, учитываются в его замере; вложенные
+    действия записываются как части внешнего. Время, пока окно ждет
+    пользователя (модальные диалоги, вопросы), из замера вычитается.
+    Профиль функций cProfile и замер памяти tracemalloc включаются
+    отдельно: они заметно замедляют работу.
+    """
+
+    def __init__(self):
+        self.enabled = Config.PROFILE_ENABLED
+        self.use_cprofile = Config.PROFILE_CPROFILE
+        self.use_tracemalloc = Config.PROFILE_TRACEMALLOC
+        self.spans = deque(maxlen=Config.PROFILE_MAX_SPANS)
+        self.listeners = []
+        self.session_started = datetime.now()
+        self.local = threading.local()
+
+    def add_listener(self, callback):
+        """callback(span) вызывается по окончании каждого внешнего действия"""
+        self.listeners.append(callback)
+
+    def current(self):
+        """Внешнее действие, выполняющееся в текущем потоке, или None"""
+        stack = getattr(self.local, 'stack', None)
+        return stack[0] if stack else None
+
+    def configure(self, enabled=None, cprofile=None, memory=None):
+        """Включение режимов; при выключении замера памяти трассировка останавливается"""
+        if enabled is not None:
+            self.enabled = enabled
+        if cprofile is not None:
+            self.use_cprofile = cprofile
+        if memory is not None:
+            self.use_tracemalloc = memory
+        if (not self.enabled or not self.use_tracemalloc) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset(self):
+        self.spans.clear()
+        self.session_started = datetime.now()
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield None
+            return
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        span = Span(name)
+        outer = not stack
+        if not outer:
+            stack[-1].children.append(span)
+        stack.append(span)
+
+        profile = snapshot = None
+        if outer and self.use_cprofile:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Уже работает другой профилировщик
+                profile = None
+        if outer and self.use_tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(Config.PROFILE_TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+            span.finish()
+            stack.pop()
+            if profile is not None:
+                span.functions = self._functions(profile)
+            if snapshot is not None:
+                span.memory = self._memory(snapshot, memory_before)
+            if outer:
+                self.spans.append(span)
+                for callback in list(self.listeners):
+                    try:
+                        callback(span)
+                    except Exception as e:
+                        print(f"Ошибка обработчика профилирования: {e}")
+
+    def _functions(self, profile):
+        """Функции с наибольшим общим временем по профилю cProfile"""
+        stats = pstats.Stats(profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        result = []
+        for (filename, line, function), (_, calls, own, total, _) in rows[:Config.PROFILE_TOP_FUNCTIONS]:
+            place = f'{Path(filename).name}:{line}' if line else filename
+            result.append({
+                'function': f'{function} ({place})',
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'total_ms': round(total * 1000, 3),
+            })
+        return result
+
+    def _memory(self, before, memory_before):
+        """Прирост и пик памяти за действие и строки с наибольшим приростом"""
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        top = after.compare_to(before, 'lineno')[:10]
+        return {
+            'allocated_kb': round((current - memory_before) / 1024, 1),
+            'peak_kb': round((peak - memory_before) / 1024, 1),
+            'top': [{'place': str(stat.traceback[0]), 'size_kb': round(stat.size_diff / 1024, 1),
+                     'count': stat.count_diff} for stat in top],
+        }
+
+    @contextmanager
+    def sql_block(self, connection=None):
+        """Учет блока запросов (транзакции) как одного запроса текущего действия
+
+        Число строк - изменения, сделанные соединением за время блока.
+        """
+        span = self.current()
+        if span is None or span.in_sql:
+            yield
+            return
+        span.in_sql = True
+        changes = connection.total_changes if connection is not None else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            span.in_sql = False
+            rows = connection.total_changes - changes if connection is not None else 0
+            span.add_query('-- транзакция', time.perf_counter() - start, rows)
+
+    def idle_begin(self):
+        """Окно начало ждать событий (вызывается из цикла событий Qt)"""
+        span = self.current()
+        if span is not None and span.idle_since is None:
+            span.idle_since = time.perf_counter()
+
+    def idle_end(self):
+        span = self.current()
+        if span is not None and span.idle_since is not None:
+            idle = time.perf_counter() - span.idle_since
+            span.idle_since = None
+            for open_span in self.local.stack:
+                open_span.idle += idle
+
+    def summary(self):
+        """Сводка по действиям сеанса: число, общее, среднее и наибольшее время"""
+        groups = {}
+        for span in self.spans:
+            group = groups.setdefault(span.name, {'name': span.name, 'count': 0, 'total_ms': 0.0,
+                                                  'max_ms': 0.0, 'sql_ms': 0.0, 'rows': 0})
+            group['count'] += 1
+            group['total_ms'] += span.duration * 1000
+            group['max_ms'] = max(group['max_ms'], span.duration * 1000)
+            group['sql_ms'] += span.sql_time * 1000
+            group['rows'] += span.rows
+        for group in groups.values():
+            group['mean_ms'] = group['total_ms'] / group['count']
+            for key in ('total_ms', 'max_ms', 'sql_ms', 'mean_ms'):
+                group[key] = round(group[key], 3)
+        return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+    def dump(self, path=None):
+        """Сохранение замеров сеанса в JSON для приложения к заявке"""
+        if path is None:
+            Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            path = Config.PROFILE_DIR / f'profile_{datetime.now():%Y%m%d_%H%M%S}.json'
+        data = {
+            'application': f'{Config.APP_NAME} {Config.APP_VERSION}',
+            'session_started': self.session_started.isoformat(timespec='seconds'),
+            'saved': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'db_profile': Config.DB_PROFILE,
+            'api_url': Config.API_URL or None,
+            'summary': self.summary(),
+            'spans': [span.as_dict() for span in self.spans],
+            'slow_queries': [
+                {'sql': query_text(entry['sql']), 'count': entry['count'],
+                 'total_ms': round(entry['total'] * 1000, 3), 'max_ms': round(entry['max'] * 1000, 3)}
+                for entry in _slow_log.top(Config.PROFILE_TOP_FUNCTIONS)
+            ],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return Path(path)
+
+class SlowQueryLog:
+    """Запросы дольше SLOW_QUERY_MS за время работы программы
+
+    Ведется всегда, независимо от режима профилирования: замер времени
+    запроса уже есть в обертке profiled_query. Советы по индексам
+    (database.query_advisor) разбирают отсюда самые дорогие запросы.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, query, params, elapsed):
+        key = ' '.join(str(query).split())
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= Config.SLOW_QUERY_KEEP:
+                    # Вытесняется запрос с наименьшим общим временем
+                    del self.entries[min(self.entries, key=lambda k: self.entries[k]['total'])]
+                entry = self.entries[key] = {'sql': query, 'params': None, 'count': 0,
+                                             'total': 0.0, 'max': 0.0, 'last': None}
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['params'] = list(params) if params else None
+            entry['last'] = datetime.now()
+
+    def top(self, limit=None):
+        """Запросы по убыванию общего времени"""
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        entries.sort(key=lambda entry: entry['total'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+_slow_log = SlowQueryLog()
+
+def get_slow_log():
+    """Журнал медленных запросов процесса"""
+    return _slow_log
+
+_profiler = None
+
+def get_profiler():
+    """Общий профилировщик процесса"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+def profiled(func):
+    """Замер метода как действия окна в режиме профилирования
+
+    Лишние позиционные аргументы (checked у сигнала clicked) отбрасываются,
+    чтобы обертка подключалась к сигналам Qt так же, как сам метод.
+    """
+    name = func.__qualname__
+    parameters = inspect.signature(func).parameters.values()
+    if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+        limit = None
+    else:
+        limit = sum(1 for p in parameters if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if limit is not None:
+            args = args[:limit]
+        profiler = get_profiler()
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        with profiler.span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+def profiled_query(method):
+    """Учет времени и числа строк запроса к базе в текущем действии
+    и в журнале медленных запросов"""
+    @functools.wraps(method)
+    def wrapper(self, query, params=None):
+        span = get_profiler().current()
+        if span is not None:
+            if span.in_sql:
+                return method(self, query, params)
+            span.in_sql = True
+        start = time.perf_counter()
+        rows = 0
+        try:
+            result = method(self, query, params)
+            if span is not None:
+                rows = result_rows(result)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            if span is not None:
+                span.in_sql = False
+                span.add_query(query, elapsed, rows)
+            if elapsed * 1000 >= Config.SLOW_QUERY_MS:
+                _slow_log.record(query, params, elapsed)
+    return wrapper
@@ -0,0 +1,319 @@
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from config import Config
+from database.db_connection import DatabaseConnection, register_functions
+from database.profiler import get_slow_log
+
+# Слова, которые могут стоять после имени таблицы вместо псевдонима
+KEYWORDS = {
+    'where', 'on', 'using', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'natural',
+    'group', 'order', 'limit', 'union', 'except', 'intersect', 'as', 'set', 'values',
+    'window', 'having', 'indexed', 'not', 'full',
+}
+
+TABLE_REFERENCE = re.compile(r'\b(?:from|join|update|into)\s+(\w+)(?:\s+(?:as\s+)?(\w+))?', re.I)
+SCAN_DETAIL = re.compile(r'^SCAN (\w+)(?: USING (COVERING )?INDEX (\w+))?', re.I)
+EQUALITY_AFTER = re.compile(r'\s*(?:==?|\bIN\b|\bIS\b(?!\s+NOT))', re.I)
+RANGE_AFTER = re.compile(r'\s*(?:<=|>=|<>|!=|<|>|\bBETWEEN\b|\bLIKE\b|\bGLOB\b)', re.I)
+EQUALITY_BEFORE = re.compile(r'(?:==?)\s*$')
+RANGE_BEFORE = re.compile(r'(?:<=|>=|<|>)\s*$')
+ORDER_CLAUSE = re.compile(r'\b(?:order|group)\s+by\b(.*?)(?=\blimit\b|\bhaving\b|\bunion\b|\)|$)', re.I | re.S)
+
+def plan_text(rows):
+    """Строки плана с отступами по вложенности"""
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        level = depth.get(row['parent'], -1) + 1
+        depth[row['id']] = level
+        lines.append('    ' * level + row['detail'])
+    return lines
+
+def table_aliases(query):
+    """Псевдонимы таблиц запроса: {псевдоним: таблица}, таблица - сама себе псевдоним"""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(query):
+        aliases.setdefault(table, table)
+        if alias and alias.lower() not in KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+# Действия SQLite запроса только на чтение (проверка при компиляции)
+READ_ACTIONS = frozenset((sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ,
+                          sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE))
+
+def read_only_authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in READ_ACTIONS else sqlite3.SQLITE_DENY
+
+def index_name(table, columns):
+    return f"idx_{table}_{'_'.join(columns)}"
+
+def index_sql(table, columns):
+    return f"CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON {table} ({', '.join(columns)})"
+
+class QueryAdvisor:
+    """Советы по индексам для запросов к большим таблицам
+
+    План запроса берется из EXPLAIN QUERY PLAN. Если в нем есть полный
+    просмотр mining, costs или time_sheet, по тексту запроса подбираются
+    столбцы индекса: сначала сравнения на равенство, затем диапазон или
+    сортировка. Предложение проверяется на копии схемы в памяти вместе
+    со статистикой sqlite_stat1: планировщик видит ту же статистику, что и
+    в рабочей базе, а сама база не меняется. Предложение принимается,
+    если с индексом таблица больше не просматривается целиком. Сравнение
+    времени выполнения (what_if) делается на временной полной копии файла.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def plan(self, query, params=None, connection=None):
+        """Строки EXPLAIN QUERY PLAN; непривязанные параметры считаются NULL"""
+        query = query.strip().rstrip(';')
+        if params is None:
+            params = [None] * query.count('?')
+        explain = f'EXPLAIN QUERY PLAN {query}'
+        if connection is not None:
+            return [dict(row) for row in connection.execute(explain, params)]
+        if self.db.remote:
+            return self.db.fetch_rows(explain, params)
+        return [dict(row) for row in self.db.get_connection().execute(explain, params)]
+
+    def scans(self, plan, aliases):
+        """Полные просмотры отслеживаемых таблиц в плане"""
+        found = []
+        for row in plan:
+            match = SCAN_DETAIL.match(row['detail'])
+            if not match:
+                continue
+            alias, covering, index = match.groups()
+            table = aliases.get(alias, alias)
+            if table in Config.ADVISOR_TABLES:
+                found.append({'table': table, 'alias': alias, 'detail': row['detail'],
+                              'index': index, 'covering': bool(covering)})
+        return found
+
+    def columns(self, table):
+        return [row['name'] for row in self.db.fetch_all(f"PRAGMA table_info({table})")]
+
+    def candidate(self, query, table, alias, aliases):
+        """Столбцы индекса для таблицы по условиям и сортировке запроса"""
+        own = self.columns(table)
+        others = set()
+        for other in set(aliases.values()) - {table}:
+            others.update(self.columns(other))
+        # Столбец без псевдонима относится к таблице, если его нет в других таблицах запроса
+        bare = [column for column in own if column not in others]
+        prefixes = {alias, table}
+        pattern = re.compile(
+            r'(?<![\w.])(?:(?P<prefix>\w+)\.)?(?P<column>\w+)\b(?!\s*\()')
+
+        equality, ranges, order = [], [], []
+        order_spans = [match.span(1) for match in ORDER_CLAUSE.finditer(query)]
+        for match in pattern.finditer(query):
+            prefix, column = match.group('prefix'), match.group('column')
+            if prefix is not None and prefix not in prefixes:
+                continue
+            if column not in own or (prefix is None and column not in bare):
+                continue
+            start, end = match.span()
+            before, after = query[:start], query[end:]
+            # Столбец внутри функции (strftime(..., m.date)) индексом не используется
+            if re.search(r'\(\s*[^()]*,\s*$', before) or re.search(r'\w\(\s*$', before):
+                continue
+            if any(low <= start < high for low, high in order_spans):
+                order.append(column)
+            elif EQUALITY_AFTER.match(after) or EQUALITY_BEFORE.search(before):
+                equality.append(column)
+            elif RANGE_AFTER.match(after) or RANGE_BEFORE.search(before):
+                ranges.append(column)
+
+        # Без условий на таблицу индекс заменил бы просмотр таблицы просмотром индекса
+        if not equality and not ranges:
+            return []
+        columns = list(dict.fromkeys(equality))
+        tail = ranges[:1] if ranges else order
+        for column in tail:
+            if column not in columns:
+                columns.append(column)
+        return columns[:4]
+
+    def existing_indexes(self, table):
+        """Столбцы существующих индексов таблицы"""
+        result = []
+        for index in self.db.fetch_all(f"PRAGMA index_list({table})"):
+            result.append([row['name'] for row in self.db.fetch_all(f"PRAGMA index_info({index['name']})")])
+        return result
+
+    def planner_copy(self):
+        """Схема базы в памяти со статистикой планировщика, без данных"""
+        copy = sqlite3.connect(':memory:')
+        copy.row_factory = sqlite3.Row
+        register_functions(copy)
+        objects = self.db.fetch_all("""
+        SELECT type, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND type IN ('table', 'index', 'view') AND name NOT LIKE 'sqlite_%'
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+        """)
+        for item in objects:
+            try:
+                copy.execute(item['sql'])
+            except sqlite3.Error:
+                # Представления над архивами и т.п. для советов не нужны
+                pass
+        if self.db.table_exists('sqlite_stat1'):
+            copy.execute("ANALYZE sqlite_master")
+            copy.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)",
+                             [(row['tbl'], row['idx'], row['stat'])
+                              for row in self.db.fetch_all("SELECT tbl, idx, stat FROM sqlite_stat1")])
+            # Повторный ANALYZE sqlite_master перечитывает статистику в планировщик
+            copy.execute("ANALYZE sqlite_master")
+        return copy
+
+    def advise(self, query, params=None, copy=None):
+        """План запроса, полные просмотры и предложенные индексы
+
+        Возвращает {'plan': строки, 'scans': [...], 'suggestions': [...]}.
+        Предложение: таблица, столбцы, DDL, verified - исчез ли просмотр
+        таблицы в плане на копии схемы, и план после создания индекса.
+        """
+        plan = self.plan(query, params)
+        aliases = table_aliases(query)
+        scans = self.scans(plan, aliases)
+        result = {'plan': plan_text(plan), 'scans': scans, 'suggestions': []}
+        if not scans:
+            return result
+
+        own_copy = copy is None
+        copy = copy or self.planner_copy()
+        try:
+            seen = set()
+            for scan in scans:
+                columns = self.candidate(query, scan['table'], scan['alias'], aliases)
+                if not columns or (scan['table'], tuple(columns)) in seen:
+                    continue
+                seen.add((scan['table'], tuple(columns)))
+                suggestion = {'table': scan['table'], 'columns': columns,
+                              'sql': index_sql(scan['table'], columns)}
+                if any(existing[:len(columns)] == columns for existing in self.existing_indexes(scan['table'])):
+                    suggestion['exists'] = True
+                    suggestion['verified'] = False
+                    suggestion['plan_after'] = result['plan']
+                    result['suggestions'].append(suggestion)
+                    continue
+                suggestion['exists'] = False
+                name = index_name(scan['table'], columns)
+                copy.execute(suggestion['sql'])
+                try:
+                    after = self.plan(query, params, connection=copy)
+                finally:
+                    copy.execute(f"DROP INDEX IF EXISTS {name}")
+                suggestion['verified'] = not any(item['alias'] == scan['alias']
+                                                 for item in self.scans(after, aliases))
+                suggestion['plan_after'] = plan_text(after)
+                result['suggestions'].append(suggestion)
+        finally:
+            if own_copy:
+                copy.close()
+        return result
+
+    def review(self, limit=None):
+        """Советы для самых дорогих запросов журнала медленных запросов"""
+        entries = get_slow_log().top(limit or Config.ADVISOR_REVIEW_LIMIT)
+        result = []
+        copy = None
+        try:
+            for entry in entries:
+                try:
+                    if copy is None:
+                        copy = self.planner_copy()
+                    advice = self.advise(entry['sql'], entry['params'], copy)
+                except sqlite3.Error as e:
+                    advice = {'plan': [], 'scans': [], 'suggestions': [], 'error': str(e)}
+                result.append({'entry': entry, 'advice': advice})
+        finally:
+            if copy is not None:
+                copy.close()
+        return result
+
+    def check_read_only(self, query, params, connection):
+        """Ошибка ValueError, если запрос меняет данные или схему
+
+        Запрос только компилируется (EXPLAIN) с проверкой действий.
+        """
+        connection.set_authorizer(read_only_authorizer)
+        try:
+            connection.execute(f'EXPLAIN {query}', params).fetchall()
+        except sqlite3.DatabaseError as e:
+            if getattr(e, 'sqlite_errorcode', None) == sqlite3.SQLITE_AUTH:
+                raise ValueError('Сравнение на копии выполняется только для запросов на чтение')
+            raise
+        finally:
+            connection.set_authorizer(None)
+
+    def what_if(self, query, ddl, params=None, runs=None, connection=None, progress=None):
+        """Время запроса до и после создания индекса на временной копии базы
+
+        Рабочая база не меняется: копия снимается через backup API во
+        временную папку и удаляется после сравнения. Допускаются только
+        запросы на чтение. connection - соединение, с которого снимается
+        копия (отдельное для фонового потока); progress - обработчик
+        прогресса SQLite, ненулевой ответ прерывает копирование и запросы.
+        """
+        if self.db.remote:
+            raise RuntimeError('Сравнение на копии базы выполняется только на компьютере с базой')
+        runs = runs or Config.ADVISOR_WHATIF_RUNS
+        query = query.strip().rstrip(';')
+        if params is None:
+            params = [None] * query.count('?')
+        source = connection or self.db.get_connection()
+        self.check_read_only(query, params, source)
+
+        def copy_progress(status, remaining, total):
+            if progress and progress():
+                raise sqlite3.OperationalError('interrupted')
+
+        folder = Path(tempfile.mkdtemp(prefix='mine_whatif_'))
+        try:
+            copy = sqlite3.connect(folder / 'whatif.db')
+            try:
+                source.backup(copy, pages=1024, progress=copy_progress)
+                copy.row_factory = sqlite3.Row
+                register_functions(copy)
+                if progress:
+                    copy.set_progress_handler(progress, Config.QUERY_PROGRESS_STEPS)
+
+                def measure():
+                    best = None
+                    for _ in range(runs):
+                        start = time.perf_counter()
+                        rows = copy.execute(query, params).fetchall()
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    return best, len(rows)
+
+                plan_before = plan_text(self.plan(query, params, connection=copy))
+                before, rows = measure()
+                start = time.perf_counter()
+                copy.execute(ddl)
+                copy.commit()
+                index_time = time.perf_counter() - start
+                plan_after = plan_text(self.plan(query, params, connection=copy))
+                after, _ = measure()
+            finally:
+                copy.close()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+        return {
+            'rows': rows,
+            'before_ms': before * 1000,
+            'after_ms': after * 1000,
+            'index_ms': index_time * 1000,
+            'plan_before': plan_before,
+            'plan_after': plan_after,
+        }
@@ -0,0 +1,178 @@
+import http.client
+import json
+import sqlite3
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from database.db_connection import DatabaseConnection, session
+from database.profiler import get_profiler, profiled_query
+
+def _sqlite_error(payload):
+    """Ошибка сервера в виде исключения sqlite3 того же типа"""
+    error_class = getattr(sqlite3, payload.get('type') or '', None)
+    if not (isinstance(error_class, type) and issubclass(error_class, sqlite3.Error)):
+        error_class = sqlite3.DatabaseError
+    return error_class(payload.get('error') or 'Ошибка сервера базы данных')
+
+class RemoteCursor:
+    """Итог запроса на изменение с полями sqlite3.Cursor"""
+
+    def __init__(self, result=None):
+        self.set_result(result or {})
+
+    def set_result(self, result):
+        self.rowcount = result.get('rowcount', -1)
+        self.lastrowid = result.get('lastrowid')
+
+class RemoteBatch:
+    """Запросы транзакции, отправляемые на сервер одним пакетом при выходе из блока
+
+    Курсоры запросов получают итог после отправки пакета.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.cursors = []
+
+    def execute(self, query, params=None):
+        self.statements.append({'sql': query, 'params': list(params or [])})
+        cursor = RemoteCursor()
+        self.cursors.append(cursor)
+        return cursor
+
+    def executemany(self, query, seq_of_params):
+        for params in seq_of_params:
+            self.execute(query, params)
+
+class RemoteDatabaseConnection(DatabaseConnection):
+    """Работа с базой через HTTP API сервера вместо файла
+
+    Повторяет интерфейс DatabaseConnection, которым пользуются формы.
+    Прямое соединение (get_connection) в этом режиме недоступно.
+    """
+
+    remote = True
+
+    @classmethod
+    def detached(cls):
+        """Отдельный клиент со своим HTTP-соединением для фоновых потоков"""
+        client = object.__new__(cls)
+        client.connection = None
+        return client
+
+    def _http(self):
+        if self.connection is None:
+            from config import Config
+            url = urlsplit(Config.API_URL)
+            connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                                else http.client.HTTPConnection)
+            self.connection = connection_class(url.hostname, url.port, timeout=Config.API_TIMEOUT)
+            self.prefix = url.path.rstrip('/')
+        return self.connection
+
+    def _request(self, method, path, payload=None):
+        from config import Config
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json; charset=utf-8', 'X-Mine-User': session.user}
+        if Config.API_TOKEN:
+            headers['Authorization'] = f'Bearer {Config.API_TOKEN}'
+
+        # Сервер мог закрыть простаивающее соединение: одна повторная попытка
+        for attempt in range(2):
+            reused = self.connection is not None
+            try:
+                conn = self._http()
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if attempt or not reused:
+                    raise sqlite3.OperationalError(f'Сервер базы данных недоступен: {e}')
+
+        result = json.loads(data.decode('utf-8')) if data else {}
+        if response.status >= 400:
+            raise _sqlite_error(result)
+        return result
+
+    def connect(self):
+        """Проверка доступности сервера"""
+        try:
+            self.info = self._request('GET', '/api/health')
+            return self.connection
+        except sqlite3.Error as e:
+            print(f"Ошибка подключения к серверу: {e}")
+            return None
+
+    def get_connection(self):
+        raise RuntimeError('Прямое соединение с базой недоступно при работе через сервер')
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    @contextmanager
+    def transaction(self):
+        batch = RemoteBatch()
+        yield batch
+        if batch.statements:
+            with get_profiler().sql_block():
+                result = self._request('POST', '/api/batch', {'statements': batch.statements})
+            for cursor, item in zip(batch.cursors, result['results']):
+                cursor.set_result(item)
+
+    @contextmanager
+    def capture_suppressed(self):
+        raise RuntimeError('Служебные операции выполняются только на сервере')
+        yield
+
+    def max_variables(self):
+        info = getattr(self, 'info', None) or self._request('GET', '/api/health')
+        return info.get('max_variables', 999)
+
+    @profiled_query
+    def execute_query(self, query, params=None):
+        result = self._request('POST', '/api/execute', {'sql': query, 'params': list(params or [])})
+        return RemoteCursor(result)
+
+    @profiled_query
+    def execute_returning(self, query, params=None):
+        result = self._request('POST', '/api/execute', {'sql': query, 'params': list(params or [])})
+        return result['rows']
+
+    @profiled_query
+    def fetch_all(self, query, params=None):
+        try:
+            result = self._request('POST', '/api/query', {'sql': query, 'params': list(params or [])})
+            return result['rows']
+        except sqlite3.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return []
+
+    def fetch_rows(self, query, params=None, max_rows=None):
+        """Строки запроса, не больше max_rows; ошибки не перехватываются"""
+        payload = {'sql': query, 'params': list(params or [])}
+        if max_rows:
+            payload['max_rows'] = max_rows
+        return self._request('POST', '/api/query', payload)['rows']
+
+    @profiled_query
+    def fetch_one(self, query, params=None):
+        try:
+            result = self._request('POST', '/api/query',
+                                   {'sql': query, 'params': list(params or []), 'max_rows': 1})
+            return result['rows'][0] if result['rows'] else None
+        except sqlite3.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return None
+
+    @profiled_query
+    def fetch_tuples(self, query, params=None):
+        """Строки запроса кортежами; сервер отдает столбцы в порядке запроса"""
+        return [tuple(row.values()) for row in self.fetch_rows(query, params)]
+
+    def fetch_report(self, name):
+        """Отчет, собранный сервером вместе с архивными годами"""
+        result = self._request('GET', f'/api/reports/{name}')
+        return result['title'], result['rows']
@@ -0,0 +1,123 @@
+# Запросы отчетов: общие для окна программы и HTTP API.
+# Отчеты выполняются в аналитическом зеркале DuckDB, если оно доступно,
+# поэтому текст по возможности не использует функции, которых там нет.
+# Таблицы фактов в тексте - подстановки {mining}, {costs}, {time_sheet}:
+# в SQLite вместо них подставляются источники с архивными годами
+from datetime import date
+from database.archive import ARCHIVED_TABLES
+from database.tariffs import cost_sql
+from database.coal_prices import price_sql
+from database.payroll import calculation_sql
+
+# Стоимость ресурсов по тарифам, действовавшим на дату затрат
+ELECTRICITY_COST, FUEL_COST, TOTAL_COST = cost_sql('c')
+
+# Цена марки угля на дату добычи
+COAL_PRICE = price_sql('m.coal_mark', 'm.mining_date')
+
+# Начисления за текущий месяц по ставкам должностей
+CURRENT_MONTH_PAYROLL = calculation_sql(
+    "date('now', 'localtime', 'start of month')",
+    "date('now', 'localtime', 'start of month', '+1 month', '-1 day')",
+    '{time_sheet}'
+)
+
+REPORTS = {
+    'mining': ('Отчет по добыче', f"""
+    SELECT
+        m.mining_date as Дата,
+        s.section_name as Участок,
+        m.coal_mark as Марка_угля,
+        m.volume as Объем_добычи,
+        m.rock_volume as Объем_породы,
+        {COAL_PRICE} as Цена_за_тонну,
+        (m.volume * {COAL_PRICE}) as Стоимость_добычи
+    FROM {{mining}} m
+    JOIN sections s ON m.section_id = s.section_id
+    ORDER BY m.mining_date DESC
+    LIMIT 100
+    """),
+    'costs': ('Отчет по затратам', f"""
+    SELECT
+        c.cost_date as Дата,
+        s.section_name as Участок,
+        c.electricity as Электроэнергия_кВтч,
+        c.fuel as Топливо_л,
+        ROUND({ELECTRICITY_COST}, 2) as Стоимость_электроэнергии,
+        ROUND({FUEL_COST}, 2) as Стоимость_топлива,
+        ROUND({TOTAL_COST}, 2) as Общие_затраты
+    FROM {{costs}} c
+    JOIN sections s ON c.section_id = s.section_id
+    ORDER BY c.cost_date DESC
+    LIMIT 100
+    """),
+    'limits': ('Отчет по лимитам', """
+    SELECT
+        s.section_name as Участок,
+        l.month as Месяц,
+        l.year as Год,
+        l.plan_production as План_добычи,
+        l.actual_production as Факт_добычи,
+        l.plan_rock as План_породы,
+        l.actual_rock as Факт_породы,
+        CASE
+            WHEN l.plan_production > 0
+            THEN ROUND((l.actual_production * 100.0 / l.plan_production), 2)
+            ELSE 0
+        END as Процент_добычи
+    FROM limits l
+    JOIN sections s ON l.section_id = s.section_id
+    ORDER BY l.year DESC, l.month DESC
+    """),
+    'salary': ('Расчет заработной платы', f"""
+    SELECT
+        w.tab_number as Табельный_номер,
+        w.full_name as ФИО,
+        p.position_name as Должность,
+        s.section_name as Участок,
+        IFNULL(a.hours, 0) as Отработано_часов,
+        ROUND(IFNULL(a.amount, 0), 2) as Начислено_рублей
+    FROM workers w
+    JOIN positions p ON w.position_id = p.position_id
+    JOIN sections s ON w.section_id = s.section_id
+    LEFT JOIN ({CURRENT_MONTH_PAYROLL}) a ON a.tab_number = w.tab_number
+    ORDER BY s.section_name, w.full_name
+    """),
+    'production_rollup': ('Сводка добычи по месяцам', f"""
+    SELECT
+        substr(m.mining_date, 1, 4) as Год,
+        substr(m.mining_date, 6, 2) as Месяц,
+        s.section_name as Участок,
+        m.coal_mark as Марка_угля,
+        COUNT(*) as Смен,
+        SUM(m.volume) as Объем_добычи,
+        SUM(m.rock_volume) as Объем_породы,
+        SUM(m.volume * {COAL_PRICE}) as Стоимость_добычи
+    FROM {{mining}} m
+    JOIN sections s ON m.section_id = s.section_id
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1 DESC, 2 DESC, 3, 4
+    """),
+}
+
+def report_period(name):
+    """Период строк, которые читает отчет: текущий месяц или все время"""
+    if name == 'salary':
+        today = date.today()
+        return f'{today:%Y-%m}-01', f'{today:%Y-%m}-31'
+    return '0000-01-01', '9999-12-31'
+
+def report_query(name, source=None):
+    """Заголовок и текст отчета
+
+    source(table, date_from, date_to) - источник строк таблицы фактов за
+    период отчета (ArchiveManager.source), без него подставляются сами
+    таблицы: зеркало DuckDB хранит архивные годы в них.
+    """
+    title, query = REPORTS[name]
+    date_from, date_to = report_period(name)
+    sources = {
+        table: source(table, date_from, date_to) if source else table
+        for table in ARCHIVED_TABLES if f'{{{table}}}' in query
+    }
+    return title, query.format(**sources)
@@ -0,0 +1,248 @@
+from database.db_connection import DatabaseConnection
+from database.models import (
+    Coal, Position, Section, SectionView, Worker, WorkerView,
+    Mining, MiningView, Cost, CostView, Limits, LimitsView, columns,
+)
+
+class Repository:
+    """Чтение и запись записей одной таблицы
+
+    Записи строятся прямо из кортежей курсора, без промежуточных
+    словарей. Наследник задает таблицу, класс записи, ключ и порядок
+    списка; generated - ключ назначает база (AUTOINCREMENT).
+    """
+
+    table = None
+    model = None
+    key = None
+    order = None
+    generated = True
+    # Столбцы, которые пишутся при добавлении и изменении (по умолчанию все, кроме ключа)
+    insert_columns = None
+    update_columns = None
+    # Столбцы с часто повторяющимися строками
+    shared = ()
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    @property
+    def columns(self):
+        return columns(self.model)
+
+    def _data_columns(self):
+        return tuple(column for column in self.columns if column != self.key)
+
+    def _insert_columns(self):
+        data = self.insert_columns or self._data_columns()
+        return data if self.generated else (self.key,) + tuple(data)
+
+    def _update_columns(self):
+        return self.update_columns or self._data_columns()
+
+    def _select(self, alias=None):
+        prefix = f'{alias}.' if alias else ''
+        return ', '.join(prefix + column for column in self.columns)
+
+    def build(self, query, params=None, model=None):
+        """Записи по запросу, столбцы которого идут в порядке полей записи
+
+        Повторяющиеся строки столбцов shared (даты, марки, названия)
+        хранятся одним объектом на всю выборку.
+        """
+        model = model or self.model
+        rows = self.db.fetch_tuples(query, params)
+        indexes = [i for i, name in enumerate(columns(model)) if name in self.shared]
+        if not indexes:
+            return [model(*row) for row in rows]
+        strings = {}
+        records = []
+        for row in rows:
+            row = list(row)
+            for i in indexes:
+                row[i] = strings.setdefault(row[i], row[i])
+            records.append(model(*row))
+        return records
+
+    def all(self):
+        return self.build(f"SELECT {self._select()} FROM {self.table} ORDER BY {self.order}")
+
+    def get(self, key):
+        rows = self.build(f"SELECT {self._select()} FROM {self.table} WHERE {self.key} = ?", (key,))
+        return rows[0] if rows else None
+
+    def choices(self, label):
+        """Пары (ключ, подпись) для выпадающих списков"""
+        return self.db.fetch_tuples(f"SELECT {self.key}, {label} FROM {self.table} ORDER BY {label}")
+
+    def _insert_sql(self):
+        names = self._insert_columns()
+        return (f"INSERT INTO {self.table} ({', '.join(names)}) "
+                f"VALUES ({', '.join(['?'] * len(names))})")
+
+    def _update_sql(self):
+        names = self._update_columns()
+        return (f"UPDATE {self.table} SET {', '.join(f'{name} = ?' for name in names)} "
+                f"WHERE {self.key} = ?")
+
+    def _values(self, record, names):
+        return tuple(getattr(record, name) for name in names)
+
+    def insert(self, record):
+        """Добавление записи; назначенный базой ключ записывается в запись"""
+        cursor = self.db.execute_query(self._insert_sql(), self._values(record, self._insert_columns()))
+        if self.generated:
+            setattr(record, self.key, cursor.lastrowid)
+        return record
+
+    def update(self, record):
+        """Изменение записи по ключу; False, если записи уже нет"""
+        names = self._update_columns()
+        cursor = self.db.execute_query(self._update_sql(),
+                                       self._values(record, names) + (getattr(record, self.key),))
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        self.db.execute_query(f"DELETE FROM {self.table} WHERE {self.key} = ?", (key,))
+
+    def insert_many(self, records):
+        """Добавление последовательности записей одной транзакцией
+
+        Ключи, назначенные базой, в записи не возвращаются.
+        """
+        names = self._insert_columns()
+        with self.db.transaction() as conn:
+            conn.executemany(self._insert_sql(), [self._values(record, names) for record in records])
+
+    def update_many(self, records):
+        names = self._update_columns()
+        with self.db.transaction() as conn:
+            conn.executemany(self._update_sql(),
+                             [self._values(record, names) + (getattr(record, self.key),)
+                              for record in records])
+
+    def delete_many(self, keys):
+        with self.db.transaction() as conn:
+            conn.executemany(f"DELETE FROM {self.table} WHERE {self.key} = ?", [(key,) for key in keys])
+
+class CoalRepository(Repository):
+    table = 'coal'
+    model = Coal
+    key = 'coal_mark'
+    order = 'coal_mark'
+    generated = False
+    # Цена марки ведется в истории цен (database.coal_prices)
+    update_columns = ('ash_content', 'moisture', 'calorific_value')
+
+    def marks(self):
+        return [row[0] for row in self.db.fetch_tuples("SELECT coal_mark FROM coal ORDER BY coal_mark")]
+
+class PositionRepository(Repository):
+    table = 'positions'
+    model = Position
+    key = 'position_id'
+    order = 'position_name'
+
+    def choices(self, label='position_name'):
+        return super().choices(label)
+
+class SectionRepository(Repository):
+    table = 'sections'
+    model = Section
+    key = 'section_id'
+    order = 'section_name'
+
+    def choices(self, label='section_name'):
+        return super().choices(label)
+
+    def listing(self):
+        """Участки с руководителями для списка"""
+        return self.build(f"""
+        SELECT {self._select('s')}, w.full_name
+        FROM sections s
+        LEFT JOIN workers w ON s.manager_tab_number = w.tab_number
+        ORDER BY s.section_name
+        """, model=SectionView)
+
+class WorkerRepository(Repository):
+    table = 'workers'
+    model = Worker
+    key = 'tab_number'
+    order = 'full_name'
+    generated = False
+    shared = ('gender', 'section_name', 'position_name')
+
+    def choices(self, label='full_name'):
+        return super().choices(label)
+
+    def listing(self, section_id=None):
+        """Работники с участком и должностью, при section_id - одного участка"""
+        condition = 'WHERE w.section_id = ?' if section_id else ''
+        return self.build(f"""
+        SELECT {self._select('w')}, s.section_name, p.position_name
+        FROM workers w
+        JOIN sections s ON w.section_id = s.section_id
+        JOIN positions p ON w.position_id = p.position_id
+        {condition}
+        ORDER BY w.full_name
+        """, (section_id,) if section_id else None, model=WorkerView)
+
+class MiningRepository(Repository):
+    table = 'mining'
+    model = Mining
+    key = 'mining_id'
+    order = 'mining_date DESC, shift'
+    shared = ('mining_date', 'coal_mark', 'section_name')
+
+    def period(self, date_from, date_to):
+        """Добыча за период с названиями участков, вместе с архивными годами"""
+        from database.archive import get_archive_manager
+        source = get_archive_manager().source('mining', date_from, date_to)
+        return self.build(f"""
+        SELECT {self._select('m')}, s.section_name
+        FROM {source} m
+        JOIN sections s ON m.section_id = s.section_id
+        WHERE m.mining_date BETWEEN ? AND ?
+        ORDER BY m.mining_date DESC, m.shift
+        """, (date_from, date_to), model=MiningView)
+
+class CostRepository(Repository):
+    table = 'costs'
+    model = Cost
+    key = 'cost_id'
+    order = 'cost_date DESC, shift'
+    shared = ('cost_date', 'section_name')
+
+    def period(self, date_from, date_to):
+        """Затраты за период со стоимостью по тарифам на дату затрат"""
+        from database.archive import get_archive_manager
+        from database.tariffs import cost_sql
+        source = get_archive_manager().source('costs', date_from, date_to)
+        return self.build(f"""
+        SELECT {self._select('c')}, s.section_name, {cost_sql('c')[2]}
+        FROM {source} c
+        JOIN sections s ON c.section_id = s.section_id
+        WHERE c.cost_date BETWEEN ? AND ?
+        ORDER BY c.cost_date DESC, c.shift
+        """, (date_from, date_to), model=CostView)
+
+class LimitsRepository(Repository):
+    table = 'limits'
+    model = Limits
+    key = 'limit_id'
+    order = 'year DESC, month DESC'
+    shared = ('section_name',)
+    # Фактические показатели ведут триггеры добычи и затрат
+    insert_columns = update_columns = (
+        'section_id', 'month', 'year',
+        'plan_production', 'plan_rock', 'plan_electricity', 'plan_fuel',
+    )
+
+    def listing(self):
+        """Лимиты с названиями участков, новые месяцы первыми"""
+        return self.build(f"""
+        SELECT {self._select('l')}, s.section_name
+        FROM limits l
+        JOIN sections s ON l.section_id = s.section_id
+        ORDER BY l.year DESC, l.month DESC, s.section_name
+        """, model=LimitsView)
@@ -0,0 +1,132 @@
+from database.db_connection import DatabaseConnection
+
+# Ресурсы, оплачиваемые по тарифу: название и единица измерения
+RESOURCES = {
+    'electricity': ('Электроэнергия', 'кВт·ч'),
+    'fuel': ('Топливо', 'л'),
+}
+
+# Тарифы, действовавшие до ведения истории (прежние константы расчета затрат)
+INITIAL_TARIFFS = {'electricity': 5.5, 'fuel': 55}
+INITIAL_DATE = '1900-01-01'
+
+# Конец интервала действия последнего тарифа
+OPEN_END = '9999-12-31'
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS tariffs (
+    resource TEXT NOT NULL CHECK (resource IN ('electricity', 'fuel')),
+    valid_from TEXT NOT NULL,
+    price REAL NOT NULL CHECK (price >= 0),
+    PRIMARY KEY (resource, valid_from)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO tariffs (resource, valid_from, price) VALUES
+    ('electricity', '{INITIAL_DATE}', {INITIAL_TARIFFS['electricity']}),
+    ('fuel', '{INITIAL_DATE}', {INITIAL_TARIFFS['fuel']});
+"""
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+def tariff_sql(resource, date_column):
+    """Подзапрос цены ресурса, действовавшей на дату date_column
+
+    Поиск идет по первичному ключу (resource, valid_from): одно обращение
+    к индексу на строку, без просмотра всей истории тарифов.
+    """
+    return (f"(SELECT t.price FROM tariffs t WHERE t.resource = '{resource}' "
+            f"AND t.valid_from <= {date_column} ORDER BY t.valid_from DESC LIMIT 1)")
+
+def cost_sql(alias='c'):
+    """Выражения стоимости электроэнергии, топлива и итога для строки затрат"""
+    electricity = f"IFNULL({alias}.electricity, 0) * {tariff_sql('electricity', f'{alias}.cost_date')}"
+    fuel = f"IFNULL({alias}.fuel, 0) * {tariff_sql('fuel', f'{alias}.cost_date')}"
+    return electricity, fuel, f"({electricity} + {fuel})"
+
+# Интервалы действия тарифов [valid_from, valid_to)
+INTERVALS_SQL = f"""
+SELECT resource, valid_from, price,
+       LEAD(valid_from, 1, '{OPEN_END}') OVER (PARTITION BY resource ORDER BY valid_from) AS valid_to
+FROM tariffs
+"""
+
+# Группировка результатов пересчета
+REPRICE_GROUPS = {
+    'month': ('substr(c.cost_date, 1, 7)', 'period'),
+    'year': ('substr(c.cost_date, 1, 4)', 'period'),
+    'section': ('s.section_name', 'section_name'),
+}
+
+class TariffService:
+    """История тарифов и расчет стоимости затрат по тарифу на дату"""
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+
+    def list(self, resource=None):
+        if resource:
+            return self.db.fetch_all(
+                "SELECT * FROM tariffs WHERE resource = ? ORDER BY valid_from DESC", (resource,))
+        return self.db.fetch_all("SELECT * FROM tariffs ORDER BY resource, valid_from DESC")
+
+    def set_tariff(self, resource, valid_from, price):
+        """Новый тариф с даты valid_from или исправление уже заведенного"""
+        if resource not in RESOURCES:
+            raise ValueError(f'Неизвестный ресурс: {resource}')
+        self.db.execute_query("""
+        INSERT INTO tariffs (resource, valid_from, price) VALUES (?, ?, ?)
+        ON CONFLICT (resource, valid_from) DO UPDATE SET price = excluded.price
+        """, (resource, valid_from, price))
+
+    def delete_tariff(self, resource, valid_from):
+        # Без начального тарифа затраты до первой даты истории остались бы без цены
+        first = self.db.fetch_one(
+            "SELECT MIN(valid_from) AS valid_from FROM tariffs WHERE resource = ?", (resource,))
+        if first and first['valid_from'] == valid_from:
+            raise ValueError('Нельзя удалить начальный тариф ресурса, его можно только изменить')
+        self.db.execute_query(
+            "DELETE FROM tariffs WHERE resource = ? AND valid_from = ?", (resource, valid_from))
+
+    def price_on(self, resource, on_date):
+        row = self.db.fetch_one(
+            f"SELECT {tariff_sql(resource, '?')} AS price", (on_date,))
+        return row['price'] if row else None
+
+    def reprice(self, date_from, date_to, group_by='month'):
+        """Стоимость затрат за период по действовавшим тарифам
+
+        Расчет выполняется одним запросом: строки затрат за период
+        соединяются с интервалами действия тарифов по диапазону дат,
+        без обращения к истории тарифов для каждой строки отдельно.
+        """
+        from database.archive import get_archive_manager
+
+        if group_by not in REPRICE_GROUPS:
+            raise ValueError(f'Неизвестная группировка: {group_by}')
+        expression, name = REPRICE_GROUPS[group_by]
+        source = get_archive_manager().source('costs', date_from, date_to)
+
+        query = f"""
+        WITH intervals AS ({INTERVALS_SQL})
+        SELECT {expression} AS {name},
+               COUNT(*) AS records,
+               SUM(IFNULL(c.electricity, 0)) AS electricity,
+               SUM(IFNULL(c.fuel, 0)) AS fuel,
+               SUM(IFNULL(c.electricity, 0) * e.price) AS electricity_cost,
+               SUM(IFNULL(c.fuel, 0) * f.price) AS fuel_cost,
+               SUM(IFNULL(c.electricity, 0) * e.price + IFNULL(c.fuel, 0) * f.price) AS total_cost
+        FROM {source} c
+        JOIN sections s ON c.section_id = s.section_id
+        JOIN intervals e ON e.resource = 'electricity'
+             AND c.cost_date >= e.valid_from AND c.cost_date < e.valid_to
+        JOIN intervals f ON f.resource = 'fuel'
+             AND c.cost_date >= f.valid_from AND c.cost_date < f.valid_to
+        WHERE c.cost_date BETWEEN ? AND ?
+        GROUP BY 1
+        ORDER BY 1
+        """
+        return self.db.fetch_all(query, (date_from, date_to))
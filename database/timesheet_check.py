@@ -0,0 +1,196 @@
+import bisect
+from datetime import date
+from config import Config
+from database.db_connection import DatabaseConnection
+
+SCHEMA = """
+-- Часы работника по датам: загрузка индекса одного работника читает только этот индекс
+CREATE INDEX IF NOT EXISTS idx_time_sheet_worker ON time_sheet (tab_number, date, shift, hours);
+"""
+
+def ensure_schema(db=None):
+    db = db or DatabaseConnection()
+    conn = db.get_connection()
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+def problem_text(kind, value=None):
+    """Описание нарушения для сообщения пользователю"""
+    if kind == 'double_shift':
+        return 'записан на обе смены за сутки'
+    if kind == 'week_hours':
+        return f'{value:g} ч за 7 дней при допустимых {Config.TIMESHEET_WEEK_HOURS:g}'
+    if kind == 'foreign_section':
+        return 'участок не совпадает с участком в карточке работника'
+    return kind
+
+class WorkerTimeline:
+    """Отработанные сутки одного работника
+
+    Даты хранятся порядковыми номерами в отсортированном списке вместе
+    с накопленной суммой часов: часы за любой интервал дат - два
+    двоичных поиска и разность сумм.
+    """
+
+    def __init__(self, rows):
+        self.days = []
+        self.shifts = []
+        self.prefix = [0.0]
+        for row in rows:
+            day = date.fromisoformat(row['date']).toordinal()
+            if not self.days or self.days[-1] != day:
+                self.days.append(day)
+                self.shifts.append({})
+                self.prefix.append(self.prefix[-1])
+            self.shifts[-1][row['shift']] = row['hours'] or 0
+            self.prefix[-1] += row['hours'] or 0
+
+    def hours_between(self, first, last):
+        """Часы за сутки с first по last включительно"""
+        lo = bisect.bisect_left(self.days, first)
+        hi = bisect.bisect_right(self.days, last)
+        return self.prefix[hi] - self.prefix[lo]
+
+    def shifts_on(self, day):
+        """Часы по сменам за сутки: {смена: часы}"""
+        i = bisect.bisect_left(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            return self.shifts[i]
+        return {}
+
+class TimesheetValidator:
+    """Проверка табеля: две смены за сутки, переработка за неделю, чужой участок
+
+    Отдельная запись проверяется по индексу работника в памяти за
+    O(log n). Индексы строятся при первом обращении и сбрасываются для
+    работников, чьи записи изменились по журналу изменений. Проверка
+    месяца по всем работникам - один запрос с оконной суммой.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseConnection()
+        self.timelines = {}
+        self.last_seq = None
+
+    def _sync(self):
+        state = self.db.fetch_one(
+            "SELECT IFNULL(MAX(seq), 0) AS current, MIN(seq) AS oldest FROM change_log")
+        current, oldest = state['current'], state['oldest']
+        if (self.last_seq is None or current < self.last_seq
+                or (oldest is not None and oldest > self.last_seq + 1)):
+            # База восстановлена или журнал очищен: индексы строятся заново
+            self.timelines.clear()
+        elif current > self.last_seq:
+            for row in self.db.fetch_all("""
+            SELECT DISTINCT json_extract(row_key, '$[2]') AS tab_number
+            FROM change_log
+            WHERE table_name = 'time_sheet' AND seq > ?
+            """, (self.last_seq,)):
+                self.timelines.pop(row['tab_number'], None)
+        self.last_seq = current
+
+    def timeline(self, tab_number):
+        timeline = self.timelines.get(tab_number)
+        if timeline is None:
+            timeline = WorkerTimeline(self.db.fetch_all(
+                "SELECT date, shift, hours FROM time_sheet WHERE tab_number = ? ORDER BY date, shift",
+                (tab_number,)))
+            self.timelines[tab_number] = timeline
+        return timeline
+
+    def check(self, tab_number, work_date, shift, hours, section_id=None, replacing=None):
+        """Нарушения, которые появятся после записи смены
+
+        replacing - (дата, смена) исправляемой записи того же работника,
+        ее часы не учитываются; запись на те же дату и смену заменяет
+        прежнюю. section_id - участок записи, если он выбран не по карточке.
+        Возвращает список (вид, значение).
+        """
+        self._sync()
+        timeline = self.timeline(tab_number)
+        day = date.fromisoformat(work_date).toordinal()
+
+        # Часы, которые исчезнут из индекса после записи: {сутки: часы}
+        removed = {}
+        overwritten = timeline.shifts_on(day).get(shift)
+        if overwritten is not None:
+            removed[day] = overwritten
+        if replacing and tuple(replacing) != (work_date, shift):
+            old_day = date.fromisoformat(replacing[0]).toordinal()
+            old_hours = timeline.shifts_on(old_day).get(replacing[1])
+            if old_hours is not None:
+                removed[old_day] = removed.get(old_day, 0) + old_hours
+
+        problems = []
+        other_shifts = set(timeline.shifts_on(day)) - {shift}
+        if replacing and date.fromisoformat(replacing[0]).toordinal() == day:
+            other_shifts.discard(replacing[1])
+        if other_shifts and not Config.TIMESHEET_ALLOW_DOUBLE_SHIFT:
+            problems.append(('double_shift', None))
+
+        # Все семидневные окна, в которые попадают сутки записи
+        worst = 0.0
+        for end in range(day, day + 7):
+            total = timeline.hours_between(end - 6, end) + hours
+            total -= sum(value for removed_day, value in removed.items() if end - 6 <= removed_day <= end)
+            worst = max(worst, total)
+        if worst > Config.TIMESHEET_WEEK_HOURS:
+            problems.append(('week_hours', worst))
+
+        if section_id is not None:
+            worker = self.db.fetch_one("SELECT section_id FROM workers WHERE tab_number = ?", (tab_number,))
+            if worker and worker['section_id'] != section_id:
+                problems.append(('foreign_section', None))
+        return problems
+
+    def audit(self, month):
+        """Нарушения табеля за месяц YYYY-MM по всем работникам
+
+        Часы суммируются по суткам работника, скользящая сумма за 7 дней
+        считается оконной функцией по диапазону дат. В окна первых суток
+        месяца входят последние дни предыдущего месяца.
+        """
+        from database.archive import get_archive_manager
+
+        start, end = f'{month}-01', f'{month}-31'
+        window_start = self.db.fetch_one("SELECT date(?, '-6 days') AS day", (start,))['day']
+        source = get_archive_manager().source('time_sheet', window_start, end)
+        double_shift = '' if Config.TIMESHEET_ALLOW_DOUBLE_SHIFT else 'r.shifts > 1 OR '
+
+        return self.db.fetch_all(f"""
+        WITH days AS (
+            SELECT t.tab_number, t.date, SUM(t.hours) AS hours, COUNT(*) AS shifts,
+                   SUM(t.section_id IS NOT w.section_id) AS foreign_shifts
+            FROM {source} t
+            JOIN workers w ON w.tab_number = t.tab_number
+            WHERE t.date BETWEEN ? AND ?
+            GROUP BY t.tab_number, t.date
+        ),
+        rolling AS (
+            SELECT *,
+                   SUM(hours) OVER (PARTITION BY tab_number ORDER BY julianday(date)
+                                    RANGE BETWEEN 6 PRECEDING AND CURRENT ROW) AS week_hours
+            FROM days
+        )
+        SELECT r.date, r.tab_number, w.full_name, s.section_name,
+               r.hours, r.shifts, r.week_hours, r.foreign_shifts
+        FROM rolling r
+        JOIN workers w ON w.tab_number = r.tab_number
+        JOIN sections s ON w.section_id = s.section_id
+        WHERE r.date BETWEEN ? AND ?
+          AND ({double_shift}r.week_hours > ? OR r.foreign_shifts > 0)
+        ORDER BY w.full_name, r.date
+        """, (window_start, end, start, end, Config.TIMESHEET_WEEK_HOURS))
+
+_validator = None
+
+def get_timesheet_validator():
+    """Общий проверяющий табеля процесса"""
+    global _validator
+    if _validator is None:
+        _validator = TimesheetValidator()
+    return _validator
+
+def reset_timesheet_validator():
+    global _validator
+    _validator = None
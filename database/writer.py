@@ -0,0 +1,196 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from database.db_connection import open_connection, session
+
+def is_busy(error):
+    """Ошибка блокировки базы другим соединением (SQLITE_BUSY/SQLITE_LOCKED)"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+class WriteResult:
+    """Итог запроса из очереди с полями sqlite3.Cursor"""
+
+    def __init__(self, result):
+        self.rowcount = result['rowcount']
+        self.lastrowid = result['lastrowid']
+        self.rows = result['rows']
+
+class WriteRequest:
+    def __init__(self, statements, user=None, authorizer=None):
+        self.statements = statements
+        self.user = user
+        # Проверка действий запросов (sqlite3 set_authorizer) для запросов извне
+        self.authorizer = authorizer
+        self.future = Future()
+
+class WriteQueue:
+    """Единственный поток-писатель с групповой фиксацией
+
+    Запросы, пришедшие в течение короткого окна, выполняются в одной
+    транзакции, каждый внутри своей точки сохранения: ошибка одного
+    запроса не отменяет остальные. При блокировке базы вся группа
+    повторяется с нарастающей паузой.
+    """
+
+    def __init__(self, path=None, window=None, max_batch=None, retries=None):
+        from config import Config
+        self.path = path
+        self.window = Config.WRITE_GROUP_WINDOW if window is None else window
+        self.max_batch = max_batch or Config.WRITE_GROUP_MAX
+        self.retries = Config.WRITE_BUSY_RETRIES if retries is None else retries
+        self.backoff = Config.WRITE_BUSY_BACKOFF
+        self.busy_timeout = Config.WRITE_BUSY_TIMEOUT
+        self.requests = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Счетчики для оценки пользы группировки
+        self.stats = {'requests': 0, 'groups': 0, 'retries': 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='mine-writer', daemon=True)
+                self.thread.start()
+        return self
+
+    def submit(self, statements, user=None, authorizer=None):
+        """Постановка запросов [(sql, params), ...] в очередь, возвращает Future
+
+        Результат - список {'rows', 'rowcount', 'lastrowid'} по каждому запросу.
+        authorizer действует только на запросы этой заявки.
+        """
+        request = WriteRequest(list(statements), user, authorizer)
+        self.start()
+        self.requests.put(request)
+        return request.future
+
+    def execute(self, query, params=None):
+        """Выполнение одного запроса с ожиданием результата"""
+        return self.submit([(query, params or ())]).result()[0]
+
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.requests.put(None)
+            thread.join()
+
+    def _run(self):
+        from database.archive import ConnectionArchive
+
+        conn = open_connection('writer', path=self.path, timeout=self.busy_timeout,
+                               isolation_level=None)
+        archive = ConnectionArchive(conn)
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                group = [request]
+                deadline = time.monotonic() + self.window
+                stop = False
+                while len(group) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    try:
+                        request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is None:
+                        stop = True
+                        break
+                    group.append(request)
+                self._commit_group(conn, group, archive)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _run_request(self, conn, request):
+        previous_user = session.user
+        session.user = request.user or previous_user
+        if request.authorizer:
+            conn.set_authorizer(request.authorizer)
+        try:
+            results = []
+            for query, params in request.statements:
+                cursor = conn.execute(query, params or ())
+                rows = [dict(row) for row in cursor.fetchall()] if cursor.description else []
+                results.append({
+                    'rows': rows,
+                    'rowcount': cursor.rowcount,
+                    'lastrowid': cursor.lastrowid,
+                })
+                cursor.close()
+            return results
+        finally:
+            if request.authorizer:
+                conn.set_authorizer(None)
+            session.user = previous_user
+
+    def _commit_group(self, conn, group, archive=None):
+        # Архивы, на которые ссылаются запросы, подключаются до начала транзакции
+        if archive is not None:
+            try:
+                archive.attach_referenced([query for request in group for query, _ in request.statements])
+            except Exception as e:
+                for request in group:
+                    request.future.set_exception(e)
+                return
+        for attempt in range(self.retries + 1):
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for request in group:
+                    conn.execute("SAVEPOINT request")
+                    try:
+                        outcomes.append((request, self._run_request(conn, request), None))
+                        conn.execute("RELEASE request")
+                    except Exception as e:
+                        if is_busy(e):
+                            raise
+                        conn.execute("ROLLBACK TO request")
+                        conn.execute("RELEASE request")
+                        outcomes.append((request, None, e))
+                conn.execute("COMMIT")
+                break
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if is_busy(e) and attempt < self.retries:
+                    self.stats['retries'] += 1
+                    time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+                    continue
+                for request in group:
+                    request.future.set_exception(e)
+                return
+
+        self.stats['requests'] += len(group)
+        self.stats['groups'] += 1
+        for request, result, error in outcomes:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+
+_write_queue = None
+
+def get_write_queue():
+    """Общая очередь записи процесса"""
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = WriteQueue()
+    return _write_queue
+
+def close_write_queue():
+    global _write_queue
+    if _write_queue is not None:
+        _write_queue.close()
+        _write_queue = None
@@ -0,0 +1,82 @@
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from config import Config
+from database.db_connection import open_connection
+
+class BackgroundTask(QThread):
+    """Служебная задача окна в фоновом потоке
+
+    Соединение окна принадлежит основному потоку, поэтому задача
+    task(connection) получает отдельное соединение на время выполнения.
+    Результат или текст ошибки приходят сигналами в основной поток.
+    На выданном соединении стоит обработчик прогресса progress: так
+    работают отмена и ограничение времени timeout (с). Задача с другими
+    соединениями передает им progress сама.
+    """
+
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # Ход долгой задачи (осталось, всего), например страниц backup API
+    step = pyqtSignal(int, int)
+
+    def __init__(self, task, parent=None, timeout=None, with_connection=True):
+        super().__init__(parent)
+        self.task = task
+        # with_connection=False - задача работает с файлом базы сама и получает None
+        self.with_connection = with_connection
+        self.timeout = timeout
+        self.cancelled = False
+        self.timed_out = False
+        self.started = time.perf_counter()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def progress(self):
+        """Обработчик прогресса SQLite: ненулевой ответ прерывает задачу"""
+        if self.cancelled:
+            return 1
+        if self.timeout and time.perf_counter() - self.started > self.timeout:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def run(self):
+        self.started = time.perf_counter()
+        try:
+            conn = open_connection('writer') if self.with_connection else None
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        try:
+            if conn is not None:
+                conn.set_progress_handler(self.progress, Config.QUERY_PROGRESS_STEPS)
+            self.done.emit(self.task(conn))
+        except Exception as e:
+            if self.timed_out:
+                self.failed.emit(f'Задача прервана: время выполнения больше {self.timeout} с')
+            elif self.cancelled:
+                self.failed.emit('Задача отменена')
+            else:
+                self.failed.emit(str(e))
+        finally:
+            if conn is not None:
+                conn.close()
+
+def start_task(owner, name, task, on_done=None, on_failed=None):
+    """Запуск задачи, если прежний запуск с тем же именем уже завершился
+
+    Поток хранится в атрибуте owner.<name>, возвращает False, если задача
+    еще выполняется.
+    """
+    worker = getattr(owner, name, None)
+    if worker is not None and worker.isRunning():
+        return False
+    worker = BackgroundTask(task, owner)
+    if on_done:
+        worker.done.connect(on_done)
+    if on_failed:
+        worker.failed.connect(on_failed)
+    setattr(owner, name, worker)
+    worker.start()
+    return True
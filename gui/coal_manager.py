@@ -1,12 +1,17 @@
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QDoubleValidator, QIntValidator 
 from database.db_connection import DatabaseConnection
+from database.models import Coal
+from database.repositories import CoalRepository
+from database.coal_prices import CoalPriceHistory, get_price_cache
+from database.profiler import profiled
 
 class CoalManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.coals = CoalRepository(self.db)
         self.current_coal = None
         self.init_ui()
         self.load_data()
@@ -32,10 +37,14 @@ class CoalManager(QDialog):
         self.refresh_btn = QPushButton('Обновить')
         self.refresh_btn.clicked.connect(self.load_data)
         
+        self.history_btn = QPushButton('История цен')
+        self.history_btn.clicked.connect(self.show_price_history)
+        
         toolbar.addWidget(self.add_btn)
         toolbar.addWidget(self.edit_btn)
         toolbar.addWidget(self.delete_btn)
         toolbar.addWidget(self.refresh_btn)
+        toolbar.addWidget(self.history_btn)
         toolbar.addStretch()
         
         layout.addLayout(toolbar)
@@ -57,19 +66,19 @@ class CoalManager(QDialog):
         self.status_label = QLabel('Готово')
         layout.addWidget(self.status_label)
     
+    @profiled
     def load_data(self):
         try:
-            query = "SELECT * FROM coal ORDER BY coal_mark"
-            results = self.db.fetch_all(query)
+            results = self.coals.all()
             
             self.table.setRowCount(len(results))
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(row['coal_mark']))
-                self.table.setItem(i, 1, QTableWidgetItem(f"{row['ash_content']:.1f}" if row['ash_content'] else ''))
-                self.table.setItem(i, 2, QTableWidgetItem(f"{row['moisture']:.1f}" if row['moisture'] else ''))
-                self.table.setItem(i, 3, QTableWidgetItem(str(row['calorific_value']) if row['calorific_value'] else ''))
-                self.table.setItem(i, 4, QTableWidgetItem(f"{row['price_per_ton']:,.0f}" if row['price_per_ton'] else ''))
+            for i, coal in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(coal.coal_mark))
+                self.table.setItem(i, 1, QTableWidgetItem(f"{coal.ash_content:.1f}" if coal.ash_content else ''))
+                self.table.setItem(i, 2, QTableWidgetItem(f"{coal.moisture:.1f}" if coal.moisture else ''))
+                self.table.setItem(i, 3, QTableWidgetItem(str(coal.calorific_value) if coal.calorific_value else ''))
+                self.table.setItem(i, 4, QTableWidgetItem(f"{coal.price_per_ton:,.0f}" if coal.price_per_ton else ''))
             
             self.table.resizeColumnsToContents()
             self.status_label.setText(f'Загружено записей: {len(results)}')
@@ -104,6 +113,9 @@ class CoalManager(QDialog):
         moisture_edit = QLineEdit()
         calorific_edit = QLineEdit()
         price_edit = QLineEdit()
+        price_date_edit = QDateEdit()
+        price_date_edit.setCalendarPopup(True)
+        price_date_edit.setDate(QDate.currentDate())
         
         # Валидаторы
         ash_edit.setValidator(QDoubleValidator(0, 100, 2))
@@ -113,28 +125,31 @@ class CoalManager(QDialog):
         
         # Загружаем данные для редактирования
         if self.current_coal:
-            query = "SELECT * FROM coal WHERE coal_mark = ?"
-            coal_data = self.db.fetch_one(query, (self.current_coal,))
+            coal = self.coals.get(self.current_coal)
             
-            if coal_data:
-                coal_edit.setText(coal_data['coal_mark'])
+            if coal:
+                coal_edit.setText(coal.coal_mark)
                 coal_edit.setReadOnly(True)  # Нельзя менять марку
-                ash_edit.setText(str(coal_data['ash_content']) if coal_data['ash_content'] else '')
-                moisture_edit.setText(str(coal_data['moisture']) if coal_data['moisture'] else '')
-                calorific_edit.setText(str(coal_data['calorific_value']) if coal_data['calorific_value'] else '')
-                price_edit.setText(str(coal_data['price_per_ton']) if coal_data['price_per_ton'] else '')
+                ash_edit.setText(str(coal.ash_content) if coal.ash_content else '')
+                moisture_edit.setText(str(coal.moisture) if coal.moisture else '')
+                calorific_edit.setText(str(coal.calorific_value) if coal.calorific_value else '')
+                price_edit.setText(str(coal.price_per_ton) if coal.price_per_ton else '')
         
         layout.addRow('Марка угля:', coal_edit)
         layout.addRow('Зольность, %:', ash_edit)
         layout.addRow('Влажность, %:', moisture_edit)
         layout.addRow('Теплота сгорания, ккал/кг:', calorific_edit)
         layout.addRow('Стоимость 1 тн, руб.:', price_edit)
+        # Новая цена не меняет стоимость добычи до этой даты
+        if self.current_coal:
+            layout.addRow('Цена действует с:', price_date_edit)
         
         # Кнопки
         btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         btn_box.accepted.connect(lambda: self.save_coal(
             dialog, coal_edit.text(), ash_edit.text(), 
-            moisture_edit.text(), calorific_edit.text(), price_edit.text()
+            moisture_edit.text(), calorific_edit.text(), price_edit.text(),
+            price_date_edit.date().toString('yyyy-MM-dd')
         ))
         btn_box.rejected.connect(dialog.reject)
         
@@ -142,44 +157,46 @@ class CoalManager(QDialog):
         
         dialog.exec_()
     
-    def save_coal(self, dialog, coal_mark, ash, moisture, calorific, price):
+    @profiled
+    def save_coal(self, dialog, coal_mark, ash, moisture, calorific, price, price_date=None):
         # Валидация
         if not coal_mark.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите марку угля')
             return
         
         try:
-            ash_value = float(ash) if ash else None
-            moisture_value = float(moisture) if moisture else None
-            calorific_value = int(calorific) if calorific else None
-            price_value = float(price) if price else None
+            coal = Coal(
+                coal_mark=coal_mark,
+                ash_content=float(ash) if ash else None,
+                moisture=float(moisture) if moisture else None,
+                calorific_value=int(calorific) if calorific else None,
+                price_per_ton=float(price) if price else None,
+            )
             
             if self.current_coal:
-                # Обновление существующей записи
-                query = """
-                UPDATE coal SET 
-                    ash_content = ?, 
-                    moisture = ?, 
-                    calorific_value = ?, 
-                    price_per_ton = ?
-                WHERE coal_mark = ?
-                """
-                params = (ash_value, moisture_value, calorific_value, price_value, coal_mark)
+                # Обновление существующей записи; цена ведется в истории цен
+                if not self.coals.update(coal):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
+                
+                history = CoalPriceHistory(self.db).history(coal_mark)
+                current = next((row['price'] for row in history if row['valid_from'] <= price_date), None)
+                if coal.price_per_ton and coal.price_per_ton != current:
+                    CoalPriceHistory(self.db).set_price(coal_mark, price_date, coal.price_per_ton)
             else:
                 # Добавление новой записи
-                query = """
-                INSERT INTO coal (coal_mark, ash_content, moisture, calorific_value, price_per_ton)
-                VALUES (?, ?, ?, ?, ?)
-                """
-                params = (coal_mark, ash_value, moisture_value, calorific_value, price_value)
+                self.coals.insert(coal)
             
-            self.db.execute_query(query, params)
+            get_price_cache().invalidate()
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_coal(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -197,8 +214,7 @@ class CoalManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM coal WHERE coal_mark = ?"
-                self.db.execute_query(query, (coal_mark,))
+                self.coals.delete(coal_mark)
                 self.load_data()
                 self.status_label.setText(f'Марка угля "{coal_mark}" удалена')
             except Exception as e:
@@ -209,4 +225,56 @@ class CoalManager(QDialog):
                         'так как есть записи о добыче этого угля.'
                     )
                 else:
-                    QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
\ No newline at end of file
+                    QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
+    
+    @profiled
+    def show_price_history(self):
+        selected_row = self.table.currentRow()
+        if selected_row < 0:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите марку угля')
+            return
+        
+        coal_mark = self.table.item(selected_row, 0).text()
+        prices = CoalPriceHistory(self.db)
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f'История цен: {coal_mark}')
+        dialog.setMinimumSize(400, 300)
+        layout = QVBoxLayout(dialog)
+        
+        table = QTableWidget()
+        table.setColumnCount(2)
+        table.setHorizontalHeaderLabels(['Действует с', 'Стоимость 1 тн, руб.'])
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(table)
+        
+        def load_history():
+            history = prices.history(coal_mark)
+            table.setRowCount(len(history))
+            for i, row in enumerate(history):
+                table.setItem(i, 0, QTableWidgetItem(row['valid_from']))
+                table.setItem(i, 1, QTableWidgetItem(f"{row['price']:,.2f}"))
+            table.resizeColumnsToContents()
+        
+        def delete_price():
+            row = table.currentRow()
+            if row < 0:
+                return
+            try:
+                prices.delete_price(coal_mark, table.item(row, 0).text())
+                load_history()
+                self.load_data()
+            except ValueError as e:
+                QMessageBox.warning(dialog, 'Предупреждение', str(e))
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка удаления: {str(e)}')
+        
+        btn_box = QDialogButtonBox(QDialogButtonBox.Close)
+        delete_btn = btn_box.addButton('Удалить цену', QDialogButtonBox.ActionRole)
+        delete_btn.clicked.connect(delete_price)
+        btn_box.rejected.connect(dialog.reject)
+        layout.addWidget(btn_box)
+        
+        load_history()
+        dialog.exec_()
@@ -2,12 +2,17 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QDoubleValidator
 from database.db_connection import DatabaseConnection
+from database.archive import get_archive_manager, ARCHIVED_DATE_MESSAGE
+from database.models import Cost
+from database.repositories import CostRepository, SectionRepository
+from database.profiler import profiled
 from datetime import datetime
 
 class CostManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.costs = CostRepository(self.db)
         self.current_cost_id = None
         self.init_ui()
         self.load_data()
@@ -76,21 +81,15 @@ class CostManager(QDialog):
         self.stats_label = QLabel('')
         layout.addWidget(self.stats_label)
     
+    @profiled
     def load_data(self):
         try:
             date_from = self.date_from.date().toString('yyyy-MM-dd')
             date_to = self.date_to.date().toString('yyyy-MM-dd')
             
-            query = """
-            SELECT c.*, s.section_name,
-                   (c.electricity * 5.5 + c.fuel * 55) as total_cost
-            FROM costs c
-            JOIN sections s ON c.section_id = s.section_id
-            WHERE c.cost_date BETWEEN ? AND ?
-            ORDER BY c.cost_date DESC, c.shift
-            """
-            
-            results = self.db.fetch_all(query, (date_from, date_to))
+            # Для периодов в закрытых годах подключаются архивные файлы,
+            # стоимость считается по тарифам, действовавшим на дату затрат
+            results = self.costs.period(date_from, date_to)
             
             self.table.setRowCount(len(results))
             
@@ -98,18 +97,18 @@ class CostManager(QDialog):
             total_fuel = 0
             total_cost = 0
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['cost_id'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['cost_date']))
-                self.table.setItem(i, 2, QTableWidgetItem(str(row['shift'])))
-                self.table.setItem(i, 3, QTableWidgetItem(row['section_name']))
-                self.table.setItem(i, 4, QTableWidgetItem(f"{row['electricity']:.1f}" if row['electricity'] else '0.0'))
-                self.table.setItem(i, 5, QTableWidgetItem(f"{row['fuel']:.1f}" if row['fuel'] else '0.0'))
-                self.table.setItem(i, 6, QTableWidgetItem(f"{row['total_cost']:,.0f}" if row['total_cost'] else '0'))
+            for i, cost in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(str(cost.cost_id)))
+                self.table.setItem(i, 1, QTableWidgetItem(cost.cost_date))
+                self.table.setItem(i, 2, QTableWidgetItem(str(cost.shift)))
+                self.table.setItem(i, 3, QTableWidgetItem(cost.section_name))
+                self.table.setItem(i, 4, QTableWidgetItem(f"{cost.electricity:.1f}" if cost.electricity else '0.0'))
+                self.table.setItem(i, 5, QTableWidgetItem(f"{cost.fuel:.1f}" if cost.fuel else '0.0'))
+                self.table.setItem(i, 6, QTableWidgetItem(f"{cost.total_cost:,.0f}" if cost.total_cost else '0'))
                 
-                total_electricity += row['electricity'] or 0
-                total_fuel += row['fuel'] or 0
-                total_cost += row['total_cost'] or 0
+                total_electricity += cost.electricity or 0
+                total_fuel += cost.fuel or 0
+                total_cost += cost.total_cost or 0
             
             self.table.resizeColumnsToContents()
             
@@ -134,6 +133,10 @@ class CostManager(QDialog):
             QMessageBox.warning(self, 'Предупреждение', 'Выберите запись для редактирования')
             return
         
+        if get_archive_manager().is_archived_date(self.table.item(selected_row, 1).text()):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не редактируется')
+            return
+        
         cost_id = int(self.table.item(selected_row, 0).text())
         self.current_cost_id = cost_id
         self.show_cost_dialog()
@@ -164,37 +167,34 @@ class CostManager(QDialog):
         
         # Загружаем список участков
         try:
-            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
-            sections = self.db.fetch_all(query)
-            for section in sections:
-                section_combo.addItem(section['section_name'], section['section_id'])
+            for section_id, section_name in SectionRepository(self.db).choices():
+                section_combo.addItem(section_name, section_id)
         except Exception as e:
             print(f"Ошибка загрузки участков: {e}")
         
         # Загружаем данные для редактирования
         if self.current_cost_id:
-            query = "SELECT * FROM costs WHERE cost_id = ?"
-            cost_data = self.db.fetch_one(query, (self.current_cost_id,))
+            cost = self.costs.get(self.current_cost_id)
             
-            if cost_data:
+            if cost:
                 # Дата
                 try:
-                    cost_date = datetime.strptime(cost_data['cost_date'], '%Y-%m-%d')
+                    cost_date = datetime.strptime(cost.cost_date, '%Y-%m-%d')
                     date_edit.setDate(QDate(cost_date.year, cost_date.month, cost_date.day))
                 except:
                     pass
                 
                 # Смена
-                shift_combo.setCurrentText(str(cost_data['shift']))
+                shift_combo.setCurrentText(str(cost.shift))
                 
                 # Участок
                 for i in range(section_combo.count()):
-                    if section_combo.itemData(i) == cost_data['section_id']:
+                    if section_combo.itemData(i) == cost.section_id:
                         section_combo.setCurrentIndex(i)
                         break
                 
-                electricity_edit.setText(str(cost_data['electricity']) if cost_data['electricity'] else '')
-                fuel_edit.setText(str(cost_data['fuel']) if cost_data['fuel'] else '')
+                electricity_edit.setText(str(cost.electricity) if cost.electricity else '')
+                fuel_edit.setText(str(cost.fuel) if cost.fuel else '')
         
         layout.addRow('Дата:', date_edit)
         layout.addRow('Смена:', shift_combo)
@@ -214,6 +214,7 @@ class CostManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_cost(self, dialog, date, shift, section_id, electricity, fuel):
         # Валидация
         if not electricity.strip() and not fuel.strip():
@@ -221,39 +222,37 @@ class CostManager(QDialog):
             return
         
         try:
-            electricity_value = float(electricity) if electricity else 0
-            fuel_value = float(fuel) if fuel else 0
-            shift_value = int(shift)
+            cost = Cost(
+                cost_id=self.current_cost_id,
+                cost_date=date,
+                section_id=section_id,
+                shift=int(shift),
+                electricity=float(electricity) if electricity else 0,
+                fuel=float(fuel) if fuel else 0,
+            )
+            
+            if get_archive_manager().is_archived_date(date):
+                QMessageBox.warning(dialog, 'Ошибка', ARCHIVED_DATE_MESSAGE)
+                return
             
             if self.current_cost_id:
                 # Обновление существующей записи
-                query = """
-                UPDATE costs SET 
-                    cost_date = ?,
-                    shift = ?,
-                    section_id = ?,
-                    electricity = ?,
-                    fuel = ?
-                WHERE cost_id = ?
-                """
-                params = (date, shift_value, section_id, 
-                         electricity_value, fuel_value, self.current_cost_id)
+                if not self.costs.update(cost):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление новой записи
-                query = """
-                INSERT INTO costs 
-                (cost_date, shift, section_id, electricity, fuel)
-                VALUES (?, ?, ?, ?, ?)
-                """
-                params = (date, shift_value, section_id, electricity_value, fuel_value)
+                self.costs.insert(cost)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_cost(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -264,6 +263,10 @@ class CostManager(QDialog):
         cost_date = self.table.item(selected_row, 1).text()
         section = self.table.item(selected_row, 3).text()
         
+        if get_archive_manager().is_archived_date(cost_date):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не удаляется')
+            return
+        
         reply = QMessageBox.question(
             self, 'Подтверждение удаления',
             f'Удалить запись о затратах от {cost_date} ({section})?',
@@ -272,8 +275,7 @@ class CostManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM costs WHERE cost_id = ?"
-                self.db.execute_query(query, (cost_id,))
+                self.costs.delete(cost_id)
                 self.load_data()
                 self.stats_label.setText(f'Запись #{cost_id} удалена')
             except Exception as e:
@@ -0,0 +1,198 @@
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from PyQt5.QtCore import QObject, QTimer, Qt
+from config import Config
+
+def _frame_place(frame):
+    """Кадр стека: (файл относительно программы, строка, функция)"""
+    path = Path(frame.filename)
+    try:
+        name = path.relative_to(Config.BASE_DIR).as_posix()
+    except ValueError:
+        name = path.name
+    return name, frame.lineno, frame.name
+
+# Служебные обертки, которые не показываются в цепочке вызовов
+SKIPPED_FILES = {Path(__file__).name, 'profiler.py'}
+
+def _is_application(frame):
+    """Кадр из кода программы, а не из библиотек и не из служебных оберток"""
+    path = Path(frame.filename)
+    return (path.is_relative_to(Config.BASE_DIR)
+            and 'site-packages' not in path.parts
+            and path.name not in SKIPPED_FILES)
+
+class LatencyMonitor(QObject):
+    """Контроль зависаний окна
+
+    Таймер в главном потоке отмечает такты цикла событий и считает их
+    запаздывание. Фоновый поток следит за последним тактом: если окно не
+    отвечает дольше порога, он снимает стек главного потока через
+    sys._current_frames и повторяет снимки, пока зависание не кончится.
+    Снимки группируются по цепочке вызовов кода программы, так что отчет
+    показывает, какие обработчики и сколько раз останавливали окно.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.interval = Config.LATENCY_HEARTBEAT_MS / 1000
+        self.threshold = Config.LATENCY_THRESHOLD_MS / 1000
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.beat)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.main_ident = threading.main_thread().ident
+        self.reset()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def reset(self):
+        with self.lock:
+            self.started = datetime.now()
+            self.beats = 0
+            self.lags = deque(maxlen=Config.LATENCY_KEEP_LAGS)
+            self.max_lag = 0.0
+            self.stalls = deque(maxlen=Config.LATENCY_KEEP_STALLS)
+            self.stall_count = 0
+            self.stall_time = 0.0
+            self.paths = {}
+            self.stall = None
+            self.last_beat = time.perf_counter()
+
+    def start(self):
+        if self.running:
+            return
+        self.last_beat = time.perf_counter()
+        self.timer.start(Config.LATENCY_HEARTBEAT_MS)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._watch, name='latency-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.timer.stop()
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def beat(self):
+        """Такт цикла событий: запаздывание и завершение зависания"""
+        now = time.perf_counter()
+        with self.lock:
+            gap = now - self.last_beat
+            self.last_beat = now
+            lag = max(gap - self.interval, 0.0)
+            self.beats += 1
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self.stall is not None:
+                self._close_stall(gap)
+
+    def _close_stall(self, duration):
+        stall = self.stall
+        self.stall = None
+        stall['duration'] = duration
+        self.stalls.append(stall)
+        self.stall_count += 1
+        self.stall_time += duration
+        for app_path, leaf in stall['samples']:
+            group = self.paths.get(app_path)
+            if group is None:
+                group = self.paths[app_path] = {'samples': 0, 'stalls': set(), 'max_stall': 0.0, 'leaves': {}}
+            group['samples'] += 1
+            group['stalls'].add(stall['id'])
+            group['max_stall'] = max(group['max_stall'], duration)
+            group['leaves'][leaf] = group['leaves'].get(leaf, 0) + 1
+
+    def _watch(self):
+        sample_interval = Config.LATENCY_SAMPLE_MS / 1000
+        while not self.stop_event.wait(sample_interval):
+            with self.lock:
+                if time.perf_counter() - self.last_beat < self.threshold + self.interval:
+                    continue
+                if self.stall is None:
+                    self.stall = {'id': self.stall_count, 'started': datetime.now(), 'samples': []}
+                stall = self.stall
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            app_path = tuple(_frame_place(item) for item in stack if _is_application(item))
+            if app_path:
+                # Строка самого глубокого кадра меняется от снимка к снимку внутри цикла
+                app_path = app_path[:-1] + ((app_path[-1][0], None, app_path[-1][2]),)
+            leaf = _frame_place(stack[-1]) if stack else ('?', None, '?')
+            with self.lock:
+                if self.stall is stall:
+                    stall['samples'].append((app_path[-Config.LATENCY_STACK_DEPTH:], leaf[0::2]))
+
+    def lag_percentile(self, percent):
+        lags = sorted(self.lags)
+        if not lags:
+            return 0.0
+        return lags[min(int(len(lags) * percent / 100), len(lags) - 1)]
+
+    def report(self):
+        """Цепочки вызовов, останавливавшие окно: по убыванию числа снимков"""
+        with self.lock:
+            groups = [dict(group, path=path) for path, group in self.paths.items()]
+        sample = Config.LATENCY_SAMPLE_MS
+        result = []
+        for group in sorted(groups, key=lambda group: group['samples'], reverse=True):
+            leaf = max(group['leaves'].items(), key=lambda item: item[1])[0]
+            result.append({
+                'path': group['path'],
+                'samples': group['samples'],
+                'blocked_ms': group['samples'] * sample,
+                'stalls': len(group['stalls']),
+                'max_stall_ms': group['max_stall'] * 1000,
+                'leaf': leaf,
+            })
+        return result
+
+    def format_report(self):
+        """Отчет о зависаниях текстом для окна и файла"""
+        lines = [
+            f'Контроль зависаний с {self.started:%d.%m.%Y %H:%M:%S}, тактов {self.beats}',
+            f'Запаздывание цикла событий: медиана {self.lag_percentile(50) * 1000:.0f} мс, '
+            f'95% {self.lag_percentile(95) * 1000:.0f} мс, 99% {self.lag_percentile(99) * 1000:.0f} мс, '
+            f'наибольшее {self.max_lag * 1000:.0f} мс',
+            f'Зависаний дольше {Config.LATENCY_THRESHOLD_MS} мс: {self.stall_count}, '
+            f'всего {self.stall_time:.1f} с',
+        ]
+        for i, item in enumerate(self.report(), 1):
+            lines.append('')
+            lines.append(f'{i}. снимков {item["samples"]} (~{item["blocked_ms"]} мс), '
+                         f'зависаний {item["stalls"]}, дольше всех {item["max_stall_ms"]:.0f} мс')
+            if not item['path']:
+                lines.append('   вне кода программы')
+            for filename, line, function in item['path']:
+                place = f'{filename}:{line}' if line else filename
+                lines.append(f'   {place} {function}')
+            lines.append(f'   -> {item["leaf"][1]} ({item["leaf"][0]})')
+        if self.stalls:
+            lines.append('')
+            lines.append('Последние зависания:')
+            for stall in reversed(self.stalls):
+                lines.append(f'   {stall["started"]:%d.%m.%Y %H:%M:%S}  {stall["duration"] * 1000:.0f} мс')
+        return '\n'.join(lines)
+
+    def dump(self, path=None):
+        """Сохранение отчета о зависаниях в файл для приложения к заявке"""
+        if path is None:
+            Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            path = Config.PROFILE_DIR / f'latency_{datetime.now():%Y%m%d_%H%M%S}.txt'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.format_report())
+        return Path(path)
@@ -1,19 +1,32 @@
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QDate, QTimer
 from PyQt5.QtGui import QDoubleValidator, QIntValidator
-from database.db_connection import DatabaseConnection
+from config import Config
+from database.db_connection import DatabaseConnection, constraint_message
+from database.models import Limits
+from database.repositories import LimitsRepository, SectionRepository
+from database.forecast import get_forecast_engine, MEASURE_NAMES
+from database.alerts import AlertMonitor
+from database.profiler import profiled
 
 class LimitManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.limits = LimitsRepository(self.db)
         self.current_limit_id = None
+        self.forecast_result = None
         self.init_ui()
         self.load_data()
         
+        # Прогноз пересчитывается только при новых записях в журнале изменений
+        self.forecast_timer = QTimer(self)
+        self.forecast_timer.timeout.connect(self.load_forecast)
+        self.forecast_timer.start(Config.FORECAST_REFRESH_MS)
+        
     def init_ui(self):
         self.setWindowTitle('Управление лимитами')
-        self.setMinimumSize(1000, 500)
+        self.setMinimumSize(1000, 700)
         
         layout = QVBoxLayout(self)
         
@@ -61,32 +74,39 @@ class LimitManager(QDialog):
         # Статистика
         self.stats_label = QLabel('')
         layout.addWidget(self.stats_label)
+        
+        # Прогноз выполнения на конец месяца
+        forecast_group = QGroupBox('Прогноз на конец месяца')
+        forecast_layout = QVBoxLayout(forecast_group)
+        
+        month_layout = QHBoxLayout()
+        month_layout.addWidget(QLabel('Месяц:'))
+        self.forecast_month = QDateEdit()
+        self.forecast_month.setDisplayFormat('MM.yyyy')
+        self.forecast_month.setDate(QDate.currentDate())
+        self.forecast_month.dateChanged.connect(lambda: self.load_forecast(force=True))
+        month_layout.addWidget(self.forecast_month)
+        self.forecast_label = QLabel('')
+        month_layout.addWidget(self.forecast_label)
+        month_layout.addStretch()
+        forecast_layout.addLayout(month_layout)
+        
+        self.forecast_table = QTableWidget()
+        self.forecast_table.setColumnCount(8)
+        self.forecast_table.setHorizontalHeaderLabels([
+            'Участок', 'Показатель', 'План', 'Факт',
+            'По темпу', 'Прогноз', 'Интервал', 'Выше плана'
+        ])
+        self.forecast_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        forecast_layout.addWidget(self.forecast_table)
+        
+        layout.addWidget(forecast_group)
     
+    @profiled
     def load_data(self):
         try:
-            query = """
-            SELECT l.*, s.section_name,
-                   CASE 
-                       WHEN l.plan_production > 0 
-                       THEN ROUND((l.actual_production * 100.0 / l.plan_production), 2)
-                       ELSE 0 
-                   END as production_percent,
-                   CASE 
-                       WHEN l.plan_rock > 0 
-                       THEN ROUND((l.actual_rock * 100.0 / l.plan_rock), 2)
-                       ELSE 0 
-                   END as rock_percent,
-                   CASE 
-                       WHEN l.plan_electricity > 0 
-                       THEN ROUND((l.actual_electricity * 100.0 / l.plan_electricity), 2)
-                       ELSE 0 
-                   END as electricity_percent
-            FROM limits l
-            JOIN sections s ON l.section_id = s.section_id
-            ORDER BY l.year DESC, l.month DESC, s.section_name
-            """
-            
-            results = self.db.fetch_all(query)
+            # Проценты выполнения считают свойства записи лимита
+            results = self.limits.listing()
             
             self.table.setRowCount(len(results))
             
@@ -95,60 +115,60 @@ class LimitManager(QDialog):
             total_plan_rock = 0
             total_actual_rock = 0
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['limit_id'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['section_name']))
-                self.table.setItem(i, 2, QTableWidgetItem(str(row['month'])))
-                self.table.setItem(i, 3, QTableWidgetItem(str(row['year'])))
-                self.table.setItem(i, 4, QTableWidgetItem(f"{row['plan_production']:,.0f}" if row['plan_production'] else '0'))
-                self.table.setItem(i, 5, QTableWidgetItem(f"{row['actual_production']:,.0f}" if row['actual_production'] else '0'))
+            for i, limit in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(str(limit.limit_id)))
+                self.table.setItem(i, 1, QTableWidgetItem(limit.section_name))
+                self.table.setItem(i, 2, QTableWidgetItem(str(limit.month)))
+                self.table.setItem(i, 3, QTableWidgetItem(str(limit.year)))
+                self.table.setItem(i, 4, QTableWidgetItem(f"{limit.plan_production:,.0f}" if limit.plan_production else '0'))
+                self.table.setItem(i, 5, QTableWidgetItem(f"{limit.actual_production:,.0f}" if limit.actual_production else '0'))
                 
                 # Процент выполнения добычи
-                percent_item = QTableWidgetItem(f"{row['production_percent']:.1f}%")
-                if row['production_percent'] < 80:
+                percent_item = QTableWidgetItem(f"{limit.production_percent:.1f}%")
+                if limit.production_percent < 80:
                     percent_item.setBackground(Qt.red)
                     percent_item.setForeground(Qt.white)
-                elif row['production_percent'] < 100:
+                elif limit.production_percent < 100:
                     percent_item.setBackground(Qt.yellow)
                 else:
                     percent_item.setBackground(Qt.green)
                     percent_item.setForeground(Qt.white)
                 self.table.setItem(i, 6, percent_item)
                 
-                self.table.setItem(i, 7, QTableWidgetItem(f"{row['plan_rock']:,.0f}" if row['plan_rock'] else '0'))
-                self.table.setItem(i, 8, QTableWidgetItem(f"{row['actual_rock']:,.0f}" if row['actual_rock'] else '0'))
+                self.table.setItem(i, 7, QTableWidgetItem(f"{limit.plan_rock:,.0f}" if limit.plan_rock else '0'))
+                self.table.setItem(i, 8, QTableWidgetItem(f"{limit.actual_rock:,.0f}" if limit.actual_rock else '0'))
                 
                 # Процент выполнения породы
-                rock_percent_item = QTableWidgetItem(f"{row['rock_percent']:.1f}%")
-                if row['rock_percent'] > 120:
+                rock_percent_item = QTableWidgetItem(f"{limit.rock_percent:.1f}%")
+                if limit.rock_percent > 120:
                     rock_percent_item.setBackground(Qt.red)
                     rock_percent_item.setForeground(Qt.white)
-                elif row['rock_percent'] > 100:
+                elif limit.rock_percent > 100:
                     rock_percent_item.setBackground(Qt.yellow)
                 else:
                     rock_percent_item.setBackground(Qt.green)
                     rock_percent_item.setForeground(Qt.white)
                 self.table.setItem(i, 9, rock_percent_item)
                 
-                self.table.setItem(i, 10, QTableWidgetItem(f"{row['plan_electricity']:,.0f}" if row['plan_electricity'] else '0'))
-                self.table.setItem(i, 11, QTableWidgetItem(f"{row['actual_electricity']:,.0f}" if row['actual_electricity'] else '0'))
+                self.table.setItem(i, 10, QTableWidgetItem(f"{limit.plan_electricity:,.0f}" if limit.plan_electricity else '0'))
+                self.table.setItem(i, 11, QTableWidgetItem(f"{limit.actual_electricity:,.0f}" if limit.actual_electricity else '0'))
                 
                 # Процент выполнения электроэнергии
-                elec_percent_item = QTableWidgetItem(f"{row['electricity_percent']:.1f}%")
-                if row['electricity_percent'] > 120:
+                elec_percent_item = QTableWidgetItem(f"{limit.electricity_percent:.1f}%")
+                if limit.electricity_percent > 120:
                     elec_percent_item.setBackground(Qt.red)
                     elec_percent_item.setForeground(Qt.white)
-                elif row['electricity_percent'] > 100:
+                elif limit.electricity_percent > 100:
                     elec_percent_item.setBackground(Qt.yellow)
                 else:
                     elec_percent_item.setBackground(Qt.green)
                     elec_percent_item.setForeground(Qt.white)
                 self.table.setItem(i, 12, elec_percent_item)
                 
-                total_plan_production += row['plan_production'] or 0
-                total_actual_production += row['actual_production'] or 0
-                total_plan_rock += row['plan_rock'] or 0
-                total_actual_rock += row['actual_rock'] or 0
+                total_plan_production += limit.plan_production or 0
+                total_actual_production += limit.actual_production or 0
+                total_plan_rock += limit.plan_rock or 0
+                total_actual_rock += limit.actual_rock or 0
             
             self.table.resizeColumnsToContents()
             
@@ -164,6 +184,53 @@ class LimitManager(QDialog):
             
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки данных: {str(e)}')
+        
+        self.load_forecast(force=True)
+    
+    def load_forecast(self, force=False):
+        try:
+            month = self.forecast_month.date()
+            result = get_forecast_engine().forecast(month.year(), month.month())
+        except Exception as e:
+            self.forecast_label.setText(f'Ошибка прогноза: {str(e)}')
+            return
+        
+        # Без новых изменений движок возвращает тот же результат из кэша
+        if result is self.forecast_result and not force:
+            return
+        self.forecast_result = result
+        
+        def fmt(value):
+            return f'{value:,.0f}' if value is not None else '-'
+        
+        rows = [(section, name, values) for section in result
+                for name, values in section['measures'].items()]
+        self.forecast_table.setRowCount(len(rows))
+        for i, (section, name, values) in enumerate(rows):
+            self.forecast_table.setItem(i, 0, QTableWidgetItem(section['section_name']))
+            self.forecast_table.setItem(i, 1, QTableWidgetItem(MEASURE_NAMES[name]))
+            self.forecast_table.setItem(i, 2, QTableWidgetItem(fmt(values['plan'])))
+            self.forecast_table.setItem(i, 3, QTableWidgetItem(fmt(values['actual'])))
+            self.forecast_table.setItem(i, 4, QTableWidgetItem(fmt(values['run_rate'])))
+            self.forecast_table.setItem(i, 5, QTableWidgetItem(fmt(values['median'])))
+            self.forecast_table.setItem(i, 6, QTableWidgetItem(f"{fmt(values['low'])} - {fmt(values['high'])}"))
+            
+            over_item = QTableWidgetItem(f"{values['over_plan'] * 100:.0f}%" if values['over_plan'] is not None else '-')
+            if values['over_plan'] is not None:
+                # Для добычи превышение плана - хорошо, для породы и расхода - перерасход
+                risk = 1 - values['over_plan'] if name == 'volume' else values['over_plan']
+                if risk >= 0.5:
+                    over_item.setBackground(Qt.red)
+                    over_item.setForeground(Qt.white)
+                elif risk >= 0.2:
+                    over_item.setBackground(Qt.yellow)
+            self.forecast_table.setItem(i, 7, over_item)
+        
+        self.forecast_table.resizeColumnsToContents()
+        self.forecast_label.setText(
+            f'Интервал {Config.FORECAST_QUANTILES[0]}-{Config.FORECAST_QUANTILES[-1]}%, '
+            f'{Config.FORECAST_SIMULATIONS} прогонов по сменам за {Config.FORECAST_HISTORY_DAYS} дней'
+        )
     
     def add_limit(self):
         self.current_limit_id = None
@@ -211,10 +278,8 @@ class LimitManager(QDialog):
         
         # Загружаем участки
         try:
-            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
-            sections = self.db.fetch_all(query)
-            for section in sections:
-                section_combo.addItem(section['section_name'], section['section_id'])
+            for section_id, section_name in SectionRepository(self.db).choices():
+                section_combo.addItem(section_name, section_id)
         except Exception as e:
             print(f"Ошибка загрузки участков: {e}")
         
@@ -224,24 +289,23 @@ class LimitManager(QDialog):
         
         # Загружаем данные для редактирования
         if self.current_limit_id:
-            query = "SELECT * FROM limits WHERE limit_id = ?"
-            limit_data = self.db.fetch_one(query, (self.current_limit_id,))
+            limit = self.limits.get(self.current_limit_id)
             
-            if limit_data:
+            if limit:
                 # Участок
                 for i in range(section_combo.count()):
-                    if section_combo.itemData(i) == limit_data['section_id']:
+                    if section_combo.itemData(i) == limit.section_id:
                         section_combo.setCurrentIndex(i)
                         break
                 
                 # Месяц
-                month_combo.setCurrentIndex(limit_data['month'] - 1)
+                month_combo.setCurrentIndex(limit.month - 1)
                 
-                year_edit.setText(str(limit_data['year']))
-                production_edit.setText(str(limit_data['plan_production']) if limit_data['plan_production'] else '')
-                rock_edit.setText(str(limit_data['plan_rock']) if limit_data['plan_rock'] else '')
-                electricity_edit.setText(str(limit_data['plan_electricity']) if limit_data['plan_electricity'] else '')
-                fuel_edit.setText(str(limit_data['plan_fuel']) if limit_data['plan_fuel'] else '')
+                year_edit.setText(str(limit.year))
+                production_edit.setText(str(limit.plan_production) if limit.plan_production else '')
+                rock_edit.setText(str(limit.plan_rock) if limit.plan_rock else '')
+                electricity_edit.setText(str(limit.plan_electricity) if limit.plan_electricity else '')
+                fuel_edit.setText(str(limit.plan_fuel) if limit.plan_fuel else '')
         
         layout.addRow('Участок:', section_combo)
         layout.addRow('Месяц:', month_combo)
@@ -263,6 +327,7 @@ class LimitManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_limit(self, dialog, section_id, month, year, production, rock, electricity, fuel):
         if not year.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите год')
@@ -273,64 +338,40 @@ class LimitManager(QDialog):
             return
         
         try:
-            year_value = int(year)
-            month_value = int(month)
-            production_value = float(production) if production else None
-            rock_value = float(rock) if rock else None
-            electricity_value = float(electricity) if electricity else None
-            fuel_value = float(fuel) if fuel else None
-            
-            # Проверяем, нет ли уже лимита для этого участка на этот месяц и год
-            check_query = """
-            SELECT limit_id FROM limits 
-            WHERE section_id = ? AND month = ? AND year = ?
-            """
-            check_params = (section_id, month_value, year_value)
-            
-            if self.current_limit_id:
-                check_query += " AND limit_id != ?"
-                check_params = (section_id, month_value, year_value, self.current_limit_id)
-            
-            existing = self.db.fetch_one(check_query, check_params)
-            
-            if existing:
-                QMessageBox.warning(dialog, 'Ошибка', 
-                    'Для этого участка уже установлен лимит на указанный месяц и год')
-                return
+            limit = Limits(
+                limit_id=self.current_limit_id,
+                section_id=section_id,
+                month=int(month),
+                year=int(year),
+                plan_production=float(production) if production else None,
+                plan_rock=float(rock) if rock else None,
+                plan_electricity=float(electricity) if electricity else None,
+                plan_fuel=float(fuel) if fuel else None,
+            )
             
+            # Повтор лимита на участок, месяц и год отсекает UNIQUE(section_id, month, year)
             if self.current_limit_id:
                 # Обновление существующего лимита
-                query = """
-                UPDATE limits SET 
-                    section_id = ?,
-                    month = ?,
-                    year = ?,
-                    plan_production = ?,
-                    plan_rock = ?,
-                    plan_electricity = ?,
-                    plan_fuel = ?
-                WHERE limit_id = ?
-                """
-                params = (section_id, month_value, year_value, production_value,
-                         rock_value, electricity_value, fuel_value, self.current_limit_id)
+                if not self.limits.update(limit):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Лимит не найден. Возможно, он был удален')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление нового лимита
-                query = """
-                INSERT INTO limits 
-                (section_id, month, year, plan_production, plan_rock, 
-                 plan_electricity, plan_fuel)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """
-                params = (section_id, month_value, year_value, production_value,
-                         rock_value, electricity_value, fuel_value)
+                self.limits.insert(limit)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
-            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+            message = constraint_message(e)
+            if message:
+                QMessageBox.warning(dialog, 'Ошибка', message)
+            else:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_limit(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -350,50 +391,18 @@ class LimitManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM limits WHERE limit_id = ?"
-                self.db.execute_query(query, (limit_id,))
+                self.limits.delete(limit_id)
                 self.load_data()
                 self.stats_label.setText(f'Лимит для {section_name} удален')
             except Exception as e:
                 QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
     
+    @profiled
     def recalculate_facts(self):
         try:
-            # Обновляем фактические данные добычи и породы
-            update_query = """
-            UPDATE limits 
-            SET actual_production = COALESCE((
-                SELECT SUM(volume) 
-                FROM mining 
-                WHERE mining.section_id = limits.section_id
-                  AND strftime('%m', mining.mining_date) = printf('%02d', limits.month)
-                  AND strftime('%Y', mining.mining_date) = printf('%d', limits.year)
-            ), 0),
-            actual_rock = COALESCE((
-                SELECT SUM(rock_volume) 
-                FROM mining 
-                WHERE mining.section_id = limits.section_id
-                  AND strftime('%m', mining.mining_date) = printf('%02d', limits.month)
-                  AND strftime('%Y', mining.mining_date) = printf('%d', limits.year)
-            ), 0),
-            actual_electricity = COALESCE((
-                SELECT SUM(electricity) 
-                FROM costs 
-                WHERE costs.section_id = limits.section_id
-                  AND strftime('%m', costs.cost_date) = printf('%02d', limits.month)
-                  AND strftime('%Y', costs.cost_date) = printf('%d', limits.year)
-            ), 0),
-            actual_fuel = COALESCE((
-                SELECT SUM(fuel) 
-                FROM costs 
-                WHERE costs.section_id = limits.section_id
-                  AND strftime('%m', costs.cost_date) = printf('%02d', limits.month)
-                  AND strftime('%Y', costs.cost_date) = printf('%d', limits.year)
-            ), 0)
-            WHERE 1=1
-            """
-            
-            self.db.execute_query(update_query)
+            # Факты ведут триггеры при каждой записи добычи и затрат; полный пересчет
+            # сверяет их с рабочими таблицами (факты архивных лет зафиксированы)
+            AlertMonitor(self.db).recalculate()
             self.load_data()
             
             QMessageBox.information(self, 'Успех', 'Фактические показатели успешно пересчитаны!')
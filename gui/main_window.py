@@ -2,15 +2,20 @@ import sys
 import webbrowser
 from pathlib import Path
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt, QDate, QTimer, QAbstractEventDispatcher
 from PyQt5.QtGui import QIcon, QFont
 from database.db_connection import DatabaseConnection
+from database.alerts import AlertMonitor, log_listener, message as alert_message
+from database.profiler import get_profiler, profiled
+from gui.latency_monitor import LatencyMonitor
+from gui.background import BackgroundTask, start_task
 from config import Config
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.db = DatabaseConnection()
+        self.latency_monitor = LatencyMonitor(self)
         self.init_ui()
         self.center_window()
         
@@ -37,6 +42,49 @@ class MainWindow(QMainWindow):
         
         # Применяем стили
         self.apply_styles()
+        
+        # Плановое обслуживание базы в фоновом потоке: первый запуск вскоре после старта.
+        # При работе через сервер базу обслуживает сервер
+        if self.db.remote:
+            self.statusBar().showMessage(f'Подключено к серверу {Config.API_URL}')
+        else:
+            self.maintenance_timer = QTimer(self)
+            self.maintenance_timer.timeout.connect(self.run_maintenance)
+            self.maintenance_timer.start(Config.MAINTENANCE_INTERVAL_MS)
+            QTimer.singleShot(30000, self.run_maintenance)
+        
+        # Предупреждения по лимитам: состояние ведут триггеры базы, окно опрашивает
+        # только новые смены уровней
+        self.alert_label = QLabel('')
+        self.statusBar().addPermanentWidget(self.alert_label)
+        self.alert_monitor = AlertMonitor(self.db)
+        self.alert_monitor.add_listener(self.show_alert)
+        self.alert_monitor.add_listener(log_listener)
+        self.alert_timer = QTimer(self)
+        self.alert_timer.timeout.connect(self.check_alerts)
+        self.alert_timer.start(Config.ALERT_POLL_MS)
+        self.check_alerts()
+        if not self.db.remote:
+            # План добычи на дату растет каждый день: пороги переоцениваются в фоне
+            # при запуске и после смены даты
+            self.alert_evaluated = None
+            self.alert_date_timer = QTimer(self)
+            self.alert_date_timer.timeout.connect(self.evaluate_alerts)
+            self.alert_date_timer.start(Config.ALERT_DATE_CHECK_MS)
+            self.evaluate_alerts()
+        
+        # Профилирование: итог последнего действия в строке состояния. Пока цикл
+        # событий ждет пользователя (диалоги, вопросы), время в замер не входит
+        self.profiler = get_profiler()
+        self.profile_label = QLabel('')
+        self.profile_label.setVisible(self.profiler.enabled)
+        self.statusBar().addPermanentWidget(self.profile_label)
+        self.profiler.add_listener(self.update_profile_label)
+        dispatcher = QAbstractEventDispatcher.instance()
+        dispatcher.aboutToBlock.connect(self.profiler.idle_begin)
+        dispatcher.awake.connect(self.profiler.idle_end)
+        if Config.LATENCY_MONITOR:
+            self.latency_monitor.start()
     
     def apply_styles(self):
         self.setStyleSheet("""
@@ -92,6 +140,20 @@ class MainWindow(QMainWindow):
         export_action.triggered.connect(self.export_data)
         file_menu.addAction(export_action)
         
+        delta_action = QAction('Экспорт изменений...', self)
+        delta_action.triggered.connect(self.export_delta)
+        file_menu.addAction(delta_action)
+        
+        file_menu.addSeparator()
+        
+        backup_action = QAction('Резервная копия', self)
+        backup_action.triggered.connect(self.backup_database)
+        file_menu.addAction(backup_action)
+        
+        restore_action = QAction('Восстановить из копии...', self)
+        restore_action.triggered.connect(self.restore_database)
+        file_menu.addAction(restore_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction('Выход', self)
@@ -118,6 +180,10 @@ class MainWindow(QMainWindow):
         workers_action.triggered.connect(self.show_workers_management)
         ref_menu.addAction(workers_action)
         
+        tariffs_action = QAction('Тарифы', self)
+        tariffs_action.triggered.connect(self.show_tariffs_management)
+        ref_menu.addAction(tariffs_action)
+        
         # Меню "Операции"
         ops_menu = menubar.addMenu('Операции')
         
@@ -159,10 +225,18 @@ class MainWindow(QMainWindow):
         limits_report.triggered.connect(lambda: self.generate_report('limits'))
         report_menu.addAction(limits_report)
         
+        rollup_report = QAction('Сводка добычи по месяцам', self)
+        rollup_report.triggered.connect(lambda: self.generate_report('production_rollup'))
+        report_menu.addAction(rollup_report)
+        
         salary_report = QAction('Расчет заработной платы', self)
         salary_report.triggered.connect(self.generate_salary_report)
         report_menu.addAction(salary_report)
         
+        payroll_action = QAction('Начисление зарплаты...', self)
+        payroll_action.triggered.connect(self.show_payroll)
+        report_menu.addAction(payroll_action)
+        
         # Меню "Запросы"
         query_menu = menubar.addMenu('Запросы')
         
@@ -170,6 +244,66 @@ class MainWindow(QMainWindow):
         custom_query.triggered.connect(self.show_query_dialog)
         query_menu.addAction(custom_query)
         
+        # Меню "Сервис"
+        service_menu = menubar.addMenu('Сервис')
+        
+        change_log_action = QAction('Журнал изменений', self)
+        change_log_action.triggered.connect(self.show_change_log)
+        service_menu.addAction(change_log_action)
+        
+        archive_action = QAction('Архивирование данных...', self)
+        archive_action.triggered.connect(self.show_archive_dialog)
+        service_menu.addAction(archive_action)
+        
+        maintenance_action = QAction('Обслуживание базы данных', self)
+        maintenance_action.triggered.connect(self.show_maintenance_dialog)
+        service_menu.addAction(maintenance_action)
+        
+        advisor_action = QAction('Советы по индексам...', self)
+        advisor_action.triggered.connect(self.show_index_advisor)
+        service_menu.addAction(advisor_action)
+        
+        profiler = get_profiler()
+        profile_menu = service_menu.addMenu('Профилирование')
+        
+        self.profile_action = QAction('Замер действий', self, checkable=True)
+        self.profile_action.setChecked(profiler.enabled)
+        self.profile_action.toggled.connect(self.toggle_profiling)
+        profile_menu.addAction(self.profile_action)
+        
+        cprofile_action = QAction('Профиль функций (cProfile)', self, checkable=True)
+        cprofile_action.setChecked(profiler.use_cprofile)
+        cprofile_action.toggled.connect(lambda checked: profiler.configure(cprofile=checked))
+        profile_menu.addAction(cprofile_action)
+        
+        memory_action = QAction('Замер памяти (tracemalloc)', self, checkable=True)
+        memory_action.setChecked(profiler.use_tracemalloc)
+        memory_action.toggled.connect(lambda checked: profiler.configure(memory=checked))
+        profile_menu.addAction(memory_action)
+        
+        profile_menu.addSeparator()
+        
+        save_profile_action = QAction('Сохранить профиль сеанса...', self)
+        save_profile_action.triggered.connect(self.save_profile)
+        profile_menu.addAction(save_profile_action)
+        
+        profile_menu.addSeparator()
+        
+        self.latency_action = QAction('Контроль зависаний', self, checkable=True)
+        self.latency_action.setChecked(Config.LATENCY_MONITOR)
+        self.latency_action.toggled.connect(self.toggle_latency_monitor)
+        profile_menu.addAction(self.latency_action)
+        
+        latency_report_action = QAction('Зависания окна...', self)
+        latency_report_action.triggered.connect(self.show_latency_report)
+        profile_menu.addAction(latency_report_action)
+        
+        profile_menu.addSeparator()
+        
+        reset_profile_action = QAction('Сбросить замеры', self)
+        reset_profile_action.triggered.connect(lambda: profiler.reset())
+        profile_menu.addAction(reset_profile_action)
+        
         # Меню "Справка"
         help_menu = menubar.addMenu('Справка')
         
@@ -230,20 +364,18 @@ class MainWindow(QMainWindow):
             sections_count = self.db.fetch_one("SELECT COUNT(*) as count FROM sections")['count']
             stats_layout.addWidget(QLabel(f'Участков: {sections_count}'), 0, 1)
             
-            # Общая добыча за месяц
-            from datetime import datetime
-            current_month = datetime.now().month
-            current_year = datetime.now().year
+            # Добыча за месяц и с начала года - из куба добычи
+            from datetime import date
+            from database.cube import ProductionCube
+            today = date.today()
+            cube = ProductionCube(self.db)
             
-            mining_total = self.db.fetch_one("""
-                SELECT COALESCE(SUM(volume), 0) as total 
-                FROM mining 
-                WHERE strftime('%m', mining_date) = ? 
-                  AND strftime('%Y', mining_date) = ?
-            """, (f'{current_month:02d}', str(current_year)))
+            month_total = cube.totals(today.replace(day=1).isoformat(), today.isoformat())
+            stats_layout.addWidget(QLabel(f'Добыча за месяц: {month_total["volume"]:,.0f} т'), 1, 0)
             
-            if mining_total:
-                stats_layout.addWidget(QLabel(f'Добыча за месяц: {mining_total["total"]:,.0f} т'), 1, 0)
+            year_total = cube.totals(today.replace(month=1, day=1).isoformat(), today.isoformat())
+            stats_layout.addWidget(QLabel(f'Добыча с начала года: {year_total["volume"]:,.0f} т'), 1, 1)
+            stats_layout.addWidget(QLabel(f'Стоимость добычи с начала года: {year_total["revenue"]:,.0f} руб'), 2, 0)
             
         except Exception as e:
             print(f"Ошибка получения статистики: {e}")
@@ -254,6 +386,14 @@ class MainWindow(QMainWindow):
         dashboard_layout.addStretch()
         
         self.tab_widget.addTab(dashboard_tab, "Главная")
+        
+        # Вкладка "Показатели": данные пересчитываются при каждом открытии
+        from gui.widgets.kpi_widget import KpiWidget
+        self.kpi_widget = KpiWidget(self)
+        self.tab_widget.addTab(self.kpi_widget, "Показатели")
+        self.tab_widget.currentChanged.connect(
+            lambda index: self.tab_widget.widget(index) is self.kpi_widget and self.kpi_widget.load_data()
+        )
     
     # Методы для отображения различных форм управления
     def show_coal_management(self):
@@ -276,6 +416,11 @@ class MainWindow(QMainWindow):
         dialog = WorkerManager(self)
         dialog.exec_()
     
+    def show_tariffs_management(self):
+        from gui.tariff_manager import TariffManager
+        dialog = TariffManager(self)
+        dialog.exec_()
+    
     def show_mining_management(self):
         from gui.mining_manager import MiningManager
         dialog = MiningManager(self)
@@ -296,7 +441,10 @@ class MainWindow(QMainWindow):
         dialog = LimitManager(self)
         dialog.exec_()
     
+    @profiled
     def show_analysis(self):
+        from database.analytics import get_analytics
+        
         # Запрос для анализа выполнения лимитов
         query = """
         SELECT 
@@ -323,7 +471,7 @@ class MainWindow(QMainWindow):
         """
         
         try:
-            results = self.db.fetch_all(query)
+            results = get_analytics().fetch_all(query)
             
             dialog = QDialog(self)
             dialog.setWindowTitle('Анализ выполнения планов')
@@ -380,148 +528,555 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка выполнения анализа: {str(e)}')
     
-    def show_query_dialog(self):
+    def show_change_log(self):
+        from database.change_log import ChangeLog, TRACKED_TABLES
+        
         dialog = QDialog(self)
-        dialog.setWindowTitle('Выполнение SQL запроса')
-        dialog.setMinimumSize(600, 400)
+        dialog.setWindowTitle('Журнал изменений')
+        dialog.setMinimumSize(1000, 500)
         
         layout = QVBoxLayout(dialog)
         
-        # Поле для ввода запроса
-        query_label = QLabel('Введите SQL запрос:')
-        layout.addWidget(query_label)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel('Таблица:'))
+        table_combo = QComboBox()
+        table_combo.addItem('Все таблицы', None)
+        for table_name in TRACKED_TABLES:
+            table_combo.addItem(table_name, table_name)
+        filter_layout.addWidget(table_combo)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
         
-        query_edit = QTextEdit()
-        query_edit.setPlaceholderText('SELECT * FROM workers WHERE section_id = 1')
-        layout.addWidget(query_edit)
+        table = QTableWidget()
+        table.setColumnCount(8)
+        table.setHorizontalHeaderLabels([
+            '№', 'Время (UTC)', 'Пользователь', 'Таблица',
+            'Операция', 'Ключ', 'Было', 'Стало'
+        ])
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(table)
         
-        # Кнопки выполнения
-        btn_layout = QHBoxLayout()
+        operations = {'I': 'Добавление', 'U': 'Изменение', 'D': 'Удаление'}
+        
+        def load_changes():
+            query = "SELECT * FROM change_log"
+            params = []
+            if table_combo.currentData():
+                query += " WHERE table_name = ?"
+                params.append(table_combo.currentData())
+            query += " ORDER BY seq DESC LIMIT 500"
+            
+            changes = self.db.fetch_all(query, params)
+            table.setRowCount(len(changes))
+            for i, change in enumerate(changes):
+                values = [
+                    str(change['seq']), change['changed_at'], change['changed_by'] or '',
+                    change['table_name'], operations[change['operation']], change['row_key'],
+                    change['before_image'] or '', change['after_image'] or ''
+                ]
+                for j, value in enumerate(values):
+                    table.setItem(i, j, QTableWidgetItem(value))
+            table.resizeColumnsToContents()
+        
+        table_combo.currentIndexChanged.connect(load_changes)
+        
+        try:
+            load_changes()
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки журнала: {str(e)}')
+            return
         
-        execute_btn = QPushButton('Выполнить запрос')
-        clear_btn = QPushButton('Очистить')
         close_btn = QPushButton('Закрыть')
+        close_btn.clicked.connect(dialog.close)
+        layout.addWidget(close_btn)
         
-        btn_layout.addWidget(execute_btn)
-        btn_layout.addWidget(clear_btn)
-        btn_layout.addWidget(close_btn)
+        dialog.exec_()
+    
+    def show_archive_dialog(self):
+        from database.archive import get_archive_manager
+        from datetime import datetime
+        
+        try:
+            archive = get_archive_manager()
+            live_years = archive.live_years()
+            archived = archive.archived_years()
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка чтения архива: {str(e)}')
+            return
+        
+        closed = [row for row in live_years if row['year'] < datetime.now().year]
+        if not closed:
+            QMessageBox.information(
+                self, 'Архивирование',
+                'Нет закрытых лет для архивирования.\n'
+                f'Архивные годы: {", ".join(map(str, archived)) or "нет"}'
+            )
+            return
+        
+        items = [f"{row['year']} ({row['rows']} записей)" for row in closed]
+        item, ok = QInputDialog.getItem(
+            self, 'Архивирование',
+            'Добыча, затраты и табель выбранного года будут перенесены в отдельный файл.\n'
+            f'Архивные годы: {", ".join(map(str, archived)) or "нет"}\n\nГод:',
+            items, 0, False
+        )
+        if not ok:
+            return
+        
+        year = closed[items.index(item)]['year']
+        try:
+            moved = archive.archive_year(year)
+            QMessageBox.information(
+                self, 'Архивирование',
+                f'Перенесено записей: {moved}\nФайл: {archive.archive_path(year)}'
+            )
+            self.statusBar().showMessage(f'{year} год перенесен в архив')
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка архивирования: {str(e)}')
+    
+    def check_alerts(self):
+        try:
+            events = self.alert_monitor.poll()
+            if events or not self.alert_label.text():
+                self.update_alert_label()
+        except Exception as e:
+            # База может быть занята другим пользователем, повторим при следующем опросе
+            print(f"Ошибка проверки предупреждений: {e}")
+    
+    def evaluate_alerts(self):
+        """Переоценка порогов лимитов в фоновом потоке, если с прошлой сменилась дата"""
+        from datetime import date
+        
+        today = date.today()
+        if self.alert_evaluated == today:
+            return
+        
+        def finished(result):
+            self.alert_evaluated = today
+            self.check_alerts()
+        
+        # При ошибке (база занята) переоценка повторится при следующей проверке
+        start_task(self, 'alert_worker', self.alert_monitor.evaluate,
+                   finished, lambda error: print(f"Ошибка оценки лимитов: {error}"))
+    
+    def show_alert(self, event):
+        self.statusBar().showMessage(alert_message(event), 15000)
+    
+    def update_alert_label(self):
+        active = self.alert_monitor.active()
+        critical = sum(1 for row in active if row['level'] == 'critical')
+        if active:
+            self.alert_label.setText(f'Лимиты: нарушений {critical}, предупреждений {len(active) - critical}')
+            self.alert_label.setStyleSheet('color: #c62828;' if critical else 'color: #ef6c00;')
+            self.alert_label.setToolTip('\n'.join(alert_message(row) for row in active[:20]))
+        else:
+            self.alert_label.setText('Лимиты: в норме')
+            self.alert_label.setStyleSheet('')
+            self.alert_label.setToolTip('')
+    
+    def toggle_profiling(self, checked):
+        self.profiler.configure(enabled=checked)
+        self.profile_label.setVisible(checked)
+        if checked:
+            self.profile_label.setText('Профилирование: выполните действие')
+    
+    def update_profile_label(self, span):
+        """Итог последнего действия: время, время запросов, строки"""
+        text = (f'{span.name}: {span.duration * 1000:.1f} мс, '
+                f'SQL {span.sql_time * 1000:.1f} мс ({span.sql_count} запр.), строк {span.rows}')
+        if span.error:
+            text += ' - ошибка'
+        self.profile_label.setText(text)
+        slowest = sorted(span.queries.items(), key=lambda item: item[1][1], reverse=True)[:3]
+        self.profile_label.setToolTip('\n'.join(
+            f'{elapsed * 1000:.1f} мс x{count}: {text}' for text, (count, elapsed, _) in slowest))
+    
+    def save_profile(self):
+        if not self.profiler.spans:
+            QMessageBox.information(
+                self, 'Профилирование',
+                'Замеров еще нет. Включите Сервис → Профилирование → Замер действий '
+                'и повторите медленные действия.'
+            )
+            return
+        from datetime import datetime
+        
+        default = Config.PROFILE_DIR / f'profile_{datetime.now():%Y%m%d_%H%M%S}.json'
+        Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        filename, _ = QFileDialog.getSaveFileName(
+            self, 'Сохранить профиль сеанса', str(default), 'JSON (*.json)'
+        )
+        if not filename:
+            return
+        try:
+            path = self.profiler.dump(filename)
+            QMessageBox.information(
+                self, 'Профилирование',
+                f'Профиль сеанса ({len(self.profiler.spans)} действий) сохранен в файл:\n{path}'
+            )
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка сохранения профиля: {str(e)}')
+    
+    def toggle_latency_monitor(self, checked):
+        if checked:
+            self.latency_monitor.start()
+        else:
+            self.latency_monitor.stop()
+    
+    def show_latency_report(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Зависания окна')
+        dialog.setModal(True)
+        dialog.resize(800, 550)
+        
+        layout = QVBoxLayout(dialog)
+        if not self.latency_monitor.running:
+            layout.addWidget(QLabel('Контроль выключен: Сервис → Профилирование → Контроль зависаний'))
+        
+        report_text = QTextEdit()
+        report_text.setReadOnly(True)
+        report_text.setFont(QFont('Courier New', 9))
+        report_text.setPlainText(self.latency_monitor.format_report())
+        layout.addWidget(report_text)
         
+        def save_report():
+            from datetime import datetime
+            
+            Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            default = Config.PROFILE_DIR / f'latency_{datetime.now():%Y%m%d_%H%M%S}.txt'
+            filename, _ = QFileDialog.getSaveFileName(
+                dialog, 'Сохранить отчет', str(default), 'Текст (*.txt)'
+            )
+            if filename:
+                try:
+                    path = self.latency_monitor.dump(filename)
+                    QMessageBox.information(dialog, 'Зависания окна', f'Отчет сохранен в файл:\n{path}')
+                except Exception as e:
+                    QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения отчета: {str(e)}')
+        
+        def reset_report():
+            self.latency_monitor.reset()
+            report_text.setPlainText(self.latency_monitor.format_report())
+        
+        btn_layout = QHBoxLayout()
+        refresh_btn = QPushButton('Обновить')
+        refresh_btn.clicked.connect(lambda: report_text.setPlainText(self.latency_monitor.format_report()))
+        btn_layout.addWidget(refresh_btn)
+        
+        save_btn = QPushButton('Сохранить...')
+        save_btn.clicked.connect(save_report)
+        btn_layout.addWidget(save_btn)
+        
+        reset_btn = QPushButton('Сбросить')
+        reset_btn.clicked.connect(reset_report)
+        btn_layout.addWidget(reset_btn)
+        
+        btn_layout.addStretch()
+        close_btn = QPushButton('Закрыть')
+        close_btn.clicked.connect(dialog.accept)
+        btn_layout.addWidget(close_btn)
         layout.addLayout(btn_layout)
         
-        # Область для результатов
-        result_table = QTableWidget()
-        layout.addWidget(result_table)
+        dialog.exec_()
+    
+    def run_maintenance(self):
+        """Плановое обслуживание (ANALYZE, incremental_vacuum) в фоновом потоке"""
+        from database.maintenance import DatabaseMaintenance
+        
+        def finished(done):
+            if done:
+                self.statusBar().showMessage(f'Обслуживание базы: {", ".join(done)}')
         
-        # Обработчики событий
-        def execute_query():
-            query = query_edit.toPlainText().strip()
-            if not query:
-                QMessageBox.warning(dialog, 'Предупреждение', 'Введите SQL запрос')
+        # База может быть занята другим пользователем, повторим в следующий раз
+        start_task(self, 'maintenance_worker',
+                   lambda conn: DatabaseMaintenance(self.db, conn).run_due(),
+                   finished, lambda error: print(f"Ошибка обслуживания базы: {error}"))
+    
+    def show_maintenance_dialog(self):
+        from database.maintenance import DatabaseMaintenance
+        
+        maintenance = DatabaseMaintenance(self.db)
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Обслуживание базы данных')
+        dialog.setGeometry(200, 200, 700, 500)
+        
+        layout = QVBoxLayout()
+        summary_label = QLabel()
+        layout.addWidget(summary_label)
+        
+        table = QTableWidget()
+        table.setColumnCount(4)
+        table.setHorizontalHeaderLabels(['Объект', 'Страниц', 'Размер, КБ', 'Заполнение, %'])
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(table)
+        
+        def load_stats():
+            try:
+                stats = maintenance.database_stats()
+                analyze_days = maintenance.days_since('analyze')
+                summary_label.setText(
+                    f"Размер базы: {stats['size_bytes'] / 1024:.0f} КБ, "
+                    f"свободных страниц: {stats['freelist_count']} ({stats['fragmentation']:.1f}%), "
+                    f"auto_vacuum: {stats['auto_vacuum']}, журнал: {stats['journal_mode']}\n"
+                    f"Последний ANALYZE: "
+                    + (f"{analyze_days:.0f} дн. назад" if analyze_days is not None else "не выполнялся")
+                )
+                rows = maintenance.table_stats()
+                table.setRowCount(len(rows))
+                for i, row in enumerate(rows):
+                    table.setItem(i, 0, QTableWidgetItem(row['name']))
+                    table.setItem(i, 1, QTableWidgetItem(str(row['pages'] or '')))
+                    size = f"{row['size_bytes'] / 1024:.1f}" if row['size_bytes'] is not None else ''
+                    fill = f"{row['fill']:.0f}" if row['fill'] is not None else ''
+                    table.setItem(i, 2, QTableWidgetItem(size))
+                    table.setItem(i, 3, QTableWidgetItem(fill))
+                table.resizeColumnsToContents()
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка чтения статистики: {str(e)}')
+        
+        def run_analyze():
+            try:
+                maintenance.analyze()
+                load_stats()
+                self.statusBar().showMessage('Статистика базы обновлена')
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка ANALYZE: {str(e)}')
+        
+        def run_vacuum():
+            try:
+                if maintenance.auto_vacuum_mode() != 'INCREMENTAL':
+                    reply = QMessageBox.question(
+                        dialog, 'Подтверждение',
+                        'Для освобождения места база будет однократно перестроена (VACUUM).\n'
+                        'Продолжить?',
+                        QMessageBox.Yes | QMessageBox.No
+                    )
+                    if reply != QMessageBox.Yes:
+                        return
+                    maintenance.enable_incremental_vacuum()
+                freed = maintenance.incremental_vacuum(maintenance.database_stats()['freelist_count'])
+                load_stats()
+                self.statusBar().showMessage(f'Освобождено страниц: {freed}')
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка освобождения места: {str(e)}')
+        
+        button_layout = QHBoxLayout()
+        analyze_btn = QPushButton('ANALYZE')
+        analyze_btn.clicked.connect(run_analyze)
+        vacuum_btn = QPushButton('Освободить место')
+        vacuum_btn.clicked.connect(run_vacuum)
+        refresh_btn = QPushButton('Обновить')
+        refresh_btn.clicked.connect(load_stats)
+        close_btn = QPushButton('Закрыть')
+        close_btn.clicked.connect(dialog.accept)
+        button_layout.addWidget(analyze_btn)
+        button_layout.addWidget(vacuum_btn)
+        button_layout.addWidget(refresh_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+        
+        dialog.setLayout(layout)
+        load_stats()
+        dialog.exec_()
+    
+    def show_index_advisor(self):
+        from database.query_advisor import QueryAdvisor
+        
+        advisor = QueryAdvisor(self.db)
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Советы по индексам')
+        dialog.setModal(True)
+        dialog.resize(950, 600)
+        
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(
+            f'Самые долгие запросы сеанса (дольше {Config.SLOW_QUERY_MS} мс) и индексы, '
+            f'которые уберут полный просмотр таблиц {", ".join(Config.ADVISOR_TABLES)}'
+        ))
+        
+        table = QTableWidget()
+        table.setColumnCount(5)
+        table.setHorizontalHeaderLabels(['Запрос', 'Вызовов', 'Всего, мс', 'Наибольшее, мс', 'Предложение'])
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setSelectionMode(QTableWidget.SingleSelection)
+        layout.addWidget(table)
+        
+        details = QTextEdit()
+        details.setReadOnly(True)
+        details.setFont(QFont('Courier New', 9))
+        layout.addWidget(details)
+        
+        items = []
+        
+        def selected():
+            row = table.currentRow()
+            if row < 0 or row >= len(items):
+                return None, None
+            item = items[row]
+            proposals = [s for s in item['advice']['suggestions'] if not s['exists']]
+            return item, proposals[0] if proposals else None
+        
+        def load():
+            items[:] = advisor.review()
+            table.setRowCount(len(items))
+            for i, item in enumerate(items):
+                entry, advice = item['entry'], item['advice']
+                text = ' '.join(entry['sql'].split())
+                table.setItem(i, 0, QTableWidgetItem(text[:120]))
+                for j, value in enumerate((entry['count'], entry['total'] * 1000, entry['max'] * 1000), 1):
+                    cell = QTableWidgetItem(f'{value:,.0f}' if j > 1 else str(value))
+                    cell.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    table.setItem(i, j, cell)
+                if advice.get('error'):
+                    proposal = f'Ошибка: {advice["error"]}'
+                elif advice['suggestions']:
+                    proposal = '; '.join(
+                        f'{s["table"]} ({", ".join(s["columns"])})' + (' - уже есть' if s['exists'] else '')
+                        for s in advice['suggestions'])
+                elif advice['scans']:
+                    proposal = 'полный просмотр без подходящих условий'
+                else:
+                    proposal = 'индексы используются'
+                table.setItem(i, 4, QTableWidgetItem(proposal))
+            table.resizeColumnsToContents()
+            table.setColumnWidth(0, min(table.columnWidth(0), 420))
+            details.setPlainText('' if items else 'Медленных запросов пока нет. Поработайте с программой '
+                                                  'и откройте это окно снова.')
+        
+        def show_details():
+            item, _ = selected()
+            if item is None:
+                return
+            advice = item['advice']
+            lines = [item['entry']['sql'].strip(), '', 'План:'] + [f'  {line}' for line in advice['plan']]
+            for suggestion in advice['suggestions']:
+                lines += ['', suggestion['sql'] + (' -- уже есть' if suggestion['exists'] else ''),
+                          'План с индексом:'] + [f'  {line}' for line in suggestion['plan_after']]
+            details.setPlainText('\n'.join(lines))
+        
+        running = []
+        
+        def show_what_if(suggestion, result):
+            speedup = result['before_ms'] / result['after_ms'] if result['after_ms'] else 0
+            details.setPlainText('\n'.join(
+                [suggestion['sql'], '',
+                 f'Копия базы: без индекса {result["before_ms"]:.1f} мс, с индексом {result["after_ms"]:.1f} мс '
+                 f'(в {speedup:.1f} раза), создание индекса {result["index_ms"]:.0f} мс, строк {result["rows"]}',
+                 '', 'План без индекса:'] + [f'  {line}' for line in result['plan_before']]
+                + ['', 'План с индексом:'] + [f'  {line}' for line in result['plan_after']]))
+        
+        def what_if_failed(message):
+            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сравнения на копии базы: {message}')
+        
+        def what_if_finished():
+            running.clear()
+            what_if_btn.setText('Проверить на копии базы')
+        
+        def run_what_if():
+            if running:
+                running[0].cancel()
+                return
+            item, suggestion = selected()
+            if suggestion is None:
+                QMessageBox.information(dialog, 'Советы по индексам', 'Выберите запрос с предложенным индексом')
+                return
+            entry = item['entry']
+            worker = BackgroundTask(
+                lambda conn: advisor.what_if(entry['sql'], suggestion['sql'], entry['params'],
+                                             connection=conn, progress=worker.progress),
+                dialog, timeout=Config.ADVISOR_WHATIF_TIMEOUT)
+            worker.done.connect(lambda result: show_what_if(suggestion, result))
+            worker.failed.connect(what_if_failed)
+            worker.finished.connect(what_if_finished)
+            running.append(worker)
+            what_if_btn.setText('Отменить проверку')
+            details.setPlainText(f'Сравнение на копии базы...\n\n{suggestion["sql"]}')
+            worker.start()
+        
+        def stop_what_if():
+            for worker in running:
+                worker.cancel()
+                worker.wait()
+        
+        def create_index():
+            _, suggestion = selected()
+            if suggestion is None:
+                QMessageBox.information(dialog, 'Советы по индексам', 'Выберите запрос с предложенным индексом')
+                return
+            reply = QMessageBox.question(
+                dialog, 'Создание индекса',
+                f'Создать индекс в рабочей базе?\n\n{suggestion["sql"]}',
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
                 return
-            
             try:
-                # Выполняем запрос
-                results = self.db.fetch_all(query)
-                
-                if not results:
-                    QMessageBox.information(dialog, 'Результат', 'Запрос выполнен успешно. Затронуто 0 строк.')
-                    result_table.setRowCount(0)
-                    result_table.setColumnCount(0)
-                    return
-                
-                # Отображаем результаты в таблице
-                result_table.setRowCount(len(results))
-                result_table.setColumnCount(len(results[0]))
-                
-                # Устанавливаем заголовки
-                headers = list(results[0].keys())
-                result_table.setHorizontalHeaderLabels(headers)
-                
-                # Заполняем данные
-                for i, row in enumerate(results):
-                    for j, header in enumerate(headers):
-                        value = row[header]
-                        item = QTableWidgetItem(str(value) if value is not None else '')
-                        result_table.setItem(i, j, item)
-                
-                result_table.resizeColumnsToContents()
-                self.statusBar().showMessage(f'Запрос выполнен. Найдено {len(results)} строк.')
-                
+                from database.query_advisor import index_name
+                self.db.execute_query(suggestion['sql'])
+                self.db.execute_query(f"ANALYZE {index_name(suggestion['table'], suggestion['columns'])}")
+                QMessageBox.information(dialog, 'Успех', 'Индекс создан')
+                load()
             except Exception as e:
-                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка выполнения запроса:\n{str(e)}')
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка создания индекса: {str(e)}')
         
-        def clear_query():
-            query_edit.clear()
-            result_table.setRowCount(0)
-            result_table.setColumnCount(0)
+        table.itemSelectionChanged.connect(show_details)
+        
+        btn_layout = QHBoxLayout()
+        refresh_btn = QPushButton('Обновить')
+        refresh_btn.clicked.connect(load)
+        btn_layout.addWidget(refresh_btn)
         
-        execute_btn.clicked.connect(execute_query)
-        clear_btn.clicked.connect(clear_query)
+        what_if_btn = QPushButton('Проверить на копии базы')
+        what_if_btn.setEnabled(not self.db.remote)
+        what_if_btn.clicked.connect(run_what_if)
+        dialog.finished.connect(stop_what_if)
+        btn_layout.addWidget(what_if_btn)
+        
+        create_btn = QPushButton('Создать индекс')
+        create_btn.clicked.connect(create_index)
+        btn_layout.addWidget(create_btn)
+        
+        btn_layout.addStretch()
+        close_btn = QPushButton('Закрыть')
+        close_btn.clicked.connect(dialog.accept)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        
+        load()
+        dialog.exec_()
+    
+    def show_query_dialog(self):
+        from gui.widgets.query_widget import QueryWidget
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Выполнение SQL запроса')
+        dialog.setMinimumSize(800, 550)
+        
+        layout = QVBoxLayout(dialog)
+        console = QueryWidget(dialog)
+        layout.addWidget(console)
+        
+        close_btn = QPushButton('Закрыть')
         close_btn.clicked.connect(dialog.close)
+        layout.addWidget(close_btn, alignment=Qt.AlignRight)
         
+        # Незавершенный запрос отменяется при закрытии окна
+        dialog.finished.connect(console.stop)
         dialog.exec_()
     
+    @profiled
     def generate_report(self, report_type):
+        from database.reports import REPORTS
+        from database.analytics import get_analytics
+        
         try:
-            if report_type == 'mining':
-                query = """
-                SELECT 
-                    m.mining_date as Дата,
-                    s.section_name as Участок,
-                    m.coal_mark as Марка_угля,
-                    m.volume as Объем_добычи,
-                    m.rock_volume as Объем_породы,
-                    c.price_per_ton as Цена_за_тонну,
-                    (m.volume * c.price_per_ton) as Стоимость_добычи
-                FROM mining m
-                JOIN sections s ON m.section_id = s.section_id
-                JOIN coal c ON m.coal_mark = c.coal_mark
-                ORDER BY m.mining_date DESC
-                LIMIT 100
-                """
-                title = 'Отчет по добыче'
-                
-            elif report_type == 'costs':
-                query = """
-                SELECT 
-                    c.cost_date as Дата,
-                    s.section_name as Участок,
-                    c.electricity as Электроэнергия_кВтч,
-                    c.fuel as Топливо_л,
-                    ROUND(c.electricity * 5.5, 2) as Стоимость_электроэнергии,
-                    ROUND(c.fuel * 55, 2) as Стоимость_топлива,
-                    ROUND(c.electricity * 5.5 + c.fuel * 55, 2) as Общие_затраты
-                FROM costs c
-                JOIN sections s ON c.section_id = s.section_id
-                ORDER BY c.cost_date DESC
-                LIMIT 100
-                """
-                title = 'Отчет по затратам'
-                
-            elif report_type == 'limits':
-                query = """
-                SELECT 
-                    s.section_name as Участок,
-                    l.month as Месяц,
-                    l.year as Год,
-                    l.plan_production as План_добычи,
-                    l.actual_production as Факт_добычи,
-                    l.plan_rock as План_породы,
-                    l.actual_rock as Факт_породы,
-                    CASE 
-                        WHEN l.plan_production > 0 
-                        THEN ROUND((l.actual_production * 100.0 / l.plan_production), 2)
-                        ELSE 0 
-                    END as Процент_добычи
-                FROM limits l
-                JOIN sections s ON l.section_id = s.section_id
-                ORDER BY l.year DESC, l.month DESC
-                """
-                title = 'Отчет по лимитам'
-            else:
+            if report_type not in REPORTS:
                 return
-            
-            results = self.db.fetch_all(query)
+            title, results = get_analytics().fetch_report(report_type)
             
             if not results:
                 QMessageBox.information(self, 'Информация', 'Нет данных для отчета.')
@@ -573,6 +1128,16 @@ class MainWindow(QMainWindow):
             
             layout.addWidget(table)
             
+            # Итоги по всей добыче - из куба, без пересчета исходных записей
+            if report_type == 'mining':
+                from database.cube import ProductionCube
+                totals = ProductionCube(self.db).totals()
+                layout.addWidget(QLabel(
+                    f'Итого за все время: добыча {totals["volume"]:,.0f} т, '
+                    f'порода {totals["rock_volume"]:,.0f} т, '
+                    f'стоимость {totals["revenue"]:,.0f} руб, смен {totals["shifts"]}'
+                ))
+            
             # Кнопки
             btn_layout = QHBoxLayout()
             
@@ -598,41 +1163,26 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка генерации отчета: {str(e)}')
     
+    @profiled
     def generate_salary_report(self):
+        from database.analytics import get_analytics
+        
         try:
-            # Запрос для расчета зарплаты
-            query = """
-            SELECT 
-                w.tab_number as Табельный_номер,
-                w.full_name as ФИО,
-                p.position_name as Должность,
-                s.section_name as Участок,
-                SUM(t.hours) as Отработано_часов,
-                SUM(t.hours) * 1500 as Начислено_рублей
-            FROM workers w
-            JOIN positions p ON w.position_id = p.position_id
-            JOIN sections s ON w.section_id = s.section_id
-            LEFT JOIN time_sheet t ON w.tab_number = t.tab_number
-            WHERE strftime('%m', t.date) = strftime('%m', 'now')
-               AND strftime('%Y', t.date) = strftime('%Y', 'now')
-            GROUP BY w.tab_number, w.full_name, p.position_name, s.section_name
-            ORDER BY s.section_name, w.full_name
-            """
-            
-            results = self.db.fetch_all(query)
+            # Начисления за текущий месяц по ставкам должностей (в SQLite: в зеркале нет ставок)
+            title, results = get_analytics().fetch_report('salary', mirror=False)
             
             if not results:
                 QMessageBox.information(self, 'Информация', 'Нет данных для расчета зарплаты.')
                 return
             
             dialog = QDialog(self)
-            dialog.setWindowTitle('Расчет заработной платы')
+            dialog.setWindowTitle(title)
             dialog.setMinimumSize(800, 500)
             
             layout = QVBoxLayout(dialog)
             
             # Заголовок
-            title_label = QLabel('<h2>Расчет заработной платы</h2>')
+            title_label = QLabel(f'<h2>{title}</h2>')
             title_label.setAlignment(Qt.AlignCenter)
             layout.addWidget(title_label)
             
@@ -696,6 +1246,12 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка расчета зарплаты: {str(e)}')
     
+    def show_payroll(self):
+        from gui.payroll_manager import PayrollManager
+        dialog = PayrollManager(self)
+        dialog.exec_()
+    
+    @profiled
     def export_data(self):
         try:
             import pandas as pd
@@ -726,6 +1282,167 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка экспорта: {str(e)}')
     
+    @profiled
+    def export_delta(self):
+        try:
+            from database.delta_export import DeltaExporter
+            
+            exporter = DeltaExporter()
+            pending = exporter.pending_count()
+            if not pending:
+                QMessageBox.information(self, 'Экспорт изменений', 'С прошлой выгрузки изменений нет.')
+                return
+            
+            formats = ['CSV', 'JSON Lines']
+            fmt, ok = QInputDialog.getItem(
+                self, 'Экспорт изменений',
+                f'Изменений с прошлой выгрузки: {pending}\nФормат файла:',
+                formats, 0, False
+            )
+            if not ok:
+                return
+            
+            files, count, last_seq = exporter.export('csv' if fmt == 'CSV' else 'jsonl')
+            
+            QMessageBox.information(
+                self, 'Экспорт завершен',
+                f'Выгружено строк: {count}\n' + '\n'.join(str(path) for path in files)
+            )
+            self.statusBar().showMessage(f'Экспорт изменений по №{last_seq} выполнен')
+            
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка экспорта: {str(e)}')
+    
+    def run_backup_task(self, title, task, on_done, error_title):
+        """Копирование базы в фоновом потоке с окном прогресса
+
+        task(progress) получает функцию progress(remaining, total) для
+        backup API; окно модальное, поэтому во время копирования главное
+        окно не обращается к базе.
+        """
+        progress = QProgressDialog(title, None, 0, 100, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.setValue(0)
+        
+        worker = BackgroundTask(lambda conn: task(worker.step.emit), self, with_connection=False)
+        
+        def on_step(remaining, total):
+            if total:
+                progress.setValue(int((total - remaining) * 100 / total))
+        
+        def finished(result):
+            progress.close()
+            on_done(result)
+        
+        def failed(message):
+            progress.close()
+            QMessageBox.critical(self, 'Ошибка', f'{error_title}: {message}')
+        
+        worker.step.connect(on_step)
+        worker.done.connect(finished)
+        worker.failed.connect(failed)
+        worker.start()
+        return worker
+    
+    @profiled
+    def backup_database(self):
+        if self.db.remote:
+            QMessageBox.information(self, 'Резервная копия',
+                                    'При работе через сервер копии создаются на сервере: python cli.py backup')
+            return
+        
+        from database.backup import BackupService
+        
+        def done(path):
+            QMessageBox.information(self, 'Резервная копия', f'Резервная копия создана:\n{path}')
+            self.statusBar().showMessage(f'Резервная копия: {path.name}')
+        
+        self.run_backup_task('Создание резервной копии...',
+                             lambda progress: BackupService().backup(progress=progress),
+                             done, 'Ошибка резервного копирования')
+    
+    @profiled
+    def restore_database(self):
+        from database.backup import BackupService
+        
+        if self.db.remote:
+            QMessageBox.information(self, 'Восстановление',
+                                    'При работе через сервер восстановление выполняется на сервере')
+            return
+        
+        service = BackupService()
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Восстановление из копии', str(service.backup_dir),
+            'Резервные копии (*.db.gz *.db)'
+        )
+        if not path:
+            return
+        
+        reply = QMessageBox.question(
+            self, 'Подтверждение восстановления',
+            f'Заменить текущую базу данными из копии\n{path}?\n'
+            'Текущее состояние будет сохранено отдельной копией.',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        
+        # Таймеры окна и открытых ранее форм опрашивают базу и переоткрыли бы
+        # соединение посреди восстановления; фоновые задачи держат свои соединения
+        timers = [timer for timer in self.findChildren(QTimer) if timer.isActive()]
+        for timer in timers:
+            timer.stop()
+        for worker in self.findChildren(BackgroundTask):
+            worker.cancel()
+            worker.wait()
+        self.db.close()
+        
+        def reopen():
+            try:
+                self.reopen_database()
+            except Exception as e:
+                QMessageBox.critical(self, 'Ошибка', f'Ошибка подключения к базе: {str(e)}')
+            for timer in timers:
+                timer.start()
+        
+        def done(safety_copy):
+            reopen()
+            message = 'База данных восстановлена.'
+            if safety_copy:
+                message += f'\nПрежнее состояние сохранено в:\n{safety_copy}'
+            QMessageBox.information(self, 'Восстановление', message)
+        
+        worker = self.run_backup_task('Восстановление базы...',
+                                      lambda progress: service.restore(path, progress=progress),
+                                      done, 'Ошибка восстановления')
+        worker.failed.connect(lambda message: reopen())
+    
+    def reopen_database(self):
+        """Подключение к базе после замены файла
+
+        Схема копии доводится до текущей версии, общие службы процесса
+        (архивы, кэш цен, зеркало, прогноз, проверка табеля) создаются заново.
+        """
+        from create_database import upgrade_database
+        from database.archive import reset_archive_manager
+        from database.coal_prices import reset_price_cache
+        from database.analytics import reset_analytics
+        from database.forecast import reset_forecast_engine
+        from database.timesheet_check import reset_timesheet_validator
+        
+        self.db.connect()
+        upgrade_database(self.db)
+        reset_archive_manager()
+        reset_price_cache()
+        reset_forecast_engine()
+        reset_timesheet_validator()
+        try:
+            reset_analytics()
+        except Exception as e:
+            print(f"Ошибка сброса аналитического зеркала: {e}")
+    
+    @profiled
     def export_to_excel(self, data, report_name):
         try:
             import pandas as pd
@@ -749,6 +1466,7 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Ошибка экспорта: {str(e)}')
     
+    @profiled
     def export_report_to_excel(self, data, title):
         try:
             import pandas as pd
@@ -858,6 +1576,28 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
+            # Фоновые задачи прерываются и завершаются до закрытия базы
+            for worker in self.findChildren(BackgroundTask):
+                worker.cancel()
+                worker.wait()
+            if not self.db.remote:
+                try:
+                    from database.maintenance import DatabaseMaintenance
+                    DatabaseMaintenance(self.db).optimize()
+                except Exception as e:
+                    print(f"Ошибка PRAGMA optimize: {e}")
+            # Замеры сеанса, включенного через MINE_PROFILE, сохраняются при выходе
+            if self.profiler.enabled and self.profiler.spans:
+                try:
+                    print(f"Профиль сеанса сохранен: {self.profiler.dump()}")
+                except Exception as e:
+                    print(f"Ошибка сохранения профиля: {e}")
+            self.latency_monitor.stop()
+            if Config.LATENCY_MONITOR and self.latency_monitor.stall_count:
+                try:
+                    print(f"Отчет о зависаниях сохранен: {self.latency_monitor.dump()}")
+                except Exception as e:
+                    print(f"Ошибка сохранения отчета о зависаниях: {e}")
             self.db.close()
             event.accept()
         else:
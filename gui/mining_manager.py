@@ -2,12 +2,21 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QDoubleValidator
 from database.db_connection import DatabaseConnection
+from database.models import Mining
+from database.repositories import MiningRepository, CoalRepository, SectionRepository
+from database.archive import get_archive_manager, ARCHIVED_DATE_MESSAGE
+from database.cube import ProductionCube
+from database.coal_prices import get_price_cache
+from database.anomaly import AnomalyDetector, STAT_MEASURES
+from database.profiler import profiled
 from datetime import datetime
+from config import Config
 
 class MiningManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.mining = MiningRepository(self.db)
         self.current_mining_id = None
         self.init_ui()
         self.load_data()
@@ -56,6 +65,10 @@ class MiningManager(QDialog):
         filter_btn.clicked.connect(self.load_data)
         toolbar.addWidget(filter_btn)
         
+        audit_btn = QPushButton('Проверка значений')
+        audit_btn.clicked.connect(self.show_audit)
+        toolbar.addWidget(audit_btn)
+        
         toolbar.addStretch()
         layout.addLayout(toolbar)
         
@@ -76,51 +89,41 @@ class MiningManager(QDialog):
         self.stats_label = QLabel('')
         layout.addWidget(self.stats_label)
     
+    @profiled
     def load_data(self):
         try:
             date_from = self.date_from.date().toString('yyyy-MM-dd')
             date_to = self.date_to.date().toString('yyyy-MM-dd')
             
-            query = """
-            SELECT m.*, s.section_name, c.coal_mark, c.price_per_ton,
-                   (m.volume * c.price_per_ton) as total_cost
-            FROM mining m
-            JOIN sections s ON m.section_id = s.section_id
-            JOIN coal c ON m.coal_mark = c.coal_mark
-            WHERE m.mining_date BETWEEN ? AND ?
-            ORDER BY m.mining_date DESC, m.shift
-            """
+            # Для периодов в закрытых годах подключаются архивные файлы
+            results = self.mining.period(date_from, date_to)
             
-            results = self.db.fetch_all(query, (date_from, date_to))
+            # Стоимость по цене марки на дату добычи из кэша интервалов цен
+            prices = get_price_cache()
+            prices.refresh()
             
             self.table.setRowCount(len(results))
             
-            total_volume = 0
-            total_rock = 0
-            total_cost = 0
-            
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['mining_id'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['mining_date']))
-                self.table.setItem(i, 2, QTableWidgetItem(str(row['shift'])))
-                self.table.setItem(i, 3, QTableWidgetItem(row['coal_mark']))
-                self.table.setItem(i, 4, QTableWidgetItem(row['section_name']))
-                self.table.setItem(i, 5, QTableWidgetItem(f"{row['volume']:.1f}"))
-                self.table.setItem(i, 6, QTableWidgetItem(f"{row['rock_volume']:.1f}"))
-                self.table.setItem(i, 7, QTableWidgetItem(f"{row['total_cost']:,.0f}"))
-                
-                total_volume += row['volume'] or 0
-                total_rock += row['rock_volume'] or 0
-                total_cost += row['total_cost'] or 0
+            for i, mining in enumerate(results):
+                total_cost = (mining.volume or 0) * (prices.price(mining.coal_mark, mining.mining_date) or 0)
+                self.table.setItem(i, 0, QTableWidgetItem(str(mining.mining_id)))
+                self.table.setItem(i, 1, QTableWidgetItem(mining.mining_date))
+                self.table.setItem(i, 2, QTableWidgetItem(str(mining.shift)))
+                self.table.setItem(i, 3, QTableWidgetItem(mining.coal_mark))
+                self.table.setItem(i, 4, QTableWidgetItem(mining.section_name))
+                self.table.setItem(i, 5, QTableWidgetItem(f"{mining.volume:.1f}"))
+                self.table.setItem(i, 6, QTableWidgetItem(f"{mining.rock_volume:.1f}"))
+                self.table.setItem(i, 7, QTableWidgetItem(f"{total_cost:,.0f}"))
             
             self.table.resizeColumnsToContents()
             
-            # Обновляем статистику
+            # Итоги за период берутся из куба добычи
+            totals = ProductionCube(self.db).totals(date_from, date_to)
             self.stats_label.setText(
                 f'Период: {date_from} - {date_to} | '
-                f'Всего добычи: {total_volume:.1f} т | '
-                f'Всего породы: {total_rock:.1f} т | '
-                f'Общая стоимость: {total_cost:,.0f} руб'
+                f'Всего добычи: {totals["volume"]:.1f} т | '
+                f'Всего породы: {totals["rock_volume"]:.1f} т | '
+                f'Общая стоимость: {totals["revenue"]:,.0f} руб'
             )
             
         except Exception as e:
@@ -136,6 +139,10 @@ class MiningManager(QDialog):
             QMessageBox.warning(self, 'Предупреждение', 'Выберите запись для редактирования')
             return
         
+        if get_archive_manager().is_archived_date(self.table.item(selected_row, 1).text()):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не редактируется')
+            return
+        
         mining_id = int(self.table.item(selected_row, 0).text())
         self.current_mining_id = mining_id
         self.show_mining_dialog()
@@ -167,48 +174,42 @@ class MiningManager(QDialog):
         
         # Загружаем списки
         try:
-            query = "SELECT coal_mark FROM coal ORDER BY coal_mark"
-            coals = self.db.fetch_all(query)
-            for coal in coals:
-                coal_combo.addItem(coal['coal_mark'])
+            coal_combo.addItems(CoalRepository(self.db).marks())
             
-            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
-            sections = self.db.fetch_all(query)
-            for section in sections:
-                section_combo.addItem(section['section_name'], section['section_id'])
+            for section_id, section_name in SectionRepository(self.db).choices():
+                section_combo.addItem(section_name, section_id)
         except Exception as e:
             print(f"Ошибка загрузки списков: {e}")
         
         # Загружаем данные для редактирования
         if self.current_mining_id:
-            query = "SELECT * FROM mining WHERE mining_id = ?"
-            mining_data = self.db.fetch_one(query, (self.current_mining_id,))
+            mining = self.mining.get(self.current_mining_id)
             
-            if mining_data:
+            if mining:
                 # Дата
                 try:
-                    mining_date = datetime.strptime(mining_data['mining_date'], '%Y-%m-%d')
+                    mining_date = datetime.strptime(mining.mining_date, '%Y-%m-%d')
                     date_edit.setDate(QDate(mining_date.year, mining_date.month, mining_date.day))
                 except:
                     pass
                 
                 # Смена
-                shift_combo.setCurrentText(str(mining_data['shift']))
+                shift_combo.setCurrentText(str(mining.shift))
                 
                 # Марка угля
                 for i in range(coal_combo.count()):
-                    if coal_combo.itemText(i) == mining_data['coal_mark']:
+                    if coal_combo.itemText(i) == mining.coal_mark:
                         coal_combo.setCurrentIndex(i)
                         break
                 
                 # Участок
                 for i in range(section_combo.count()):
-                    if section_combo.itemData(i) == mining_data['section_id']:
+                    if section_combo.itemData(i) == mining.section_id:
                         section_combo.setCurrentIndex(i)
                         break
                 
-                volume_edit.setText(str(mining_data['volume']) if mining_data['volume'] else '')
-                rock_edit.setText(str(mining_data['rock_volume']) if mining_data['rock_volume'] else '')
+                volume_edit.setText(str(mining.volume) if mining.volume else '')
+                rock_edit.setText(str(mining.rock_volume) if mining.rock_volume else '')
         
         layout.addRow('Дата:', date_edit)
         layout.addRow('Смена:', shift_combo)
@@ -229,6 +230,7 @@ class MiningManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_mining(self, dialog, date, shift, coal_mark, section_id, volume, rock):
         # Валидация
         if not volume.strip():
@@ -236,40 +238,128 @@ class MiningManager(QDialog):
             return
         
         try:
-            volume_value = float(volume) if volume else 0
-            rock_value = float(rock) if rock else 0
-            shift_value = int(shift)
+            mining = Mining(
+                mining_id=self.current_mining_id,
+                mining_date=date,
+                shift=int(shift),
+                volume=float(volume) if volume else 0,
+                coal_mark=coal_mark,
+                section_id=section_id,
+                rock_volume=float(rock) if rock else 0,
+            )
+            
+            if get_archive_manager().is_archived_date(date):
+                QMessageBox.warning(dialog, 'Ошибка', ARCHIVED_DATE_MESSAGE)
+                return
+            
+            if not self.confirm_values(dialog, mining):
+                return
             
             if self.current_mining_id:
                 # Обновление существующей записи
-                query = """
-                UPDATE mining SET 
-                    mining_date = ?,
-                    shift = ?,
-                    coal_mark = ?,
-                    section_id = ?,
-                    volume = ?,
-                    rock_volume = ?
-                WHERE mining_id = ?
-                """
-                params = (date, shift_value, coal_mark, section_id, 
-                         volume_value, rock_value, self.current_mining_id)
+                if not self.mining.update(mining):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление новой записи
-                query = """
-                INSERT INTO mining 
-                (mining_date, shift, coal_mark, section_id, volume, rock_volume)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """
-                params = (date, shift_value, coal_mark, section_id, volume_value, rock_value)
+                self.mining.insert(mining)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    def confirm_values(self, dialog, mining):
+        """Подтверждение значений, необычных для участка, марки и смены"""
+        group = (mining.section_id, mining.coal_mark, mining.shift)
+        previous = None
+        if mining.mining_id:
+            old = self.mining.get(mining.mining_id)
+            # Исправляемая смена той же группы не должна влиять на сравнение
+            if old and (old.section_id, old.coal_mark, old.shift) == group:
+                previous = {'volume': old.volume, 'rock_volume': old.rock_volume}
+        
+        values = {'volume': mining.volume, 'rock_volume': mining.rock_volume}
+        found = AnomalyDetector(self.db).check(*group, values, previous)
+        if not found:
+            return True
+        
+        lines = [
+            f'{STAT_MEASURES[name].capitalize()}: {value:,.1f} т при обычном {mean:,.1f} т '
+            f'(отклонение {deviation:+.1f} σ)'
+            for name, value, mean, deviation in found
+        ]
+        reply = QMessageBox.question(
+            dialog, 'Необычное значение',
+            'Значения заметно отличаются от прежних смен участка по этой марке:\n\n'
+            + '\n'.join(lines) + '\n\nСохранить запись?',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        return reply == QMessageBox.Yes
+    
+    @profiled
+    def show_audit(self):
+        date_from = self.date_from.date().toString('yyyy-MM-dd')
+        date_to = self.date_to.date().toString('yyyy-MM-dd')
+        try:
+            rows = AnomalyDetector(self.db).audit(date_from, date_to)
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка проверки: {str(e)}')
+            return
+        
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f'Необычные значения за {date_from} - {date_to}')
+        dialog.setMinimumSize(900, 400)
+        layout = QVBoxLayout(dialog)
+        
+        table = QTableWidget()
+        table.setColumnCount(9)
+        table.setHorizontalHeaderLabels([
+            'ID', 'Дата', 'Смена', 'Марка угля', 'Участок',
+            'Добыча (т)', 'Обычно (т)', 'Порода (т)', 'Обычно (т)'
+        ])
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            table.setItem(i, 0, QTableWidgetItem(str(row['mining_id'])))
+            table.setItem(i, 1, QTableWidgetItem(row['mining_date']))
+            table.setItem(i, 2, QTableWidgetItem(str(row['shift'])))
+            table.setItem(i, 3, QTableWidgetItem(row['coal_mark']))
+            table.setItem(i, 4, QTableWidgetItem(row['section_name']))
+            for j, name in ((5, 'volume'), (7, 'rock_volume')):
+                item = QTableWidgetItem(f"{row[name] or 0:,.1f}")
+                if abs(row[f'{name}_deviation']) > Config.ANOMALY_THRESHOLD:
+                    item.setBackground(Qt.red)
+                    item.setForeground(Qt.white)
+                    item.setToolTip(f"Отклонение {row[f'{name}_deviation']:+.1f} σ")
+                table.setItem(i, j, item)
+                table.setItem(i, j + 1, QTableWidgetItem(f"{row[f'{name}_mean']:,.1f}"))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+        
+        def edit_selected():
+            row = table.currentRow()
+            if row < 0:
+                return
+            if get_archive_manager().is_archived_date(table.item(row, 1).text()):
+                QMessageBox.warning(dialog, 'Предупреждение', 'Запись относится к архивному году и не редактируется')
+                return
+            self.current_mining_id = int(table.item(row, 0).text())
+            self.show_mining_dialog()
+        
+        table.doubleClicked.connect(edit_selected)
+        
+        layout.addWidget(QLabel(f'Найдено записей: {len(rows)}. Двойной щелчок - исправление записи'))
+        btn_box = QDialogButtonBox(QDialogButtonBox.Close)
+        btn_box.rejected.connect(dialog.reject)
+        layout.addWidget(btn_box)
+        dialog.exec_()
+    
+    @profiled
     def delete_mining(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -280,6 +370,10 @@ class MiningManager(QDialog):
         mining_date = self.table.item(selected_row, 1).text()
         volume = self.table.item(selected_row, 5).text()
         
+        if get_archive_manager().is_archived_date(mining_date):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не удаляется')
+            return
+        
         reply = QMessageBox.question(
             self, 'Подтверждение удаления',
             f'Удалить запись о добыче от {mining_date} ({volume} т)?',
@@ -288,8 +382,7 @@ class MiningManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM mining WHERE mining_id = ?"
-                self.db.execute_query(query, (mining_id,))
+                self.mining.delete(mining_id)
                 self.load_data()
                 self.stats_label.setText(f'Запись #{mining_id} удалена')
             except Exception as e:
@@ -0,0 +1,337 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import Qt, QDate
+from database.db_connection import DatabaseConnection
+from database.payroll import PayrollService, LINE_COLUMNS, LINE_TITLES
+from database.profiler import profiled
+
+class PayrollManager(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.db = DatabaseConnection()
+        self.payroll = PayrollService(self.db)
+        self.calculated = []
+        self.init_ui()
+        self.load_rates()
+        self.load_runs()
+
+    def init_ui(self):
+        self.setWindowTitle('Начисление заработной платы')
+        self.setMinimumSize(1000, 600)
+
+        layout = QVBoxLayout(self)
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(self.create_rates_tab(), 'Ставки должностей')
+        self.tabs.addTab(self.create_calculation_tab(), 'Расчет')
+        self.tabs.addTab(self.create_runs_tab(), 'Сохраненные расчеты')
+        layout.addWidget(self.tabs)
+
+        # Статус
+        self.status_label = QLabel('Готово')
+        layout.addWidget(self.status_label)
+
+    def create_rates_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        toolbar = QHBoxLayout()
+
+        add_btn = QPushButton('Новая ставка')
+        add_btn.clicked.connect(self.add_rate)
+        toolbar.addWidget(add_btn)
+
+        delete_btn = QPushButton('Удалить')
+        delete_btn.clicked.connect(self.delete_rate)
+        toolbar.addWidget(delete_btn)
+
+        toolbar.addStretch()
+        layout.addLayout(toolbar)
+
+        self.rates_table = QTableWidget()
+        self.rates_table.setColumnCount(3)
+        self.rates_table.setHorizontalHeaderLabels(['Должность', 'Действует с', 'Ставка, руб/час'])
+        self.rates_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.rates_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.rates_table)
+
+        return tab
+
+    def create_calculation_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        # Период в месяцах
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel('С месяца:'))
+        self.month_from = QDateEdit()
+        self.month_from.setDisplayFormat('MM.yyyy')
+        self.month_from.setDate(QDate.currentDate())
+        period_layout.addWidget(self.month_from)
+
+        period_layout.addWidget(QLabel('По месяц:'))
+        self.month_to = QDateEdit()
+        self.month_to.setDisplayFormat('MM.yyyy')
+        self.month_to.setDate(QDate.currentDate())
+        period_layout.addWidget(self.month_to)
+
+        calculate_btn = QPushButton('Рассчитать')
+        calculate_btn.clicked.connect(self.calculate)
+        period_layout.addWidget(calculate_btn)
+
+        save_btn = QPushButton('Сохранить расчет')
+        save_btn.clicked.connect(self.save_run)
+        period_layout.addWidget(save_btn)
+
+        period_layout.addStretch()
+        layout.addLayout(period_layout)
+
+        self.lines_table = self.create_lines_table()
+        layout.addWidget(self.lines_table)
+
+        self.calculation_label = QLabel('')
+        self.calculation_label.setAlignment(Qt.AlignRight)
+        layout.addWidget(self.calculation_label)
+
+        return tab
+
+    def create_runs_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        toolbar = QHBoxLayout()
+
+        export_btn = QPushButton('Выгрузить в CSV')
+        export_btn.clicked.connect(self.export_run)
+        toolbar.addWidget(export_btn)
+
+        delete_btn = QPushButton('Удалить расчет')
+        delete_btn.clicked.connect(self.delete_run)
+        toolbar.addWidget(delete_btn)
+
+        toolbar.addStretch()
+        layout.addLayout(toolbar)
+
+        self.runs_table = QTableWidget()
+        self.runs_table.setColumnCount(7)
+        self.runs_table.setHorizontalHeaderLabels([
+            '№', 'Период', 'Создан', 'Пользователь', 'Работников', 'Часов', 'Начислено'
+        ])
+        self.runs_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.runs_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.runs_table.itemSelectionChanged.connect(self.show_run_lines)
+        layout.addWidget(self.runs_table)
+
+        self.run_lines_table = self.create_lines_table()
+        layout.addWidget(self.run_lines_table)
+
+        return tab
+
+    def create_lines_table(self):
+        table = QTableWidget()
+        table.setColumnCount(len(LINE_TITLES))
+        table.setHorizontalHeaderLabels(LINE_TITLES)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        return table
+
+    def fill_lines(self, table, rows):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, column in enumerate(LINE_COLUMNS):
+                value = row[column]
+                text = f'{value:,.2f}' if isinstance(value, float) else str(value or '')
+                table.setItem(i, j, QTableWidgetItem(text))
+        table.resizeColumnsToContents()
+
+    @profiled
+    def load_rates(self):
+        try:
+            results = self.payroll.rates()
+
+            self.rates_table.setRowCount(len(results))
+
+            for i, row in enumerate(results):
+                name_item = QTableWidgetItem(row['position_name'])
+                name_item.setData(Qt.UserRole, row['position_id'])
+                self.rates_table.setItem(i, 0, name_item)
+                self.rates_table.setItem(i, 1, QTableWidgetItem(row['valid_from']))
+                self.rates_table.setItem(i, 2, QTableWidgetItem(f"{row['hourly_rate']:,.2f}"))
+
+            self.rates_table.resizeColumnsToContents()
+
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки ставок: {str(e)}')
+
+    def add_rate(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Новая ставка')
+
+        layout = QFormLayout(dialog)
+
+        position_combo = QComboBox()
+        for row in self.db.fetch_all("SELECT * FROM positions ORDER BY position_name"):
+            position_combo.addItem(row['position_name'], row['position_id'])
+
+        # По умолчанию выбрана должность выделенной строки
+        selected_row = self.rates_table.currentRow()
+        if selected_row >= 0:
+            position_id = self.rates_table.item(selected_row, 0).data(Qt.UserRole)
+            position_combo.setCurrentIndex(position_combo.findData(position_id))
+
+        date_edit = QDateEdit()
+        date_edit.setCalendarPopup(True)
+        date_edit.setDate(QDate.currentDate())
+
+        rate_spin = QDoubleSpinBox()
+        rate_spin.setRange(0.01, 1000000)
+        rate_spin.setDecimals(2)
+        rate_spin.setValue(1500)
+
+        layout.addRow('Должность:', position_combo)
+        layout.addRow('Действует с:', date_edit)
+        layout.addRow('Ставка, руб/час:', rate_spin)
+
+        btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        btn_box.accepted.connect(lambda: self.save_rate(
+            dialog, position_combo.currentData(),
+            date_edit.date().toString('yyyy-MM-dd'), rate_spin.value()
+        ))
+        btn_box.rejected.connect(dialog.reject)
+
+        layout.addRow(btn_box)
+        dialog.exec_()
+
+    @profiled
+    def save_rate(self, dialog, position_id, valid_from, rate):
+        if position_id is None:
+            QMessageBox.warning(dialog, 'Ошибка', 'Выберите должность')
+            return
+
+        try:
+            self.payroll.set_rate(position_id, valid_from, rate)
+            dialog.accept()
+            self.load_rates()
+        except Exception as e:
+            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+
+    @profiled
+    def delete_rate(self):
+        selected_row = self.rates_table.currentRow()
+        if selected_row < 0:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите ставку для удаления')
+            return
+
+        position_id = self.rates_table.item(selected_row, 0).data(Qt.UserRole)
+        valid_from = self.rates_table.item(selected_row, 1).text()
+
+        try:
+            self.payroll.delete_rate(position_id, valid_from)
+            self.load_rates()
+        except ValueError as e:
+            QMessageBox.warning(self, 'Предупреждение', str(e))
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
+
+    def period(self):
+        month_from = self.month_from.date().toString('yyyy-MM')
+        month_to = self.month_to.date().toString('yyyy-MM')
+        if month_from > month_to:
+            raise ValueError('Начальный месяц позже конечного')
+        return month_from, month_to
+
+    @profiled
+    def calculate(self):
+        try:
+            month_from, month_to = self.period()
+            self.calculated = self.payroll.calculate(month_from, month_to)
+            self.fill_lines(self.lines_table, self.calculated)
+
+            workers = len({row['tab_number'] for row in self.calculated})
+            hours = sum(row['hours'] for row in self.calculated)
+            amount = sum(row['amount'] for row in self.calculated)
+            self.calculation_label.setText(
+                f'<b>Итого:</b> {workers} работников, {hours:,.1f} часов, {amount:,.2f} рублей'
+            )
+        except ValueError as e:
+            QMessageBox.warning(self, 'Предупреждение', str(e))
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка расчета зарплаты: {str(e)}')
+
+    @profiled
+    def save_run(self):
+        try:
+            month_from, month_to = self.period()
+            run_id = self.payroll.save_run(month_from, month_to)
+            self.load_runs()
+            self.status_label.setText(f'Расчет №{run_id} за {month_from} - {month_to} сохранен')
+        except ValueError as e:
+            QMessageBox.warning(self, 'Предупреждение', str(e))
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка сохранения расчета: {str(e)}')
+
+    @profiled
+    def load_runs(self):
+        try:
+            results = self.payroll.runs()
+
+            self.runs_table.setRowCount(len(results))
+
+            for i, row in enumerate(results):
+                period = row['month_from'] if row['month_from'] == row['month_to'] \
+                    else f"{row['month_from']} - {row['month_to']}"
+                self.runs_table.setItem(i, 0, QTableWidgetItem(str(row['run_id'])))
+                self.runs_table.setItem(i, 1, QTableWidgetItem(period))
+                self.runs_table.setItem(i, 2, QTableWidgetItem(row['created_at']))
+                self.runs_table.setItem(i, 3, QTableWidgetItem(row['created_by'] or ''))
+                self.runs_table.setItem(i, 4, QTableWidgetItem(str(row['workers'])))
+                self.runs_table.setItem(i, 5, QTableWidgetItem(f"{row['hours']:,.1f}"))
+                self.runs_table.setItem(i, 6, QTableWidgetItem(f"{row['amount']:,.2f}"))
+
+            self.runs_table.resizeColumnsToContents()
+
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки расчетов: {str(e)}')
+
+    def selected_run(self):
+        selected_row = self.runs_table.currentRow()
+        if selected_row < 0:
+            return None
+        return int(self.runs_table.item(selected_row, 0).text())
+
+    @profiled
+    def show_run_lines(self):
+        run_id = self.selected_run()
+        if run_id is not None:
+            self.fill_lines(self.run_lines_table, self.payroll.run_lines(run_id))
+
+    @profiled
+    def export_run(self):
+        run_id = self.selected_run()
+        if run_id is None:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите расчет для выгрузки')
+            return
+
+        try:
+            path = self.payroll.export_run(run_id)
+            QMessageBox.information(self, 'Успешный экспорт', f'Расчет выгружен в файл:\n{path}')
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка экспорта: {str(e)}')
+
+    @profiled
+    def delete_run(self):
+        run_id = self.selected_run()
+        if run_id is None:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите расчет для удаления')
+            return
+
+        reply = QMessageBox.question(
+            self, 'Подтверждение удаления', f'Удалить сохраненный расчет №{run_id}?',
+            QMessageBox.Yes | QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            try:
+                self.payroll.delete_run(run_id)
+                self.run_lines_table.setRowCount(0)
+                self.load_runs()
+            except Exception as e:
+                QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
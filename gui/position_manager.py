@@ -1,11 +1,15 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt
 from database.db_connection import DatabaseConnection
+from database.models import Position
+from database.repositories import PositionRepository
+from database.profiler import profiled
 
 class PositionManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.positions = PositionRepository(self.db)
         self.current_position_id = None
         self.init_ui()
         self.load_data()
@@ -52,16 +56,16 @@ class PositionManager(QDialog):
         self.status_label = QLabel('Готово')
         layout.addWidget(self.status_label)
     
+    @profiled
     def load_data(self):
         try:
-            query = "SELECT * FROM positions ORDER BY position_name"
-            results = self.db.fetch_all(query)
+            results = self.positions.all()
             
             self.table.setRowCount(len(results))
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['position_id'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['position_name']))
+            for i, position in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(str(position.position_id)))
+                self.table.setItem(i, 1, QTableWidgetItem(position.position_name))
             
             self.table.resizeColumnsToContents()
             self.status_label.setText(f'Загружено должностей: {len(results)}')
@@ -94,11 +98,10 @@ class PositionManager(QDialog):
         
         # Загружаем данные для редактирования
         if self.current_position_id:
-            query = "SELECT * FROM positions WHERE position_id = ?"
-            position_data = self.db.fetch_one(query, (self.current_position_id,))
+            position = self.positions.get(self.current_position_id)
             
-            if position_data:
-                name_edit.setText(position_data['position_name'])
+            if position:
+                name_edit.setText(position.position_name)
         
         layout.addRow('Наименование должности:', name_edit)
         
@@ -110,28 +113,32 @@ class PositionManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_position(self, dialog, name):
         if not name.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите наименование должности')
             return
         
         try:
+            position = Position(self.current_position_id, name)
             if self.current_position_id:
                 # Обновление существующей должности
-                query = "UPDATE positions SET position_name = ? WHERE position_id = ?"
-                params = (name, self.current_position_id)
+                if not self.positions.update(position):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление новой должности
-                query = "INSERT INTO positions (position_name) VALUES (?)"
-                params = (name,)
+                self.positions.insert(position)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_position(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -150,8 +157,7 @@ class PositionManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM positions WHERE position_id = ?"
-                self.db.execute_query(query, (position_id,))
+                self.positions.delete(position_id)
                 self.load_data()
                 self.status_label.setText(f'Должность "{position_name}" удалена')
             except Exception as e:
@@ -2,11 +2,15 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QDoubleValidator
 from database.db_connection import DatabaseConnection
+from database.models import Section
+from database.repositories import SectionRepository, WorkerRepository
+from database.profiler import profiled
 
 class SectionManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.sections = SectionRepository(self.db)
         self.current_section_id = None
         self.init_ui()
         self.load_data()
@@ -55,24 +59,19 @@ class SectionManager(QDialog):
         self.status_label = QLabel('Готово')
         layout.addWidget(self.status_label)
     
+    @profiled
     def load_data(self):
         try:
-            query = """
-            SELECT s.*, w.full_name as manager_name
-            FROM sections s
-            LEFT JOIN workers w ON s.manager_tab_number = w.tab_number
-            ORDER BY s.section_name
-            """
-            results = self.db.fetch_all(query)
+            results = self.sections.listing()
             
             self.table.setRowCount(len(results))
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['section_id'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['section_name']))
-                self.table.setItem(i, 2, QTableWidgetItem(f"{row['area']:.1f}" if row['area'] else ''))
-                self.table.setItem(i, 3, QTableWidgetItem(f"{row['height']:.1f}" if row['height'] else ''))
-                self.table.setItem(i, 4, QTableWidgetItem(row['manager_name'] if row['manager_name'] else 'Не назначен'))
+            for i, section in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(str(section.section_id)))
+                self.table.setItem(i, 1, QTableWidgetItem(section.section_name))
+                self.table.setItem(i, 2, QTableWidgetItem(f"{section.area:.1f}" if section.area else ''))
+                self.table.setItem(i, 3, QTableWidgetItem(f"{section.height:.1f}" if section.height else ''))
+                self.table.setItem(i, 4, QTableWidgetItem(section.manager_name if section.manager_name else 'Не назначен'))
             
             self.table.resizeColumnsToContents()
             self.status_label.setText(f'Загружено участков: {len(results)}')
@@ -113,26 +112,23 @@ class SectionManager(QDialog):
         manager_combo.addItem('Не назначен', None)
         
         try:
-            query = "SELECT tab_number, full_name FROM workers ORDER BY full_name"
-            workers = self.db.fetch_all(query)
-            for worker in workers:
-                manager_combo.addItem(worker['full_name'], worker['tab_number'])
+            for tab_number, full_name in WorkerRepository(self.db).choices():
+                manager_combo.addItem(full_name, tab_number)
         except Exception as e:
             print(f"Ошибка загрузки работников: {e}")
         
         # Загружаем данные для редактирования
         if self.current_section_id:
-            query = "SELECT * FROM sections WHERE section_id = ?"
-            section_data = self.db.fetch_one(query, (self.current_section_id,))
+            section = self.sections.get(self.current_section_id)
             
-            if section_data:
-                name_edit.setText(section_data['section_name'])
-                area_edit.setText(str(section_data['area']) if section_data['area'] else '')
-                height_edit.setText(str(section_data['height']) if section_data['height'] else '')
+            if section:
+                name_edit.setText(section.section_name)
+                area_edit.setText(str(section.area) if section.area else '')
+                height_edit.setText(str(section.height) if section.height else '')
                 
                 # Устанавливаем руководителя
                 for i in range(manager_combo.count()):
-                    if manager_combo.itemData(i) == section_data['manager_tab_number']:
+                    if manager_combo.itemData(i) == section.manager_tab_number:
                         manager_combo.setCurrentIndex(i)
                         break
         
@@ -152,41 +148,39 @@ class SectionManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_section(self, dialog, name, area, height, manager_id):
         if not name.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите название участка')
             return
         
         try:
-            area_value = float(area) if area else None
-            height_value = float(height) if height else None
+            section = Section(
+                section_id=self.current_section_id,
+                section_name=name,
+                area=float(area) if area else None,
+                height=float(height) if height else None,
+                manager_tab_number=manager_id,
+            )
             
             if self.current_section_id:
                 # Обновление существующего участка
-                query = """
-                UPDATE sections SET 
-                    section_name = ?, 
-                    area = ?, 
-                    height = ?, 
-                    manager_tab_number = ?
-                WHERE section_id = ?
-                """
-                params = (name, area_value, height_value, manager_id, self.current_section_id)
+                if not self.sections.update(section):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление нового участка
-                query = """
-                INSERT INTO sections (section_name, area, height, manager_tab_number)
-                VALUES (?, ?, ?, ?)
-                """
-                params = (name, area_value, height_value, manager_id)
+                self.sections.insert(section)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_section(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -205,8 +199,7 @@ class SectionManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM sections WHERE section_id = ?"
-                self.db.execute_query(query, (section_id,))
+                self.sections.delete(section_id)
                 self.load_data()
                 self.status_label.setText(f'Участок "{section_name}" удален')
             except Exception as e:
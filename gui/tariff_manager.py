@@ -0,0 +1,241 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import Qt, QDate
+from database.tariffs import TariffService, RESOURCES
+from database.profiler import profiled
+
+class TariffManager(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tariffs = TariffService()
+        self.init_ui()
+        self.load_data()
+
+    def init_ui(self):
+        self.setWindowTitle('Тарифы на электроэнергию и топливо')
+        self.setMinimumSize(700, 550)
+
+        layout = QVBoxLayout(self)
+
+        # Панель инструментов
+        toolbar = QHBoxLayout()
+
+        add_btn = QPushButton('Новый тариф')
+        add_btn.clicked.connect(self.add_tariff)
+        toolbar.addWidget(add_btn)
+
+        edit_btn = QPushButton('Изменить')
+        edit_btn.clicked.connect(self.edit_tariff)
+        toolbar.addWidget(edit_btn)
+
+        delete_btn = QPushButton('Удалить')
+        delete_btn.clicked.connect(self.delete_tariff)
+        toolbar.addWidget(delete_btn)
+
+        toolbar.addStretch()
+        layout.addLayout(toolbar)
+
+        # История тарифов
+        self.table = QTableWidget()
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels(['Ресурс', 'Действует с', 'Цена, руб', 'Единица'])
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.doubleClicked.connect(self.edit_tariff)
+        layout.addWidget(self.table)
+
+        # Пересчет затрат за период по действовавшим тарифам
+        reprice_group = QGroupBox('Стоимость затрат за период')
+        reprice_layout = QVBoxLayout(reprice_group)
+
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel('С:'))
+        self.date_from = QDateEdit()
+        self.date_from.setCalendarPopup(True)
+        self.date_from.setDate(QDate(QDate.currentDate().year(), 1, 1))
+        period_layout.addWidget(self.date_from)
+
+        period_layout.addWidget(QLabel('По:'))
+        self.date_to = QDateEdit()
+        self.date_to.setCalendarPopup(True)
+        self.date_to.setDate(QDate.currentDate())
+        period_layout.addWidget(self.date_to)
+
+        self.group_combo = QComboBox()
+        self.group_combo.addItem('По месяцам', 'month')
+        self.group_combo.addItem('По годам', 'year')
+        self.group_combo.addItem('По участкам', 'section')
+        period_layout.addWidget(self.group_combo)
+
+        reprice_btn = QPushButton('Рассчитать')
+        reprice_btn.clicked.connect(self.reprice)
+        period_layout.addWidget(reprice_btn)
+        period_layout.addStretch()
+        reprice_layout.addLayout(period_layout)
+
+        self.cost_table = QTableWidget()
+        self.cost_table.setColumnCount(6)
+        self.cost_table.setHorizontalHeaderLabels([
+            'Период', 'Электроэнергия, кВт·ч', 'Топливо, л',
+            'Электроэнергия, руб', 'Топливо, руб', 'Итого, руб'
+        ])
+        self.cost_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        reprice_layout.addWidget(self.cost_table)
+
+        layout.addWidget(reprice_group)
+
+        # Статус
+        self.status_label = QLabel('Готово')
+        layout.addWidget(self.status_label)
+
+    @profiled
+    def load_data(self):
+        try:
+            results = self.tariffs.list()
+
+            self.table.setRowCount(len(results))
+
+            for i, row in enumerate(results):
+                name, unit = RESOURCES[row['resource']]
+                resource_item = QTableWidgetItem(name)
+                resource_item.setData(Qt.UserRole, row['resource'])
+                self.table.setItem(i, 0, resource_item)
+                self.table.setItem(i, 1, QTableWidgetItem(row['valid_from']))
+                self.table.setItem(i, 2, QTableWidgetItem(f"{row['price']:.2f}"))
+                self.table.setItem(i, 3, QTableWidgetItem(unit))
+
+            self.table.resizeColumnsToContents()
+            self.status_label.setText(f'Тарифов в истории: {len(results)}')
+
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка загрузки данных: {str(e)}')
+
+    def selected_tariff(self):
+        selected_row = self.table.currentRow()
+        if selected_row < 0:
+            return None
+        return (
+            self.table.item(selected_row, 0).data(Qt.UserRole),
+            self.table.item(selected_row, 1).text(),
+            float(self.table.item(selected_row, 2).text()),
+        )
+
+    def add_tariff(self):
+        self.show_tariff_dialog()
+
+    def edit_tariff(self):
+        tariff = self.selected_tariff()
+        if tariff is None:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите тариф для изменения')
+            return
+        self.show_tariff_dialog(tariff)
+
+    def show_tariff_dialog(self, tariff=None):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Изменение тарифа' if tariff else 'Новый тариф')
+
+        layout = QFormLayout(dialog)
+
+        resource_combo = QComboBox()
+        for resource, (name, unit) in RESOURCES.items():
+            resource_combo.addItem(f'{name} ({unit})', resource)
+
+        date_edit = QDateEdit()
+        date_edit.setCalendarPopup(True)
+        date_edit.setDisplayFormat('yyyy-MM-dd')
+        date_edit.setMinimumDate(QDate(1900, 1, 1))
+        date_edit.setDate(QDate.currentDate())
+
+        price_spin = QDoubleSpinBox()
+        price_spin.setRange(0, 1000000)
+        price_spin.setDecimals(2)
+
+        # Для существующего тарифа меняется только цена
+        if tariff:
+            resource, valid_from, price = tariff
+            resource_combo.setCurrentIndex(resource_combo.findData(resource))
+            date_edit.setDate(QDate.fromString(valid_from, 'yyyy-MM-dd'))
+            price_spin.setValue(price)
+            resource_combo.setEnabled(False)
+            date_edit.setEnabled(False)
+
+        layout.addRow('Ресурс:', resource_combo)
+        layout.addRow('Действует с:', date_edit)
+        layout.addRow('Цена, руб:', price_spin)
+
+        # Кнопки
+        btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        btn_box.accepted.connect(lambda: self.save_tariff(
+            dialog,
+            resource_combo.currentData(),
+            date_edit.date().toString('yyyy-MM-dd'),
+            price_spin.value()
+        ))
+        btn_box.rejected.connect(dialog.reject)
+
+        layout.addRow(btn_box)
+        dialog.exec_()
+
+    @profiled
+    def save_tariff(self, dialog, resource, valid_from, price):
+        try:
+            self.tariffs.set_tariff(resource, valid_from, price)
+            dialog.accept()
+            self.load_data()
+            self.status_label.setText('Тариф сохранен. Стоимость затрат пересчитывается автоматически')
+        except Exception as e:
+            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+
+    @profiled
+    def delete_tariff(self):
+        tariff = self.selected_tariff()
+        if tariff is None:
+            QMessageBox.warning(self, 'Предупреждение', 'Выберите тариф для удаления')
+            return
+
+        resource, valid_from, price = tariff
+        reply = QMessageBox.question(
+            self, 'Подтверждение удаления',
+            f'Удалить тариф "{RESOURCES[resource][0]}" с {valid_from}?\n'
+            'Затраты этого периода будут рассчитаны по предыдущему тарифу.',
+            QMessageBox.Yes | QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            try:
+                self.tariffs.delete_tariff(resource, valid_from)
+                self.load_data()
+            except ValueError as e:
+                QMessageBox.warning(self, 'Предупреждение', str(e))
+            except Exception as e:
+                QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
+
+    @profiled
+    def reprice(self):
+        try:
+            date_from = self.date_from.date().toString('yyyy-MM-dd')
+            date_to = self.date_to.date().toString('yyyy-MM-dd')
+            group_by = self.group_combo.currentData()
+            results = self.tariffs.reprice(date_from, date_to, group_by)
+
+            self.cost_table.setRowCount(len(results) + 1)
+            totals = [0] * 5
+            key = 'section_name' if group_by == 'section' else 'period'
+
+            for i, row in enumerate(results):
+                values = [row['electricity'], row['fuel'], row['electricity_cost'],
+                          row['fuel_cost'], row['total_cost']]
+                self.cost_table.setItem(i, 0, QTableWidgetItem(str(row[key])))
+                for j, value in enumerate(values):
+                    self.cost_table.setItem(i, j + 1, QTableWidgetItem(f'{value or 0:,.1f}'))
+                    totals[j] += value or 0
+
+            # Итоговая строка
+            self.cost_table.setItem(len(results), 0, QTableWidgetItem('Итого'))
+            for j, value in enumerate(totals):
+                self.cost_table.setItem(len(results), j + 1, QTableWidgetItem(f'{value:,.1f}'))
+
+            self.cost_table.resizeColumnsToContents()
+            self.status_label.setText(f'Период: {date_from} - {date_to} | Общая стоимость: {totals[4]:,.0f} руб')
+
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка расчета: {str(e)}')
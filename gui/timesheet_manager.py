@@ -1,8 +1,12 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QDoubleValidator
-from database.db_connection import DatabaseConnection
+from database.db_connection import DatabaseConnection, constraint_message
+from database.archive import get_archive_manager, ARCHIVED_DATE_MESSAGE
+from database.timesheet_check import get_timesheet_validator, problem_text
+from database.profiler import profiled
 from datetime import datetime
+from config import Config
 
 class TimesheetManager(QDialog):
     def __init__(self, parent=None):
@@ -24,6 +28,10 @@ class TimesheetManager(QDialog):
         add_btn.clicked.connect(self.add_timesheet)
         toolbar.addWidget(add_btn)
         
+        shift_btn = QPushButton('Табель смены')
+        shift_btn.clicked.connect(self.show_shift_dialog)
+        toolbar.addWidget(shift_btn)
+        
         edit_btn = QPushButton('Редактировать')
         edit_btn.clicked.connect(self.edit_timesheet)
         toolbar.addWidget(edit_btn)
@@ -55,6 +63,10 @@ class TimesheetManager(QDialog):
         filter_btn.clicked.connect(self.load_data)
         toolbar.addWidget(filter_btn)
         
+        audit_btn = QPushButton('Проверка табеля')
+        audit_btn.clicked.connect(self.show_audit)
+        toolbar.addWidget(audit_btn)
+        
         toolbar.addStretch()
         layout.addLayout(toolbar)
         
@@ -75,14 +87,18 @@ class TimesheetManager(QDialog):
         self.stats_label = QLabel('')
         layout.addWidget(self.stats_label)
     
+    @profiled
     def load_data(self):
         try:
             date_from = self.date_from.date().toString('yyyy-MM-dd')
             date_to = self.date_to.date().toString('yyyy-MM-dd')
             
-            query = """
+            # Для периодов в закрытых годах подключаются архивные файлы
+            source = get_archive_manager().source('time_sheet', date_from, date_to)
+            
+            query = f"""
             SELECT t.*, s.section_name, w.full_name, p.position_name
-            FROM time_sheet t
+            FROM {source} t
             JOIN workers w ON t.tab_number = w.tab_number
             JOIN sections s ON t.section_id = s.section_id
             JOIN positions p ON w.position_id = p.position_id
@@ -134,6 +150,10 @@ class TimesheetManager(QDialog):
         shift = int(self.table.item(selected_row, 1).text())
         tab_number = int(self.table.item(selected_row, 3).text())
         
+        if get_archive_manager().is_archived_date(date):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не редактируется')
+            return
+        
         self.show_timesheet_dialog(date, shift, tab_number)
     
     def show_timesheet_dialog(self, date=None, shift=None, tab_number=None):
@@ -221,96 +241,393 @@ class TimesheetManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_timesheet(self, dialog, date, shift, tab_number, hours):
         if not hours.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите количество часов')
             return
         
+        if get_archive_manager().is_archived_date(date):
+            QMessageBox.warning(dialog, 'Ошибка', ARCHIVED_DATE_MESSAGE)
+            return
+        
         try:
-            # Получаем section_id работника
-            query = "SELECT section_id FROM workers WHERE tab_number = ?"
-            worker = self.db.fetch_one(query, (tab_number,))
-            
-            if not worker:
-                QMessageBox.warning(dialog, 'Ошибка', 'Работник не найден')
-                return
-            
-            section_id = worker['section_id']
             hours_value = float(hours)
             shift_value = int(shift)
             
-            # Проверяем, нет ли уже записи на эту дату и смену
-            check_query = """
-            SELECT COUNT(*) as count FROM time_sheet 
-            WHERE date = ? AND shift = ? AND tab_number = ?
-            """
-            check_result = self.db.fetch_one(check_query, (date, shift_value, tab_number))
-            
-            if check_result['count'] > 0:
-                QMessageBox.warning(dialog, 'Ошибка', 'Уже есть запись для этого работника на эту дату и смену')
+            problems = get_timesheet_validator().check(tab_number, date, shift_value, hours_value)
+            if not self.confirm_problems(dialog, [(tab_number, problems)]):
                 return
             
-            # Добавляем запись
+            # Участок берется из карточки работника в том же запросе,
+            # повтор записи на дату и смену отсекает первичный ключ
             query = """
             INSERT INTO time_sheet 
             (date, section_id, shift, tab_number, hours)
-            VALUES (?, ?, ?, ?, ?)
+            SELECT ?, section_id, ?, tab_number, ?
+            FROM workers WHERE tab_number = ?
+            RETURNING section_id
             """
-            params = (date, section_id, shift_value, tab_number, hours_value)
+            params = (date, shift_value, hours_value, tab_number)
+            
+            if not self.db.execute_returning(query, params):
+                QMessageBox.warning(dialog, 'Ошибка', 'Работник не найден')
+                return
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
-            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+            message = constraint_message(e)
+            if message:
+                QMessageBox.warning(dialog, 'Ошибка', message)
+            else:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def update_timesheet(self, dialog, old_date, old_shift, old_tab_number, 
                         new_date, new_shift, new_tab_number, hours):
         if not hours.strip():
             QMessageBox.warning(dialog, 'Ошибка', 'Введите количество часов')
             return
         
+        if get_archive_manager().is_archived_date(new_date):
+            QMessageBox.warning(dialog, 'Ошибка', ARCHIVED_DATE_MESSAGE)
+            return
+        
         try:
             hours_value = float(hours)
             shift_value = int(new_shift)
             
-            # Если изменился работник, получаем новый section_id
-            if old_tab_number != new_tab_number:
-                query = "SELECT section_id FROM workers WHERE tab_number = ?"
-                worker = self.db.fetch_one(query, (new_tab_number,))
-                
-                if not worker:
-                    QMessageBox.warning(dialog, 'Ошибка', 'Работник не найден')
-                    return
-                
-                section_id = worker['section_id']
-            else:
-                # Иначе используем старый section_id
-                query = "SELECT section_id FROM time_sheet WHERE date = ? AND shift = ? AND tab_number = ?"
-                old_record = self.db.fetch_one(query, (old_date, int(old_shift), old_tab_number))
-                section_id = old_record['section_id']
+            replacing = (old_date, int(old_shift)) if new_tab_number == old_tab_number else None
+            problems = get_timesheet_validator().check(
+                new_tab_number, new_date, shift_value, hours_value, replacing=replacing)
+            if not self.confirm_problems(dialog, [(new_tab_number, problems)]):
+                return
             
-            # Обновляем запись
+            # При смене работника участок берется из его карточки,
+            # иначе остается прежним (в SET справа видны старые значения строки)
             query = """
             UPDATE time_sheet SET 
                 date = ?,
-                section_id = ?,
+                section_id = CASE
+                    WHEN tab_number = ? THEN section_id
+                    ELSE (SELECT section_id FROM workers WHERE tab_number = ?)
+                END,
                 shift = ?,
                 tab_number = ?,
                 hours = ?
             WHERE date = ? AND shift = ? AND tab_number = ?
+            RETURNING section_id
             """
-            params = (new_date, section_id, shift_value, new_tab_number, hours_value,
+            params = (new_date, new_tab_number, new_tab_number, shift_value,
+                     new_tab_number, hours_value,
                      old_date, int(old_shift), old_tab_number)
             
-            self.db.execute_query(query, params)
+            if not self.db.execute_returning(query, params):
+                QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                return
+            
+            dialog.accept()
+            self.load_data()
+            
+        except Exception as e:
+            message = constraint_message(e)
+            if message:
+                QMessageBox.warning(dialog, 'Ошибка', message)
+            else:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+    
+    def show_shift_dialog(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Табель смены')
+        dialog.setMinimumSize(700, 500)
+        
+        layout = QVBoxLayout(dialog)
+        
+        # Параметры смены
+        params_layout = QHBoxLayout()
+        
+        date_edit = QDateEdit()
+        date_edit.setCalendarPopup(True)
+        date_edit.setDate(QDate.currentDate())
+        date_edit.setDisplayFormat('dd.MM.yyyy')
+        
+        shift_combo = QComboBox()
+        shift_combo.addItems(['1', '2'])
+        
+        section_combo = QComboBox()
+        try:
+            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
+            sections = self.db.fetch_all(query)
+            for section in sections:
+                section_combo.addItem(section['section_name'], section['section_id'])
+        except Exception as e:
+            print(f"Ошибка загрузки участков: {e}")
+        
+        params_layout.addWidget(QLabel('Дата:'))
+        params_layout.addWidget(date_edit)
+        params_layout.addWidget(QLabel('Смена:'))
+        params_layout.addWidget(shift_combo)
+        params_layout.addWidget(QLabel('Участок:'))
+        params_layout.addWidget(section_combo)
+        params_layout.addStretch()
+        layout.addLayout(params_layout)
+        
+        # Таблица бригады: редактируется только колонка часов
+        table = QTableWidget()
+        table.setColumnCount(4)
+        table.setHorizontalHeaderLabels(['Таб.№', 'ФИО', 'Должность', 'Отработано часов'])
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(table)
+        
+        # Заполнение пустых ячеек
+        fill_layout = QHBoxLayout()
+        fill_spin = QDoubleSpinBox()
+        fill_spin.setRange(0.5, 12)
+        fill_spin.setSingleStep(0.5)
+        fill_spin.setValue(8)
+        fill_btn = QPushButton('Заполнить пустые')
+        fill_layout.addWidget(QLabel('Часов:'))
+        fill_layout.addWidget(fill_spin)
+        fill_layout.addWidget(fill_btn)
+        fill_layout.addStretch()
+        layout.addLayout(fill_layout)
+        
+        info_label = QLabel('')
+        layout.addWidget(info_label)
+        
+        def load_brigade():
+            date = date_edit.date().toString('yyyy-MM-dd')
+            shift = int(shift_combo.currentText())
+            section_id = section_combo.currentData()
+            
+            query = """
+            SELECT w.tab_number, w.full_name, p.position_name, t.hours
+            FROM workers w
+            JOIN positions p ON w.position_id = p.position_id
+            LEFT JOIN time_sheet t ON t.tab_number = w.tab_number
+                 AND t.date = ? AND t.shift = ?
+            WHERE w.section_id = ?
+            ORDER BY w.full_name
+            """
+            workers = self.db.fetch_all(query, (date, shift, section_id))
+            
+            table.setRowCount(len(workers))
+            for i, worker in enumerate(workers):
+                for j, value in enumerate([str(worker['tab_number']), worker['full_name'],
+                                           worker['position_name']]):
+                    item = QTableWidgetItem(value)
+                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                    table.setItem(i, j, item)
+                hours = worker['hours']
+                table.setItem(i, 3, QTableWidgetItem(f"{hours:g}" if hours else ''))
+            
+            table.resizeColumnsToContents()
+            recorded = sum(1 for w in workers if w['hours'])
+            info_label.setText(f'Работников: {len(workers)} | Уже внесено: {recorded}')
+        
+        def fill_empty():
+            for i in range(table.rowCount()):
+                item = table.item(i, 3)
+                if item is None or not item.text().strip():
+                    table.setItem(i, 3, QTableWidgetItem(f"{fill_spin.value():g}"))
+        
+        date_edit.dateChanged.connect(load_brigade)
+        shift_combo.currentIndexChanged.connect(load_brigade)
+        section_combo.currentIndexChanged.connect(load_brigade)
+        fill_btn.clicked.connect(fill_empty)
+        
+        load_brigade()
+        
+        # Кнопки
+        btn_box = QDialogButtonBox(QDialogButtonBox.Save | QDialogButtonBox.Cancel)
+        btn_box.accepted.connect(lambda: self.save_shift_timesheet(
+            dialog, date_edit.date().toString('yyyy-MM-dd'),
+            shift_combo.currentText(), section_combo.currentData(), table
+        ))
+        btn_box.rejected.connect(dialog.reject)
+        layout.addWidget(btn_box)
+        
+        dialog.exec_()
+    
+    @profiled
+    def save_shift_timesheet(self, dialog, date, shift, section_id, table):
+        if section_id is None:
+            QMessageBox.warning(dialog, 'Ошибка', 'Выберите участок')
+            return
+        
+        if get_archive_manager().is_archived_date(date):
+            QMessageBox.warning(dialog, 'Ошибка', ARCHIVED_DATE_MESSAGE)
+            return
+        
+        shift_value = int(shift)
+        rows = []
+        cleared = []
+        
+        for i in range(table.rowCount()):
+            tab_number = int(table.item(i, 0).text())
+            item = table.item(i, 3)
+            text = item.text().strip().replace(',', '.') if item else ''
+            
+            if not text:
+                cleared.append(tab_number)
+                continue
+            
+            try:
+                hours_value = float(text)
+            except ValueError:
+                hours_value = -1
+            
+            if not 0 < hours_value <= 12:
+                QMessageBox.warning(
+                    dialog, 'Ошибка',
+                    f'Неверное количество часов для {table.item(i, 1).text()}: {text}\n'
+                    'Допустимо от 0 до 12 часов.'
+                )
+                return
+            
+            rows.append((date, section_id, shift_value, tab_number, hours_value))
+        
+        validator = get_timesheet_validator()
+        problems = [(row[3], validator.check(row[3], date, shift_value, row[4], section_id)) for row in rows]
+        if not self.confirm_problems(dialog, problems):
+            return
+        
+        try:
+            # Вся бригада сохраняется одной транзакцией: многострочный
+            # INSERT ... ON CONFLICT, разбитый только по лимиту параметров SQLite
+            chunk_size = max(1, self.db.max_variables() // 5)
+            
+            with self.db.transaction() as conn:
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    query = f"""
+                    INSERT INTO time_sheet (date, section_id, shift, tab_number, hours)
+                    VALUES {', '.join(['(?, ?, ?, ?, ?)'] * len(chunk))}
+                    ON CONFLICT(date, shift, tab_number) DO UPDATE SET
+                        section_id = excluded.section_id,
+                        hours = excluded.hours
+                    """
+                    conn.execute(query, [value for row in chunk for value in row])
+                
+                # Очищенные ячейки удаляют ранее внесенные записи
+                chunk_size = max(1, self.db.max_variables() - 2)
+                for start in range(0, len(cleared), chunk_size):
+                    chunk = cleared[start:start + chunk_size]
+                    query = f"""
+                    DELETE FROM time_sheet
+                    WHERE date = ? AND shift = ?
+                      AND tab_number IN ({', '.join(['?'] * len(chunk))})
+                    """
+                    conn.execute(query, [date, shift_value, *chunk])
+            
             dialog.accept()
             self.load_data()
+            self.stats_label.setText(
+                f'Табель смены {shift_value} от {date} сохранен: {len(rows)} работников'
+            )
             
         except Exception as e:
-            QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
+            message = constraint_message(e)
+            if message:
+                QMessageBox.warning(dialog, 'Ошибка', message)
+            else:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    def confirm_problems(self, dialog, problems):
+        """Подтверждение записи с нарушениями табеля: problems - [(таб.№, [(вид, значение)])]"""
+        problems = [(tab_number, found) for tab_number, found in problems if found]
+        if not problems:
+            return True
+        
+        names = {}
+        try:
+            tab_numbers = [tab_number for tab_number, _ in problems]
+            rows = self.db.fetch_all(
+                f"SELECT tab_number, full_name FROM workers WHERE tab_number IN ({', '.join(['?'] * len(tab_numbers))})",
+                tab_numbers)
+            names = {row['tab_number']: row['full_name'] for row in rows}
+        except Exception as e:
+            print(f"Ошибка загрузки работников: {e}")
+        
+        lines = [
+            f"{names.get(tab_number, tab_number)}: {'; '.join(problem_text(kind, value) for kind, value in found)}"
+            for tab_number, found in problems
+        ]
+        if len(lines) > 15:
+            lines = lines[:15] + [f'... и еще {len(lines) - 15}']
+        
+        reply = QMessageBox.question(
+            dialog, 'Проверка табеля',
+            'Обнаружены нарушения:\n\n' + '\n'.join(lines) + '\n\nВсе равно сохранить?',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        return reply == QMessageBox.Yes
+    
+    @profiled
+    def show_audit(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle('Проверка табеля за месяц')
+        dialog.setMinimumSize(800, 450)
+        layout = QVBoxLayout(dialog)
+        
+        month_layout = QHBoxLayout()
+        month_layout.addWidget(QLabel('Месяц:'))
+        month_edit = QDateEdit()
+        month_edit.setDisplayFormat('MM.yyyy')
+        month_edit.setDate(self.date_to.date())
+        month_layout.addWidget(month_edit)
+        month_layout.addStretch()
+        layout.addLayout(month_layout)
+        
+        table = QTableWidget()
+        table.setColumnCount(7)
+        table.setHorizontalHeaderLabels([
+            'Дата', 'Таб.№', 'ФИО', 'Участок', 'Часов за сутки', 'Часов за 7 дней', 'Нарушения'
+        ])
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(table)
+        
+        info_label = QLabel('')
+        layout.addWidget(info_label)
+        
+        def load_audit():
+            try:
+                rows = get_timesheet_validator().audit(month_edit.date().toString('yyyy-MM'))
+            except Exception as e:
+                QMessageBox.critical(dialog, 'Ошибка', f'Ошибка проверки: {str(e)}')
+                return
+            
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                found = []
+                if row['shifts'] > 1 and not Config.TIMESHEET_ALLOW_DOUBLE_SHIFT:
+                    found.append(problem_text('double_shift'))
+                if row['week_hours'] > Config.TIMESHEET_WEEK_HOURS:
+                    found.append(problem_text('week_hours', row['week_hours']))
+                if row['foreign_shifts']:
+                    found.append(problem_text('foreign_section'))
+                
+                table.setItem(i, 0, QTableWidgetItem(row['date']))
+                table.setItem(i, 1, QTableWidgetItem(str(row['tab_number'])))
+                table.setItem(i, 2, QTableWidgetItem(row['full_name']))
+                table.setItem(i, 3, QTableWidgetItem(row['section_name']))
+                table.setItem(i, 4, QTableWidgetItem(f"{row['hours']:g}"))
+                table.setItem(i, 5, QTableWidgetItem(f"{row['week_hours']:g}"))
+                table.setItem(i, 6, QTableWidgetItem('; '.join(found)))
+            table.resizeColumnsToContents()
+            info_label.setText(f'Записей с нарушениями: {len(rows)} | Работников: {len(set(r["tab_number"] for r in rows))}')
+        
+        month_edit.dateChanged.connect(load_audit)
+        load_audit()
+        
+        btn_box = QDialogButtonBox(QDialogButtonBox.Close)
+        btn_box.rejected.connect(dialog.reject)
+        layout.addWidget(btn_box)
+        dialog.exec_()
+    
+    @profiled
     def delete_timesheet(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -321,6 +638,10 @@ class TimesheetManager(QDialog):
         shift = int(self.table.item(selected_row, 1).text())
         worker_name = self.table.item(selected_row, 4).text()
         
+        if get_archive_manager().is_archived_date(date):
+            QMessageBox.warning(self, 'Предупреждение', 'Запись относится к архивному году и не удаляется')
+            return
+        
         reply = QMessageBox.question(
             self, 'Подтверждение удаления',
             f'Удалить запись учета времени для {worker_name} от {date} (смена {shift})?',
@@ -0,0 +1,108 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import Qt, QDate
+from database.kpi import KpiEngine
+from database.profiler import profiled
+
+# Столбцы таблицы: ключ строки показателей, заголовок, формат
+COLUMNS = [
+    ('volume', 'Добыча, т', '{:,.1f}'),
+    ('rock_volume', 'Порода, т', '{:,.1f}'),
+    ('man_hours', 'Чел.-часов', '{:,.1f}'),
+    ('tons_per_man_hour', 'Т на чел.-час', '{:.2f}'),
+    ('kwh_per_ton', 'кВт·ч на т', '{:.2f}'),
+    ('fuel_per_ton', 'Топливо, л на т', '{:.3f}'),
+    ('stripping_ratio', 'Коэф. вскрыши', '{:.3f}'),
+    ('cost_per_ton', 'Энергия, руб на т', '{:,.2f}'),
+]
+
+class KpiWidget(QWidget):
+    """Вкладка показателей производительности по участкам и периодам"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.engine = KpiEngine()
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Период и группировка
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel('С:'))
+        self.date_from = QDateEdit()
+        self.date_from.setCalendarPopup(True)
+        self.date_from.setDate(QDate(QDate.currentDate().year(), 1, 1))
+        filter_layout.addWidget(self.date_from)
+
+        filter_layout.addWidget(QLabel('По:'))
+        self.date_to = QDateEdit()
+        self.date_to.setCalendarPopup(True)
+        self.date_to.setDate(QDate.currentDate())
+        filter_layout.addWidget(self.date_to)
+
+        self.period_combo = QComboBox()
+        self.period_combo.addItem('По месяцам', 'month')
+        self.period_combo.addItem('По дням', 'day')
+        self.period_combo.addItem('По годам', 'year')
+        self.period_combo.addItem('За весь период', None)
+        filter_layout.addWidget(self.period_combo)
+
+        self.section_check = QCheckBox('По участкам')
+        filter_layout.addWidget(self.section_check)
+
+        refresh_btn = QPushButton('Показать')
+        refresh_btn.clicked.connect(self.load_data)
+        filter_layout.addWidget(refresh_btn)
+
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.totals_label = QLabel('')
+        layout.addWidget(self.totals_label)
+
+    @profiled
+    def load_data(self):
+        try:
+            date_from = self.date_from.date().toString('yyyy-MM-dd')
+            date_to = self.date_to.date().toString('yyyy-MM-dd')
+            period = self.period_combo.currentData()
+            by_section = self.section_check.isChecked()
+
+            rows = self.engine.query(date_from, date_to, period, by_section)
+
+            keys = []
+            if period:
+                keys.append(('period', 'Период'))
+            if by_section:
+                keys.append(('section_name', 'Участок'))
+
+            self.table.setColumnCount(len(keys) + len(COLUMNS))
+            self.table.setHorizontalHeaderLabels([title for _, title in keys] + [title for _, title, _ in COLUMNS])
+            self.table.setRowCount(len(rows))
+
+            for i, row in enumerate(rows):
+                for j, (key, _) in enumerate(keys):
+                    self.table.setItem(i, j, QTableWidgetItem(str(row[key])))
+                for j, (key, _, fmt) in enumerate(COLUMNS):
+                    value = row[key]
+                    item = QTableWidgetItem(fmt.format(value) if value is not None else '-')
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.table.setItem(i, len(keys) + j, item)
+
+            self.table.resizeColumnsToContents()
+
+            totals = self.engine.totals(date_from, date_to)
+            if totals:
+                self.totals_label.setText(
+                    f'За период: {totals["tons_per_man_hour"] or 0:.2f} т на чел.-час | '
+                    f'{totals["kwh_per_ton"] or 0:.2f} кВт·ч на т | '
+                    f'{totals["fuel_per_ton"] or 0:.3f} л топлива на т | '
+                    f'вскрыша {totals["stripping_ratio"] or 0:.3f}'
+                )
+
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка расчета показателей: {str(e)}')
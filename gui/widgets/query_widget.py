@@ -0,0 +1,420 @@
+import sqlite3
+import threading
+import time
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QKeySequence
+from config import Config
+from database.db_connection import DatabaseConnection, open_connection, open_readonly
+from database.profiler import get_slow_log
+from database.query_advisor import QueryAdvisor, plan_text
+
+def cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return f'<двоичные данные, {len(value)} байт>'
+    return str(value)
+
+class QueryWorker(QThread):
+    """Выполнение запроса консоли в отдельном потоке
+
+    Строки передаются порциями по мере чтения. Дойдя до предела строк,
+    поток закрывает курсор и ждет команды more() или отмены. Отмена и ограничение времени
+    работают через обработчик прогресса SQLite: запрос прерывается на
+    ближайшем шаге, а не после завершения.
+    """
+
+    columns = pyqtSignal(list)
+    page = pyqtSignal(list)
+    paused = pyqtSignal(int)
+    done = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, query, writable=False, page_size=None, row_cap=None, timeout=None, parent=None):
+        super().__init__(parent)
+        self.query = query
+        self.writable = writable
+        self.page_size = page_size or Config.QUERY_PAGE_SIZE
+        self.row_cap = row_cap or Config.QUERY_ROW_CAP
+        self.timeout = Config.QUERY_TIMEOUT if timeout is None else timeout
+        self.cancelled = False
+        self.timed_out = False
+        self.resume = threading.Event()
+        self.elapsed = 0.0
+
+    def cancel(self):
+        self.cancelled = True
+        self.resume.set()
+
+    def more(self):
+        self.resume.set()
+
+    def _progress(self):
+        """Обработчик прогресса SQLite: ненулевой ответ прерывает запрос"""
+        if self.cancelled:
+            return 1
+        if self.timeout and time.perf_counter() - self.started > self.timeout:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def run(self):
+        self.started = time.perf_counter()
+        try:
+            if DatabaseConnection().remote:
+                result = self._run_remote()
+            else:
+                result = self._run_local()
+        except sqlite3.Error as e:
+            if self.timed_out:
+                self.failed.emit(f'Запрос прерван: время выполнения больше {self.timeout} с')
+            elif self.cancelled:
+                self.failed.emit('Запрос отменен')
+            elif 'readonly' in str(e) or 'query_only' in str(e):
+                self.failed.emit('Консоль открыта только для чтения. Чтобы изменить данные, '
+                                 'включите «Разрешить изменение данных»')
+            else:
+                self.failed.emit(str(e))
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if self.cancelled:
+            self.failed.emit('Запрос отменен')
+            return
+        result['elapsed'] = self.elapsed + time.perf_counter() - self.started
+        self.done.emit(result)
+
+    def _run_local(self):
+        if self.writable:
+            conn = open_connection('writer')
+        else:
+            conn = open_readonly()
+        try:
+            conn.set_progress_handler(self._progress, Config.QUERY_PROGRESS_STEPS)
+            cursor = conn.execute(self.query)
+            if cursor.description is None:
+                conn.commit()
+                return {'rows': 0, 'changed': cursor.rowcount, 'truncated': False}
+            self.columns.emit([column[0] for column in cursor.description])
+
+            total = 0
+            limit = self.row_cap
+            while not self.cancelled:
+                size = min(self.page_size, limit - total)
+                rows = cursor.fetchmany(size)
+                if rows:
+                    total += len(rows)
+                    self.page.emit([tuple(row) for row in rows])
+                if len(rows) < size:
+                    break
+                if total >= limit:
+                    if cursor.fetchone() is None:
+                        break
+                    limit += self.row_cap
+                    if self.writable:
+                        # Изменение с RETURNING не держит блокировку записи в ожидании
+                        conn.commit()
+                        return {'rows': total, 'changed': None, 'truncated': True}
+                    # Открытый курсор держит блокировку SHARED и не дает другим
+                    # соединениям сохранять данные: на время ожидания он
+                    # закрывается, продолжение читается повторным запросом
+                    cursor.close()
+                    # Время ожидания пользователя в ограничение времени не входит
+                    self.elapsed += time.perf_counter() - self.started
+                    self.resume.clear()
+                    self.paused.emit(total)
+                    self.resume.wait()
+                    if self.cancelled:
+                        break
+                    self.started = time.perf_counter()
+                    cursor = self._skip(conn.execute(self.query), total)
+            if self.cancelled:
+                conn.rollback()
+                return {'rows': total, 'changed': None, 'truncated': True}
+            conn.commit()
+            return {'rows': total, 'changed': None, 'truncated': False}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _skip(self, cursor, count):
+        """Курсор после пропуска count первых строк"""
+        while count > 0:
+            rows = cursor.fetchmany(min(count, self.page_size))
+            if not rows:
+                break
+            count -= len(rows)
+        return cursor
+
+    def _run_remote(self):
+        """Через сервер: читающие запросы идут в соединения query_only, отмена
+        только прекращает ожидание ответа"""
+        from database.remote import RemoteDatabaseConnection
+
+        client = RemoteDatabaseConnection.detached()
+        try:
+            if self.writable and not self.query.lstrip().upper().startswith(('SELECT', 'WITH', 'EXPLAIN', 'PRAGMA')):
+                cursor = client.execute_query(self.query)
+                return {'rows': 0, 'changed': cursor.rowcount, 'truncated': False}
+            rows = client.fetch_rows(self.query, max_rows=self.row_cap + 1)
+            if self.cancelled:
+                return {'rows': 0, 'changed': None, 'truncated': True}
+            truncated = len(rows) > self.row_cap
+            rows = rows[:self.row_cap]
+            if rows:
+                self.columns.emit(list(rows[0]))
+                for start in range(0, len(rows), self.page_size):
+                    self.page.emit([tuple(row.values()) for row in rows[start:start + self.page_size]])
+            return {'rows': len(rows), 'changed': None, 'truncated': truncated}
+        finally:
+            client.close()
+
+class QueryWidget(QWidget):
+    """Консоль SQL: запрос в фоне с отменой, вывод порциями, план запроса"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.worker = None
+        self.explain = False
+        self.plan_rows = []
+        self.query = ''
+        self.clock = QTimer(self)
+        self.clock.timeout.connect(self.update_clock)
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel('Введите SQL запрос (Ctrl+Enter - выполнить):'))
+        self.query_edit = QPlainTextEdit()
+        self.query_edit.setPlaceholderText('SELECT * FROM workers WHERE section_id = 1')
+        self.query_edit.setFont(QFont('Courier New', 10))
+        self.query_edit.setMaximumHeight(160)
+        layout.addWidget(self.query_edit)
+
+        btn_layout = QHBoxLayout()
+        self.execute_btn = QPushButton('Выполнить запрос')
+        self.execute_btn.clicked.connect(self.execute_query)
+        btn_layout.addWidget(self.execute_btn)
+
+        self.explain_btn = QPushButton('План запроса')
+        self.explain_btn.clicked.connect(self.explain_query)
+        btn_layout.addWidget(self.explain_btn)
+
+        self.cancel_btn = QPushButton('Отменить')
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_query)
+        btn_layout.addWidget(self.cancel_btn)
+
+        self.more_btn = QPushButton(f'Еще {Config.QUERY_ROW_CAP} строк')
+        self.more_btn.setVisible(False)
+        self.more_btn.clicked.connect(self.fetch_more)
+        btn_layout.addWidget(self.more_btn)
+
+        clear_btn = QPushButton('Очистить')
+        clear_btn.clicked.connect(self.clear_query)
+        btn_layout.addWidget(clear_btn)
+
+        btn_layout.addStretch()
+        self.writable_check = QCheckBox('Разрешить изменение данных')
+        self.writable_check.setEnabled(Config.QUERY_CONSOLE_WRITABLE)
+        if not Config.QUERY_CONSOLE_WRITABLE:
+            self.writable_check.setToolTip('Изменение данных из консоли отключено в настройках')
+        btn_layout.addWidget(self.writable_check)
+        layout.addLayout(btn_layout)
+
+        shortcut = QShortcut(QKeySequence('Ctrl+Return'), self)
+        shortcut.activated.connect(self.execute_query)
+
+        self.result_table = QTableWidget()
+        self.result_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.result_table)
+
+        self.status_label = QLabel('Консоль открыта только для чтения')
+        layout.addWidget(self.status_label)
+
+    def start(self, query, writable, explain=False):
+        self.stop()
+        self.query = query
+        self.explain = explain
+        self.plan_rows = []
+        self.result_table.setRowCount(0)
+        self.result_table.setColumnCount(0)
+        self.more_btn.setVisible(False)
+
+        self.worker = QueryWorker(query, writable, parent=self)
+        self.worker.columns.connect(self.set_columns)
+        self.worker.page.connect(self.add_rows)
+        self.worker.paused.connect(self.on_paused)
+        self.worker.done.connect(self.on_done)
+        self.worker.failed.connect(self.on_failed)
+        self.worker.finished.connect(self.on_finished)
+
+        self.execute_btn.setEnabled(False)
+        self.explain_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.started = time.perf_counter()
+        self.clock.start(100)
+        self.update_clock()
+        self.worker.start()
+
+    def execute_query(self):
+        query = self.query_edit.toPlainText().strip()
+        if not query:
+            QMessageBox.warning(self, 'Предупреждение', 'Введите SQL запрос')
+            return
+        writable = self.writable_check.isChecked()
+        if writable:
+            reply = QMessageBox.question(
+                self, 'Подтверждение',
+                'Запрос будет выполнен с правом изменения данных. Продолжить?',
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        self.start(query, writable)
+
+    def explain_query(self):
+        query = self.query_edit.toPlainText().strip().rstrip(';')
+        if not query:
+            QMessageBox.warning(self, 'Предупреждение', 'Введите SQL запрос')
+            return
+        self.start(f'EXPLAIN QUERY PLAN {query}', False, explain=True)
+        self.query = query
+
+    def cancel_query(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.status_label.setText('Отмена запроса...')
+
+    def fetch_more(self):
+        if self.worker is not None:
+            self.more_btn.setVisible(False)
+            self.cancel_btn.setEnabled(True)
+            self.started = time.perf_counter() - self.worker.elapsed
+            self.clock.start(100)
+            self.worker.more()
+
+    def stop(self):
+        """Отмена выполняющегося запроса и ожидание потока"""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+            self.worker = None
+        self.clock.stop()
+
+    def clear_query(self):
+        self.stop()
+        self.query_edit.clear()
+        self.result_table.setRowCount(0)
+        self.result_table.setColumnCount(0)
+        self.more_btn.setVisible(False)
+        self.status_label.setText('')
+
+    def update_clock(self):
+        rows = self.result_table.rowCount()
+        self.status_label.setText(f'Выполняется... {time.perf_counter() - self.started:.1f} с, строк {rows}')
+
+    # Сигналы потока, отмененного ради нового запроса, пропускаются
+
+    def set_columns(self, names):
+        if self.sender() is not self.worker or self.explain:
+            return
+        self.result_table.setColumnCount(len(names))
+        self.result_table.setHorizontalHeaderLabels(names)
+
+    def add_rows(self, rows):
+        if self.sender() is not self.worker:
+            return
+        if self.explain:
+            columns = ('id', 'parent', 'notused', 'detail')
+            self.plan_rows.extend(dict(zip(columns, row)) for row in rows)
+            return
+        table = self.result_table
+        first = table.rowCount()
+        table.setRowCount(first + len(rows))
+        for i, row in enumerate(rows, first):
+            for j, value in enumerate(row):
+                item = QTableWidgetItem(cell_text(value))
+                if isinstance(value, (int, float)):
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(i, j, item)
+        if first == 0:
+            table.resizeColumnsToContents()
+
+    def on_paused(self, total):
+        if self.sender() is not self.worker:
+            return
+        self.clock.stop()
+        self.more_btn.setVisible(True)
+        self.status_label.setText(f'Показаны первые {total} строк за {self.worker.elapsed * 1000:.0f} мс. '
+                                  f'Запрос ждет: «{self.more_btn.text()}» или «Отменить»')
+
+    def on_done(self, result):
+        if self.sender() is not self.worker:
+            return
+        self.clock.stop()
+        elapsed = f'{result["elapsed"] * 1000:.0f} мс'
+        if self.explain:
+            lines = plan_text(self.plan_rows) + self.advice_lines()
+            self.result_table.setColumnCount(1)
+            self.result_table.setHorizontalHeaderLabels(['План запроса'])
+            self.result_table.setRowCount(len(lines))
+            for i, line in enumerate(lines):
+                self.result_table.setItem(i, 0, QTableWidgetItem(line))
+            self.result_table.resizeColumnsToContents()
+            self.status_label.setText(f'План запроса получен за {elapsed}')
+            return
+
+        if result['elapsed'] * 1000 >= Config.SLOW_QUERY_MS:
+            # Долгие запросы консоли попадают в журнал для советов по индексам
+            get_slow_log().record(self.query, None, result['elapsed'])
+        if result['changed'] is not None:
+            changed = result['changed'] if result['changed'] >= 0 else 0
+            self.status_label.setText(f'Запрос выполнен за {elapsed}. Изменено строк: {changed}')
+        elif result['truncated']:
+            self.status_label.setText(f'Показано {result["rows"]} строк за {elapsed}; '
+                                      f'остальные строки не загружены')
+        else:
+            self.status_label.setText(f'Запрос выполнен за {elapsed}. Найдено {result["rows"]} строк')
+
+    def advice_lines(self):
+        """Полные просмотры больших таблиц и предлагаемые индексы для плана"""
+        try:
+            advice = QueryAdvisor().advise(self.query)
+        except Exception as e:
+            return ['', f'Советы по индексам недоступны: {e}']
+        lines = []
+        for scan in advice['scans']:
+            lines += ['', f'Полный просмотр таблицы {scan["table"]}: {scan["detail"]}']
+        for suggestion in advice['suggestions']:
+            if suggestion['exists']:
+                lines.append(f'Индекс по ({", ".join(suggestion["columns"])}) уже есть, но не используется: '
+                             f'обновите статистику (Сервис → Обслуживание, ANALYZE)')
+            elif suggestion['verified']:
+                lines.append(f'Предлагается индекс (проверен на копии схемы): {suggestion["sql"]}')
+            else:
+                lines.append(f'Возможный индекс (планировщик его не выбрал): {suggestion["sql"]}')
+        if advice['scans'] and not advice['suggestions']:
+            lines.append('Условий, по которым помог бы индекс, в запросе нет')
+        return lines
+
+    def on_failed(self, message):
+        if self.sender() is not self.worker:
+            return
+        self.clock.stop()
+        self.status_label.setText(message)
+        if message != 'Запрос отменен':
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка выполнения запроса:\n{message}')
+
+    def on_finished(self):
+        if self.sender() is not self.worker:
+            return
+        self.execute_btn.setEnabled(True)
+        self.explain_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.more_btn.setVisible(False)
@@ -2,12 +2,16 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QDate
 from PyQt5.QtGui import QDoubleValidator, QIntValidator
 from database.db_connection import DatabaseConnection
+from database.models import Worker
+from database.repositories import WorkerRepository, SectionRepository, PositionRepository
+from database.profiler import profiled
 from datetime import datetime
 
 class WorkerManager(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.db = DatabaseConnection()
+        self.workers = WorkerRepository(self.db)
         self.current_tab_number = None
         self.init_ui()
         self.load_data()
@@ -67,52 +71,30 @@ class WorkerManager(QDialog):
     
     def load_sections_filter(self):
         try:
-            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
-            sections = self.db.fetch_all(query)
-            
-            for section in sections:
-                self.filter_combo.addItem(section['section_name'], section['section_id'])
+            for section_id, section_name in SectionRepository(self.db).choices():
+                self.filter_combo.addItem(section_name, section_id)
         except Exception as e:
             print(f"Ошибка загрузки участков: {e}")
     
+    @profiled
     def load_data(self):
         try:
             section_id = self.filter_combo.currentData()
             
-            if section_id:
-                query = """
-                SELECT w.*, s.section_name, p.position_name
-                FROM workers w
-                JOIN sections s ON w.section_id = s.section_id
-                JOIN positions p ON w.position_id = p.position_id
-                WHERE w.section_id = ?
-                ORDER BY w.full_name
-                """
-                params = (section_id,)
-            else:
-                query = """
-                SELECT w.*, s.section_name, p.position_name
-                FROM workers w
-                JOIN sections s ON w.section_id = s.section_id
-                JOIN positions p ON w.position_id = p.position_id
-                ORDER BY w.full_name
-                """
-                params = None
-            
-            results = self.db.fetch_all(query, params)
+            results = self.workers.listing(section_id)
             
             self.table.setRowCount(len(results))
             
-            for i, row in enumerate(results):
-                self.table.setItem(i, 0, QTableWidgetItem(str(row['tab_number'])))
-                self.table.setItem(i, 1, QTableWidgetItem(row['full_name']))
-                self.table.setItem(i, 2, QTableWidgetItem(row['section_name']))
-                self.table.setItem(i, 3, QTableWidgetItem(row['position_name']))
-                self.table.setItem(i, 4, QTableWidgetItem(row['iin']))
-                self.table.setItem(i, 5, QTableWidgetItem(row['phone'] if row['phone'] else ''))
-                self.table.setItem(i, 6, QTableWidgetItem(row['gender']))
-                self.table.setItem(i, 7, QTableWidgetItem(row['birth_date'] if row['birth_date'] else ''))
-                self.table.setItem(i, 8, QTableWidgetItem(row['address'] if row['address'] else ''))
+            for i, worker in enumerate(results):
+                self.table.setItem(i, 0, QTableWidgetItem(str(worker.tab_number)))
+                self.table.setItem(i, 1, QTableWidgetItem(worker.full_name))
+                self.table.setItem(i, 2, QTableWidgetItem(worker.section_name))
+                self.table.setItem(i, 3, QTableWidgetItem(worker.position_name))
+                self.table.setItem(i, 4, QTableWidgetItem(worker.iin))
+                self.table.setItem(i, 5, QTableWidgetItem(worker.phone if worker.phone else ''))
+                self.table.setItem(i, 6, QTableWidgetItem(worker.gender))
+                self.table.setItem(i, 7, QTableWidgetItem(worker.birth_date if worker.birth_date else ''))
+                self.table.setItem(i, 8, QTableWidgetItem(worker.address if worker.address else ''))
             
             self.table.resizeColumnsToContents()
             self.status_label.setText(f'Загружено работников: {len(results)}')
@@ -170,55 +152,47 @@ class WorkerManager(QDialog):
         
         # Загружаем списки участков и должностей
         try:
-            query = "SELECT section_id, section_name FROM sections ORDER BY section_name"
-            sections = self.db.fetch_all(query)
-            for section in sections:
-                section_combo.addItem(section['section_name'], section['section_id'])
+            for section_id, section_name in SectionRepository(self.db).choices():
+                section_combo.addItem(section_name, section_id)
             
-            query = "SELECT position_id, position_name FROM positions ORDER BY position_name"
-            positions = self.db.fetch_all(query)
-            for position in positions:
-                position_combo.addItem(position['position_name'], position['position_id'])
+            for position_id, position_name in PositionRepository(self.db).choices():
+                position_combo.addItem(position_name, position_id)
         except Exception as e:
             print(f"Ошибка загрузки списков: {e}")
         
         # Загружаем данные для редактирования
         if self.current_tab_number:
-            query = """
-            SELECT * FROM workers 
-            WHERE tab_number = ?
-            """
-            worker_data = self.db.fetch_one(query, (self.current_tab_number,))
+            worker = self.workers.get(self.current_tab_number)
             
-            if worker_data:
-                name_edit.setText(worker_data['full_name'])
+            if worker:
+                name_edit.setText(worker.full_name)
                 
                 # Устанавливаем участок
                 for i in range(section_combo.count()):
-                    if section_combo.itemData(i) == worker_data['section_id']:
+                    if section_combo.itemData(i) == worker.section_id:
                         section_combo.setCurrentIndex(i)
                         break
                 
                 # Устанавливаем должность
                 for i in range(position_combo.count()):
-                    if position_combo.itemData(i) == worker_data['position_id']:
+                    if position_combo.itemData(i) == worker.position_id:
                         position_combo.setCurrentIndex(i)
                         break
                 
-                iin_edit.setText(worker_data['iin'])
-                address_edit.setText(worker_data['address'] if worker_data['address'] else '')
-                phone_edit.setText(worker_data['phone'] if worker_data['phone'] else '')
+                iin_edit.setText(worker.iin)
+                address_edit.setText(worker.address if worker.address else '')
+                phone_edit.setText(worker.phone if worker.phone else '')
                 
                 # Пол
-                if worker_data['gender'] == 'М':
+                if worker.gender == 'М':
                     gender_combo.setCurrentIndex(0)
                 else:
                     gender_combo.setCurrentIndex(1)
                 
                 # Дата рождения
-                if worker_data['birth_date']:
+                if worker.birth_date:
                     try:
-                        birth_date = datetime.strptime(worker_data['birth_date'], '%Y-%m-%d')
+                        birth_date = datetime.strptime(worker.birth_date, '%Y-%m-%d')
                         birth_date_edit.setDate(QDate(birth_date.year, birth_date.month, birth_date.day))
                     except:
                         pass
@@ -247,6 +221,7 @@ class WorkerManager(QDialog):
         layout.addRow(btn_box)
         dialog.exec_()
     
+    @profiled
     def save_worker(self, dialog, tab_number, name, section_id, position_id, 
                    iin, address, phone, gender, birth_date):
         # Валидация
@@ -263,43 +238,36 @@ class WorkerManager(QDialog):
             return
         
         try:
-            tab_num = int(tab_number)
+            worker = Worker(
+                tab_number=int(tab_number),
+                full_name=name,
+                section_id=section_id,
+                position_id=position_id,
+                iin=iin,
+                address=address,
+                phone=phone,
+                gender=gender,
+                birth_date=birth_date if birth_date != '2000-01-01' else None,
+            )
             
             if self.current_tab_number:
                 # Обновление существующего работника
-                query = """
-                UPDATE workers SET 
-                    full_name = ?,
-                    section_id = ?,
-                    position_id = ?,
-                    iin = ?,
-                    address = ?,
-                    phone = ?,
-                    gender = ?,
-                    birth_date = ?
-                WHERE tab_number = ?
-                """
-                params = (name, section_id, position_id, iin, 
-                         address, phone, gender, birth_date if birth_date != '2000-01-01' else None, 
-                         tab_num)
+                if not self.workers.update(worker):
+                    QMessageBox.warning(dialog, 'Ошибка', 'Запись не найдена. Возможно, она была удалена')
+                    dialog.reject()
+                    self.load_data()
+                    return
             else:
                 # Добавление нового работника
-                query = """
-                INSERT INTO workers 
-                (tab_number, full_name, section_id, position_id, iin, 
-                 address, phone, gender, birth_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                params = (tab_num, name, section_id, position_id, iin,
-                         address, phone, gender, birth_date if birth_date != '2000-01-01' else None)
+                self.workers.insert(worker)
             
-            self.db.execute_query(query, params)
             dialog.accept()
             self.load_data()
             
         except Exception as e:
             QMessageBox.critical(dialog, 'Ошибка', f'Ошибка сохранения: {str(e)}')
     
+    @profiled
     def delete_worker(self):
         selected_row = self.table.currentRow()
         if selected_row < 0:
@@ -318,8 +286,7 @@ class WorkerManager(QDialog):
         
         if reply == QMessageBox.Yes:
             try:
-                query = "DELETE FROM workers WHERE tab_number = ?"
-                self.db.execute_query(query, (tab_number,))
+                self.workers.delete(tab_number)
                 self.load_data()
                 self.status_label.setText(f'Работник {full_name} удален')
             except Exception as e:
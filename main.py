@@ -7,6 +7,13 @@ from database.db_connection import DatabaseConnection
 def init_database():
     db = DatabaseConnection()
     
+    # Схемой базы управляет сервер
+    if db.remote:
+        if db.connect() is None:
+            QMessageBox.critical(None, 'Ошибка', 'Сервер базы данных недоступен')
+            sys.exit(1)
+        return False
+    
     if not db.table_exists('positions'):
         QMessageBox.information(
             None, 'Инициализация базы данных',
@@ -15,6 +22,9 @@ def init_database():
         from create_database import create_tables
         create_tables()
         return True
+    
+    from create_database import upgrade_database
+    upgrade_database(db)
     return False
 
 def main():
@@ -0,0 +1,2 @@
+# HTTP API для работы нескольких рабочих мест с одной базой
+from .app import ApiServer, serve
@@ -0,0 +1,386 @@
+import asyncio
+import hmac
+import ipaddress
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl, unquote
+from database.db_connection import open_connection, constraint_message
+from database.writer import WriteQueue
+from database.change_log import TRACKED_TABLES
+from database.archive import ARCHIVED_TABLES, ConnectionArchive
+from database.reports import REPORTS, report_query
+from database import kpi
+
+# Сущности API и их ключевые столбцы
+ENTITIES = TRACKED_TABLES
+
+# Ограничения запроса
+MAX_BODY = 10 * 1024 * 1024
+DEFAULT_LIMIT = 1000
+IDLE_TIMEOUT = 60
+
+# Действия SQLite, разрешенные запросам клиентов: чтение и изменение строк.
+# ATTACH, PRAGMA, изменение схемы и управление транзакциями запрещены
+CLIENT_ACTIONS = frozenset((
+    sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE,
+    sqlite3.SQLITE_DELETE, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE,
+))
+
+def client_authorizer(action, *args):
+    """Проверка запроса клиента при компиляции, вместе с телами триггеров"""
+    return sqlite3.SQLITE_OK if action in CLIENT_ACTIONS else sqlite3.SQLITE_DENY
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ApiServer:
+    """HTTP/JSON сервер над рабочей базой
+
+    Все изменения идут через очередь записи с групповой фиксацией,
+    чтение идет параллельно через пул соединений только для чтения.
+    """
+
+    def __init__(self, host=None, port=None, token=None, readers=None):
+        from config import Config
+        self.host = host or Config.API_HOST
+        self.port = port or Config.API_PORT
+        self.token = Config.API_TOKEN if token is None else token
+        if not self.token and not is_loopback(self.host):
+            raise ValueError(f'Для адреса {self.host} нужен токен доступа (MINE_API_TOKEN): '
+                             'без него сервер доступен только с этого компьютера')
+        self.write_queue = WriteQueue()
+        self.reader_pool = ThreadPoolExecutor(max_workers=readers or Config.API_READERS,
+                                              thread_name_prefix='mine-reader')
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.columns = {}
+        self.server = None
+        self.max_variables = 999
+
+    # Соединения для чтения: у каждого потока пула свое
+
+    def _reader(self):
+        conn = getattr(self.local, 'reader', None)
+        if conn is None:
+            # Соединения закрывает close() из основного потока
+            conn = open_connection('reader', check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self.local.reader = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _archive(self):
+        # Архивы подключаются к соединению потока, в котором идет чтение
+        archive = getattr(self.local, 'archive', None)
+        if archive is None:
+            archive = self.local.archive = ConnectionArchive(self._reader())
+        return archive
+
+    def _read(self, query, params=(), max_rows=None, restricted=False):
+        conn = self._reader()
+        self._archive().attach_referenced([query])
+        # Смена проверки заново компилирует запросы соединения, поэтому
+        # служебный запрос из кэша не обходит ее
+        if restricted:
+            conn.set_authorizer(client_authorizer)
+        try:
+            cursor = conn.execute(query, params)
+            try:
+                rows = cursor.fetchmany(max_rows) if max_rows else cursor.fetchall()
+                return [dict(row) for row in rows]
+            finally:
+                cursor.close()
+        finally:
+            if restricted:
+                conn.set_authorizer(None)
+
+    def _report(self, name):
+        title, query = report_query(name, self._archive().source)
+        return {'title': title, 'rows': self._read(query)}
+
+    async def report(self, name):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reader_pool, self._report, name)
+
+    async def read(self, query, params=(), max_rows=None, restricted=False):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reader_pool, self._read, query, params, max_rows, restricted)
+
+    async def write(self, statements, user=None, restricted=False):
+        authorizer = client_authorizer if restricted else None
+        return await asyncio.wrap_future(self.write_queue.submit(statements, user, authorizer))
+
+    async def kpi_rows(self, args):
+        """Показатели производительности: срез догоняется через очередь записи"""
+        state = (await self.read(kpi.STATE_SQL))[0]
+        if kpi.needs_rebuild(state) or state['last_seq'] != (state['current'] or 0):
+            statements = kpi.refresh_statements(kpi.needs_rebuild(state))
+            await self.write([(statement, ()) for statement in statements])
+        try:
+            query, params = kpi.query_sql(
+                args.get('date_from', '0000-01-01'), args.get('date_to', '9999-12-31'),
+                args.get('period'), args.get('by') == 'section'
+            )
+        except ValueError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(e))
+        return [kpi.add_ratios(row) for row in await self.read(query, params)]
+
+    # Запросы к сущностям
+
+    def _entity(self, name):
+        if name not in ENTITIES:
+            raise ApiError(HTTPStatus.NOT_FOUND, f'Неизвестная сущность: {name}')
+        return ENTITIES[name]
+
+    def _key_condition(self, entity, key_values):
+        key = self._entity(entity)
+        if len(key_values) != len(key):
+            raise ApiError(HTTPStatus.NOT_FOUND, f'Ключ {entity}: {", ".join(key)}')
+        return ' AND '.join(f'{column} = ?' for column in key), list(key_values)
+
+    def _data_columns(self, entity, data):
+        if not isinstance(data, dict) or not data:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Ожидается объект с полями записи')
+        unknown = [column for column in data if column not in self.columns[entity]]
+        if unknown:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f'Неизвестные поля {entity}: {", ".join(unknown)}')
+        return list(data)
+
+    def entity_statement(self, item):
+        """Запрос для операции над сущностью: insert, update или delete"""
+        entity, op = item.get('entity'), item.get('op')
+        self._entity(entity)
+        if op == 'insert':
+            columns = self._data_columns(entity, item.get('data'))
+            query = (f"INSERT INTO {entity} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(['?'] * len(columns))}) RETURNING *")
+            return query, [item['data'][column] for column in columns]
+        if op == 'update':
+            columns = self._data_columns(entity, item.get('data'))
+            condition, key_params = self._key_condition(entity, item.get('key') or [])
+            query = (f"UPDATE {entity} SET {', '.join(f'{column} = ?' for column in columns)} "
+                     f"WHERE {condition} RETURNING *")
+            return query, [item['data'][column] for column in columns] + key_params
+        if op == 'delete':
+            condition, key_params = self._key_condition(entity, item.get('key') or [])
+            return f"DELETE FROM {entity} WHERE {condition} RETURNING *", key_params
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'Неизвестная операция: {op}')
+
+    def _statement(self, item):
+        if not isinstance(item, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Ожидается объект запроса')
+        if 'entity' in item:
+            return self.entity_statement(item)
+        if not isinstance(item.get('sql'), str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Не указан текст запроса sql')
+        return item['sql'], item.get('params') or []
+
+    async def list_entity(self, entity, args):
+        key = self._entity(entity)
+        conditions, params = [], []
+        date_column = ARCHIVED_TABLES.get(entity)
+        if date_column and 'date_from' in args:
+            conditions.append(f'{date_column} >= ?')
+            params.append(args['date_from'])
+        if date_column and 'date_to' in args:
+            conditions.append(f'{date_column} <= ?')
+            params.append(args['date_to'])
+        for column, value in args.items():
+            if column in self.columns[entity]:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = f'{date_column} DESC' if date_column else ', '.join(key)
+        try:
+            limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'limit должен быть числом')
+        query = f"SELECT * FROM {entity} {where} ORDER BY {order} LIMIT ?"
+        return await self.read(query, params + [limit])
+
+    # Маршрутизация
+
+    async def route(self, method, path, args, body, user):
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if not parts or parts[0] != 'api' or len(parts) < 2:
+            raise ApiError(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+        resource, rest = parts[1], parts[2:]
+
+        if resource == 'health' and method == 'GET':
+            return HTTPStatus.OK, {
+                'status': 'ok',
+                'entities': list(ENTITIES),
+                'reports': list(REPORTS),
+                'max_variables': self.max_variables,
+            }
+
+        if resource == 'query' and method == 'POST':
+            query, params = self._statement(body)
+            rows = await self.read(query, params, body.get('max_rows'), restricted=True)
+            return HTTPStatus.OK, {'rows': rows}
+
+        if resource == 'execute' and method == 'POST':
+            results = await self.write([self._statement(body)], user, restricted=True)
+            return HTTPStatus.OK, results[0]
+
+        if resource == 'batch' and method == 'POST':
+            items = body.get('statements') if isinstance(body, dict) else None
+            if not isinstance(items, list):
+                raise ApiError(HTTPStatus.BAD_REQUEST, 'Ожидается список statements')
+            results = await self.write([self._statement(item) for item in items], user, restricted=True)
+            return HTTPStatus.OK, {'results': results}
+
+        if resource == 'reports' and method == 'GET':
+            if not rest:
+                return HTTPStatus.OK, {name: title for name, (title, _) in REPORTS.items()}
+            if rest[0] not in REPORTS:
+                raise ApiError(HTTPStatus.NOT_FOUND, f'Неизвестный отчет: {rest[0]}')
+            return HTTPStatus.OK, await self.report(rest[0])
+
+        if resource == 'kpi' and method == 'GET':
+            return HTTPStatus.OK, {'rows': await self.kpi_rows(args)}
+
+        if resource in ENTITIES:
+            if method == 'GET' and not rest:
+                return HTTPStatus.OK, {'rows': await self.list_entity(resource, args)}
+            if method == 'GET':
+                condition, params = self._key_condition(resource, rest)
+                rows = await self.read(f"SELECT * FROM {resource} WHERE {condition}", params)
+                if not rows:
+                    raise ApiError(HTTPStatus.NOT_FOUND, 'Запись не найдена')
+                return HTTPStatus.OK, rows[0]
+
+            operations = {'POST': 'insert', 'PUT': 'update', 'DELETE': 'delete'}
+            if method in operations and (method == 'POST') == (not rest):
+                item = {'entity': resource, 'op': operations[method], 'key': rest, 'data': body}
+                result = (await self.write([self.entity_statement(item)], user))[0]
+                if not result['rows']:
+                    raise ApiError(HTTPStatus.NOT_FOUND, 'Запись не найдена')
+                status = HTTPStatus.CREATED if method == 'POST' else HTTPStatus.OK
+                return status, result['rows'][0]
+
+        raise ApiError(HTTPStatus.NOT_FOUND, 'Неизвестный адрес')
+
+    async def dispatch(self, method, target, headers, raw_body):
+        """Ответ на запрос: (код, JSON), ошибки переводятся в коды HTTP"""
+        if self.token and not hmac.compare_digest(headers.get('authorization', ''), f'Bearer {self.token}'):
+            return HTTPStatus.UNAUTHORIZED, {'error': 'Требуется токен доступа'}
+
+        url = urlsplit(target)
+        try:
+            body = json.loads(raw_body.decode('utf-8')) if raw_body else {}
+            return await self.route(method, url.path, dict(parse_qsl(url.query)),
+                                    body, headers.get('x-mine-user'))
+        except ApiError as e:
+            return e.status, {'error': str(e)}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': f'Некорректный запрос: {e}'}
+        except sqlite3.IntegrityError as e:
+            return HTTPStatus.CONFLICT, {'error': str(e), 'type': 'IntegrityError',
+                                         'message': constraint_message(e)}
+        except sqlite3.OperationalError as e:
+            status = HTTPStatus.SERVICE_UNAVAILABLE if 'locked' in str(e) else HTTPStatus.BAD_REQUEST
+            return status, {'error': str(e), 'type': 'OperationalError'}
+        except sqlite3.Error as e:
+            if getattr(e, 'sqlite_errorcode', None) == sqlite3.SQLITE_AUTH:
+                return HTTPStatus.FORBIDDEN, {'error': 'Запрос запрещен: через сервер доступны только '
+                                                       'чтение и изменение строк', 'type': type(e).__name__}
+            return HTTPStatus.BAD_REQUEST, {'error': str(e), 'type': type(e).__name__}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'Слишком большой запрос'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(method.upper(), target, headers, body)
+                    keep_alive = (version == 'HTTP/1.1'
+                                  and headers.get('connection', '').lower() != 'close')
+
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+                writer.write(
+                    f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                    f'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+                    .encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Запуск и остановка
+
+    async def start(self):
+        # Состав столбцов нужен для проверки полей в запросах к сущностям
+        for entity in ENTITIES:
+            rows = await self.read(f"PRAGMA table_info({entity})")
+            self.columns[entity] = [row['name'] for row in rows]
+        conn = self.connections[0]
+        self.max_variables = (conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+                              if hasattr(conn, 'getlimit') else 999)
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.reader_pool.shutdown(wait=True)
+        self.write_queue.close()
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+def serve(host=None, port=None, server=None):
+    """Запуск сервера до прерывания (Ctrl+C)"""
+    server = server or ApiServer(host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()